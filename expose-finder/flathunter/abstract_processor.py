@@ -3,7 +3,10 @@
 
 class Processor:
     """Processor interface. Flathunter runs sequences of exposes through
-       a set of processors that stack on each other"""
+       a set of processors that stack on each other. Processors that are
+       'concurrent' may process several exposes at once on different threads"""
+
+    concurrent = False
 
     def process_expose(self, expose):
         """Mutate the expose. Should be implemented in the subclass"""
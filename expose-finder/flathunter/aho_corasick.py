@@ -0,0 +1,57 @@
+"""Aho-Corasick automaton, for finding many search terms in a text in one pass"""
+from collections import deque
+
+
+class AhoCorasick:
+    """Matches a fixed set of terms against texts. Building the automaton takes time
+       proportional to the total length of the terms, and a search takes time
+       proportional to the length of the text, however many terms there are"""
+
+    def __init__(self, terms):
+        self.terms = list(terms)
+        self.goto = [dict()]
+        self.fail = [0]
+        self.output = [[]]
+        for idx, term in enumerate(self.terms):
+            self._add(idx, term)
+        self._link()
+
+    def _add(self, idx, term):
+        state = 0
+        for char in term:
+            if char not in self.goto[state]:
+                self.goto.append(dict())
+                self.fail.append(0)
+                self.output.append([])
+                self.goto[state][char] = len(self.goto) - 1
+            state = self.goto[state][char]
+        self.output[state].append(idx)
+
+    def _link(self):
+        pending = deque(self.goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for char, target in self.goto[state].items():
+                pending.append(target)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[target] = self.goto[fallback].get(char, 0)
+                self.output[target] = self.output[target] + self.output[self.fail[target]]
+
+    def search(self, text):
+        """Yields the index of every term found in the text, once per occurrence"""
+        state = 0
+        for char in text:
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            yield from self.output[state]
+
+    def matches(self, text):
+        """The indexes of the terms that occur in the text"""
+        return set(self.search(text))
+
+    def contains_any(self, text):
+        """True if any of the terms occurs in the text"""
+        return next(self.search(text), None) is not None
@@ -1,19 +1,125 @@
 """Wrap configuration options as an object"""
-import argparse
 import logging
 import os
+from dataclasses import dataclass
+from typing import Optional, Tuple
 
 import yaml
 
 from flathunter.filter import Filter
 
 
+@dataclass(frozen=True)
+class Settings:
+    """Settings resolved once at startup. Values come from the config file, which
+       can be overridden by environment variables, which can be overridden by
+       command-line flags"""
+
+    urls: Tuple[str, ...]
+    database_location: str
+    id_store: str
+    redis_host: str
+    redis_port: int
+    loop_active: bool
+    loop_sleeping_time: int
+    loop_adaptive: bool
+    loop_min_interval: Optional[int]
+    loop_max_interval: Optional[int]
+    loop_jitter: float
+    use_proxy: bool
+    incremental: bool
+    response_cache: bool
+    captcha_enabled: bool
+    metrics_host: str
+    metrics_port: Optional[int]
+    stage_timing: bool
+    stage_profiling: bool
+    pipeline: bool
+    pipeline_workers: int
+    pipeline_queue_size: int
+    pipeline_preserve_order: bool
+    duplicates: bool
+    duplicate_size_tolerance: float
+    duplicate_price_tolerance: float
+    duplicate_max_age_days: int
+    retention: bool
+    retention_exposes_days: Optional[int]
+    retention_executions_days: Optional[int]
+    retention_processed_days: Optional[int]
+    retention_archive_dir: str
+    retention_vacuum_pages: int
+    retention_interval: int
+    verbose: bool
+
+    ENVIRONMENT_PREFIX = 'FLATHUNTER_'
+
+    @staticmethod
+    def resolve(config, overrides=None, environ=None):
+        """Merge the config file with environment variables and command-line flags"""
+        config = config or dict()
+        overrides = overrides or dict()
+        environ = os.environ if environ is None else environ
+
+        def pick(name, file_value, convert=str):
+            if overrides.get(name) is not None:
+                return convert(overrides[name])
+            if environ.get(Settings.ENVIRONMENT_PREFIX + name.upper()) is not None:
+                return convert(environ[Settings.ENVIRONMENT_PREFIX + name.upper()])
+            return file_value
+
+        redis_config = config.get('redis') or dict()
+        loop_config = config.get('loop') or dict()
+        metrics_config = config.get('metrics') or dict()
+        timing_config = config.get('stage_timing') or dict()
+        pipeline_config = config.get('pipeline') or dict()
+        duplicates_config = config.get('duplicates') or dict()
+        retention_config = config.get('retention') or dict()
+        database_location = pick('database_location', config.get(
+            'database_location', os.path.abspath(os.path.dirname(os.path.abspath(__file__)) + "/..")))
+        return Settings(
+            urls=tuple(config.get('urls') or list()),
+            database_location=database_location,
+            id_store=pick('id_store', config.get('id_store', 'sqlite')),
+            redis_host=pick('redis_host', redis_config.get('host', 'localhost')),
+            redis_port=pick('redis_port', int(redis_config.get('port', 6379)), int),
+            loop_active=bool(loop_config.get('active', False)),
+            loop_sleeping_time=int(loop_config.get('sleeping_time', 60 * 10)),
+            loop_adaptive=bool(loop_config.get('adaptive', False)),
+            loop_min_interval=loop_config.get('min_interval'),
+            loop_max_interval=loop_config.get('max_interval'),
+            loop_jitter=float(loop_config.get('jitter', 0.1)),
+            use_proxy=bool(config.get('use_proxy_list', False)),
+            incremental=bool(config.get('incremental', False)),
+            response_cache=bool(config.get('response_cache', False)),
+            captcha_enabled='captcha' in config,
+            metrics_host=pick('metrics_host', metrics_config.get('host', '127.0.0.1')),
+            metrics_port=pick('metrics_port', metrics_config.get('port'), int),
+            stage_timing=bool(timing_config.get('enable', False)),
+            stage_profiling=bool(timing_config.get('profile', False)),
+            pipeline=bool(pipeline_config.get('enable', False)),
+            pipeline_workers=int(pipeline_config.get('workers', 4)),
+            pipeline_queue_size=int(pipeline_config.get('queue_size', 16)),
+            pipeline_preserve_order=bool(pipeline_config.get('preserve_order', True)),
+            duplicates=bool(duplicates_config.get('enable', False)),
+            duplicate_size_tolerance=float(duplicates_config.get('size_tolerance', 2)),
+            duplicate_price_tolerance=float(duplicates_config.get('price_tolerance', 0.05)),
+            duplicate_max_age_days=int(duplicates_config.get('max_age_days', 30)),
+            retention=bool(retention_config),
+            retention_exposes_days=retention_config.get('exposes_days'),
+            retention_executions_days=retention_config.get('executions_days'),
+            retention_processed_days=retention_config.get('processed_days'),
+            retention_archive_dir=retention_config.get('archive_dir', '%s/archive' % database_location),
+            retention_vacuum_pages=int(retention_config.get('vacuum_pages', 1000)),
+            retention_interval=int(retention_config.get('interval', 24 * 60 * 60)),
+            verbose=bool(config.get('verbose', False)))
+
+
 class Config:
     """Class to represent flathunter configuration"""
 
     __log__ = logging.getLogger('flathunt')
 
-    def __init__(self, filename=None, string=None):
+    def __init__(self, filename=None, string=None, overrides=None, environ=None):
         if string is not None:
             self.config = yaml.safe_load(string)
         elif filename is not None:
@@ -22,6 +128,7 @@ class Config:
                 self.config = yaml.safe_load(file)
         else:
             raise ValueError("Either filename or string must be given")
+        self.settings = Settings.resolve(self.config, overrides, environ)
 
     def __iter__(self):
         """Emulate dictionary"""
@@ -36,13 +143,11 @@ class Config:
         return self.config.get(key, value)
 
     def urls(self):
-        return self.config["urls"] or list()
+        return list(self.settings.urls)
 
     def database_location(self):
         """Return the location of the database folder"""
-        if "database_location" in self.config:
-            return self.config["database_location"]
-        return os.path.abspath(os.path.dirname(os.path.abspath(__file__)) + "/..")
+        return self.settings.database_location
 
     def get_filter(self):
         """Read the configured filter"""
@@ -51,20 +156,13 @@ class Config:
         return builder.build()
 
     def captcha_enabled(self):
-        return ("captcha" in self.config)
+        return self.settings.captcha_enabled
 
     def use_proxy(self):
-        return ("use_proxy_list" in self.config and self.config["use_proxy_list"])
+        return self.settings.use_proxy
 
     def redis_host(self):
-        return command_line_arg("redis_host") or self.config["redis"]["host"]
+        return self.settings.redis_host
 
     def redis_port(self):
-        return command_line_arg("redis_port") or self.config["redis"]["port"]
-
-
-def command_line_arg(argument):
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--" + argument)
-    print(parser.parse_known_args()[0])
-    return getattr(parser.parse_known_args()[0], argument)
+        return self.settings.redis_port
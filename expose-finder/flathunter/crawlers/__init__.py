@@ -0,0 +1,41 @@
+"""Registry of the available crawlers. Crawler modules pull in heavy dependencies,
+   so they are only imported for portals that appear in the configured URLs"""
+import importlib
+import re
+
+
+class RateLimited(Exception):
+    """Raised when a portal answers that we are sending too many requests"""
+
+
+class CaptchaPending(Exception):
+    """Raised when a page is held up by a captcha that the solving service is still
+       working on. 'solution' is the future of the solve; once it is done, loading the
+       page again gets past the captcha"""
+
+    def __init__(self, url, solution):
+        super().__init__(url)
+        self.url = url
+        self.solution = solution
+
+
+CRAWLERS = [
+    (re.compile(r'https://www\.immobilienscout24\.de'),
+     'flathunter.crawlers.crawl_immobilienscout', 'CrawlImmobilienscout'),
+    (re.compile(r'https://www\.wg-gesucht\.de'),
+     'flathunter.crawlers.crawl_wggesucht', 'CrawlWgGesucht'),
+    (re.compile(r'https://www\.ebay-kleinanzeigen\.de'),
+     'flathunter.crawlers.crawl_ebaykleinanzeigen', 'CrawlEbayKleinanzeigen'),
+    (re.compile(r'https://www\.immowelt\.de'),
+     'flathunter.crawlers.crawl_immowelt', 'CrawlImmowelt'),
+]
+
+
+def load_crawlers(config):
+    """Import and instantiate the crawlers needed for the configured URLs"""
+    searchers = []
+    for url_pattern, module_name, class_name in CRAWLERS:
+        if any(re.search(url_pattern, url) for url in config.settings.urls):
+            crawler_class = getattr(importlib.import_module(module_name), class_name)
+            searchers.append(crawler_class(config))
+    return searchers
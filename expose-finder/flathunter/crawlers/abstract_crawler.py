@@ -1,13 +1,15 @@
 """Interface for webcrawlers. Crawler implementations should subclass this"""
 import logging
 import re
+import time
 
 import requests
 from bs4 import BeautifulSoup
 
-from flathunter import proxies
-from flathunter.crawlers.captcha.captchasolvers import get_captcha_solver
+from flathunter import metrics, proxies
+from flathunter.crawlers import RateLimited
 from flathunter.crawlers.headers import Headers
+from flathunter.crawlers.response_cache import PageUnchanged, ResponseCache
 
 
 class Crawler:
@@ -15,9 +17,12 @@ class Crawler:
 
     __log__ = logging.getLogger('flathunt')
     URL_PATTERN = None
+    response_cache = None
 
     def __init__(self, config):
         self.config = config
+        if config.settings.response_cache:
+            self.response_cache = ResponseCache()
 
     headers = Headers()
 
@@ -30,18 +35,37 @@ class Crawler:
         """Creates a Soup object from the HTML at the provided URL"""
 
         self.headers.rotate_user_agent()
-        resp = requests.get(url, headers=self.headers.headers)
+        resp = self._fetch(url)
         if resp.status_code != 200:
             self.__log__.error("Got response (%i): %s", resp.status_code, resp.content)
-        if self.config.use_proxy():
+        if self.config.settings.use_proxy:
             return self._get_soup_with_proxy(url)
         if driver is not None:
+            # Selenium is only imported when a web driver is actually in use
+            # pylint: disable=import-outside-toplevel
+            from flathunter.crawlers.captcha.captcha_service import get_captcha_service
+            start = time.perf_counter()
             driver.get(url)
-            if re.search("g-recaptcha", driver.page_source):
-                get_captcha_solver(driver, checkbox).resolve_captcha(afterlogin_string, captcha_api_key)
+            metrics.record_fetch(self, time.perf_counter() - start, len(driver.page_source))
+            get_captcha_service(captcha_api_key, checkbox, afterlogin_string).ensure_solved(driver)
             return BeautifulSoup(driver.page_source, 'html.parser')
         return BeautifulSoup(resp.content, 'html.parser')
 
+    def _fetch(self, url, session=requests):
+        """GETs the URL. Raises PageUnchanged if it is a search page that has not
+           changed since the last crawl, and RateLimited if the portal refuses to answer"""
+        headers = self.headers.headers
+        if self.response_cache is not None:
+            headers = dict(headers, **self.response_cache.request_headers(url))
+        start = time.perf_counter()
+        resp = session.get(url, headers=headers)
+        metrics.record_fetch(self, time.perf_counter() - start, len(resp.content))
+        if resp.status_code == 429:
+            raise RateLimited(url)
+        if self.response_cache is not None and self.response_cache.is_unchanged(url, resp):
+            raise PageUnchanged(url)
+        return resp
+
     def _get_soup_with_proxy(self, url):
         """Will try proxies until it's possible to crawl and return a soup"""
         resolved = False
@@ -90,19 +114,27 @@ class Crawler:
         soup = self.get_page(search_url)
 
         # get data from first page
-        entries = self.extract_data(soup)
+        with metrics.PARSE_SECONDS.time(crawler=metrics.crawler_name(self)):
+            entries = self.extract_data(soup)
         self.__log__.debug('Number of found entries: %d', len(entries))
 
         return entries
 
-    def crawl(self, url, max_pages=None):
-        """Load as many exposes as possible from the provided URL"""
+    # pylint: disable=unused-argument
+    def crawl(self, url, max_pages=None, id_watch=None):
+        """Load as many exposes as possible from the provided URL. Crawlers that paginate
+           can use the id_watch to stop once the exposes are ones that have been seen before"""
         if re.search(self.URL_PATTERN, url):
+            if self.response_cache is not None:
+                self.response_cache.track(url)
             try:
                 return self._get_results(url, max_pages)
             except requests.exceptions.ConnectionError:
                 self.__log__.warning("Connection to %s failed. Retrying.", url.split('/')[2])
                 return []
+            except PageUnchanged:
+                self.__log__.debug("Search results at %s have not changed", url)
+                return []
         return []
 
     def get_expose_details(self, expose):
@@ -0,0 +1,97 @@
+"""Captcha handling shared by all web driver sessions"""
+import functools
+import logging
+import threading
+import time
+from urllib.parse import urlparse
+
+from flathunter.crawlers import CaptchaPending
+from flathunter.crawlers.captcha.captchasolver import has_captcha
+from flathunter.crawlers.captcha.captchasolvers import get_captcha_solver
+from flathunter.crawlers.captcha.twocaptcha import TwoCaptchaApi
+
+
+class SolvedSessions:
+    """Cookies of browser sessions that got past a captcha, by host. They are handed
+       on to other browser sessions for the same host until they expire, so that a
+       captcha is solved once rather than once per browser"""
+    __log__ = logging.getLogger('flathunt')
+
+    MAX_AGE = 30 * 60
+
+    def __init__(self, max_age=MAX_AGE, clock=time.time):
+        self.max_age = max_age
+        self.clock = clock
+        self.sessions = dict()
+        self.lock = threading.Lock()
+
+    def store(self, driver):
+        """Remember the cookies of the driver's session"""
+        host = urlparse(driver.current_url).hostname
+        with self.lock:
+            self.sessions[host] = (self.clock() + self.max_age, driver.get_cookies())
+
+    def restore(self, driver):
+        """Copy the cookies of a solved session into the driver. Returns true if there
+           was a session for the host that has not expired yet"""
+        host = urlparse(driver.current_url).hostname
+        now = self.clock()
+        with self.lock:
+            expires, cookies = self.sessions.get(host, (0, []))
+            cookies = [cookie for cookie in cookies if cookie.get('expiry', now + 1) > now]
+            if expires <= now or not cookies:
+                self.sessions.pop(host, None)
+                return False
+        for cookie in cookies:
+            driver.add_cookie(cookie)
+        return True
+
+
+class CaptchaService:
+    """Gets web driver sessions past captchas. Pages without a captcha are recognized
+       from their source straight away; otherwise a solved session is reused if there
+       is one, and only then is the captcha solved. A reCAPTCHA is solved in the
+       background: CaptchaPending is raised until the solution is in, so that the
+       crawler can move on to other pages and load this one again later"""
+    __log__ = logging.getLogger('flathunt')
+
+    def __init__(self, api_key, checkbox=False, afterlogin_string="", api=None, sessions=None):
+        self.api_key = api_key
+        self.checkbox = checkbox
+        self.afterlogin_string = afterlogin_string
+        self.api = api if api is not None else TwoCaptchaApi(api_key)
+        self.sessions = sessions if sessions is not None else SolvedSessions()
+        # Futures of the solutions being worked on, by page URL
+        self.pending = dict()
+        self.lock = threading.Lock()
+
+    def ensure_solved(self, driver):
+        """Make sure that the page loaded in the driver is not held up by a captcha"""
+        if not has_captcha(driver.page_source):
+            return
+        if self.sessions.restore(driver):
+            driver.refresh()
+            if not has_captcha(driver.page_source):
+                self.__log__.debug("Reused solved session for %s", driver.current_url)
+                return
+        solver = get_captcha_solver(driver, self.checkbox, self.api)
+        if self.checkbox or self.afterlogin_string != "":
+            # These are solved in the browser rather than by the solving service
+            solver.resolve_captcha(self.afterlogin_string, self.api_key)
+        else:
+            url = driver.current_url
+            with self.lock:
+                solution = self.pending.get(url)
+                if solution is None:
+                    solution = self.pending[url] = solver.request_solution(self.api_key)
+                if not solution.done():
+                    raise CaptchaPending(url, solution)
+                del self.pending[url]
+            solver.submit_solution(solution.result())
+        self.sessions.store(driver)
+
+
+@functools.lru_cache(maxsize=None)
+def get_captcha_service(api_key, checkbox, afterlogin_string):
+    """The captcha service for the given settings, shared by all crawlers"""
+    return CaptchaService(api_key, checkbox, afterlogin_string)
@@ -1,21 +1,30 @@
 """Interface for webcrawlers. Crawler implementations should subclass this"""
 import logging
-from time import sleep as sleep
+import re
 
-import requests
 import selenium
 from selenium import webdriver
-from selenium.common.exceptions import NoSuchElementException
+from selenium.common.exceptions import NoSuchElementException, TimeoutException
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.wait import WebDriverWait
 
+from flathunter.crawlers.captcha.twocaptcha import TwoCaptchaApi
+
+CAPTCHA_PATTERN = re.compile(r"g-recaptcha|recaptcha/api2/anchor")
+
+
+def has_captcha(page_source):
+    """Tells from the page source whether the page asks for a captcha"""
+    return CAPTCHA_PATTERN.search(page_source or "") is not None
+
 
 class CaptchaSolver:
     __log__ = logging.getLogger('flathunt')
 
-    def __init__(self, driver: selenium.webdriver.Chrome):
+    def __init__(self, driver: selenium.webdriver.Chrome, api=None):
         self.driver = driver
+        self.api = api
 
     def resolve_captcha(self, afterlogin_string, api_key):
         iframe_present = self._check_if_iframe_visible()
@@ -33,11 +42,14 @@ class CaptchaSolver:
             print("Element not found")
 
     def _check_if_iframe_visible(self):
+        # Pages without captcha markup can not grow a captcha iframe, no need to wait for one
+        if not has_captcha(self.driver.page_source):
+            return None
         try:
             iframe = WebDriverWait(self.driver, 10).until(EC.visibility_of_element_located(
                 (By.CSS_SELECTOR, "iframe[src^='https://www.google.com/recaptcha/api2/anchor?']")))
             return iframe
-        except NoSuchElementException:
+        except (NoSuchElementException, TimeoutException):
             print("No iframe found, therefore no chaptcha verification necessary")
 
     def _wait_for_captcha_resolution(self, afterlogin_string=""):
@@ -48,25 +60,23 @@ class CaptchaSolver:
         except selenium.common.exceptions.TimeoutException:
             print("Selenium.Timeoutexception")
 
-    def _solve(self, api_key):
+    def request_solution(self, api_key):
+        """Hand the captcha on the page to the solving service. Returns a future of the
+           solution, which is passed to submit_solution() once it is done"""
         google_site_key = self.driver.find_element_by_class_name("g-recaptcha").get_attribute("data-sitekey")
         self.__log__.debug("Google site key: %s", google_site_key)
-        url = self.driver.current_url
-        session = requests.Session()
-        postrequest = (
-            f"http://2captcha.com/in.php?key={api_key}&method=userrecaptcha&googlekey={google_site_key}&pageurl={url}"
-        )
-        captcha_id = session.post(postrequest).text.split("|")[1]
-        recaptcha_answer = session.get(f"http://2captcha.com/res.php?key={api_key}&action=get&id={captcha_id}").text
-        while "CAPCHA_NOT_READY" in recaptcha_answer:
-            sleep(5)
-            self.__log__.debug("Captcha status: %s", recaptcha_answer)
-            recaptcha_answer = session.get(f"http://2captcha.com/res.php?key={api_key}&action=get&id={captcha_id}").text
+        api = self.api if self.api is not None else TwoCaptchaApi(api_key)
+        return api.solve_async(google_site_key, self.driver.current_url)
+
+    def submit_solution(self, recaptcha_answer):
+        """Enter the solution of the captcha into the page"""
         self.__log__.debug("Captcha promise: %s", recaptcha_answer)
-        recaptcha_answer = recaptcha_answer.split("|")[1]
         self.driver.execute_script(f'document.getElementById("g-recaptcha-response").innerHTML="{recaptcha_answer}";')
         # TODO: Below function call can be different depending on the websites implementation. It is responsible for
         #  sending the the promise that we get from recaptcha_answer. For now, if it breaks, it is required to
         #  reverse engineer it by hand. Not sure if there is a way to automate it.
         self.driver.execute_script(f'solvedCaptcha("{recaptcha_answer}")')
         self._check_if_iframe_not_visible()
+
+    def _solve(self, api_key):
+        self.submit_solution(self.request_solution(api_key).result())
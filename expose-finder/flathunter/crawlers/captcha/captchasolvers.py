@@ -7,8 +7,8 @@ from flathunter.crawlers.captcha.captchasolver import CaptchaSolver
 from flathunter.crawlers.captcha.checkboxcaptchasolver import CheckboxCaptchaSolver
 
 
-def get_captcha_solver(driver: selenium.webdriver.Chrome, checkbox: bool):
+def get_captcha_solver(driver: selenium.webdriver.Chrome, checkbox: bool, api=None):
     if checkbox:
         return CheckboxCaptchaSolver(driver)
     else:
-        return CaptchaSolver(driver)
+        return CaptchaSolver(driver, api)
@@ -0,0 +1,73 @@
+"""Client for the 2captcha solving service"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+class CaptchaError(Exception):
+    """Raised when the solving service rejects a captcha"""
+
+
+class CaptchaTimeout(CaptchaError):
+    """Raised when a captcha was not solved before the deadline"""
+
+
+class TwoCaptchaApi:
+    """Submits reCAPTCHAs to 2captcha and polls for their solution. All requests go
+       through one HTTP session, and polling gives up once 'timeout' seconds have
+       passed, rather than waiting for the service indefinitely. solve_async() polls
+       on a background thread, so that the caller can crawl other pages meanwhile"""
+    __log__ = logging.getLogger('flathunt')
+
+    BASE_URL = 'http://2captcha.com'
+    INITIAL_DELAY = 15
+    POLL_INTERVAL = 5
+    TIMEOUT = 180
+    NOT_READY = 'CAPCHA_NOT_READY'
+
+    def __init__(self, api_key, base_url=BASE_URL, initial_delay=INITIAL_DELAY,
+                 poll_interval=POLL_INTERVAL, timeout=TIMEOUT):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.initial_delay = initial_delay
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='captcha')
+
+    def solve_async(self, site_key, page_url):
+        """Start solving the captcha. Returns a future of the solution token"""
+        return self.executor.submit(self.solve, site_key, page_url)
+
+    def solve(self, site_key, page_url):
+        """Solve the captcha, and return the solution token. Blocks until the captcha
+           is solved or the deadline has passed"""
+        deadline = time.monotonic() + self.timeout
+        captcha_id = self._submit(site_key, page_url)
+        self._sleep_until(min(time.monotonic() + self.initial_delay, deadline))
+        while True:
+            answer = self.session.get(self.base_url + '/res.php', params={
+                'key': self.api_key, 'action': 'get', 'id': captcha_id}).text
+            self.__log__.debug("Captcha status: %s", answer)
+            if answer.startswith('OK|'):
+                return answer.split('|', 1)[1]
+            if answer != self.NOT_READY:
+                raise CaptchaError("Captcha %s was not solved: %s" % (captcha_id, answer))
+            if time.monotonic() + self.poll_interval > deadline:
+                raise CaptchaTimeout("Captcha %s was not solved within %d seconds" % (captcha_id, self.timeout))
+            time.sleep(self.poll_interval)
+
+    def _submit(self, site_key, page_url):
+        answer = self.session.post(self.base_url + '/in.php', params={
+            'key': self.api_key, 'method': 'userrecaptcha', 'googlekey': site_key, 'pageurl': page_url}).text
+        if not answer.startswith('OK|'):
+            raise CaptchaError("Captcha was not accepted: %s" % answer)
+        return answer.split('|', 1)[1]
+
+    @staticmethod
+    def _sleep_until(moment):
+        remaining = moment - time.monotonic()
+        if remaining > 0:
+            time.sleep(remaining)
@@ -29,7 +29,7 @@ class CrawlEbayKleinanzeigen(Crawler):
 
     def __init__(self, config):
         logging.getLogger("requests").setLevel(logging.WARNING)
-        self.config = config
+        super().__init__(config)
 
     def get_page(self, url):
         """Applies a page number to a formatted search URL and fetches the exposes at that page"""
@@ -1,20 +1,36 @@
 """Expose crawler for ImmobilienScout"""
 import datetime
+import functools
 import logging
+import math
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import requests
 from bs4 import BeautifulSoup
-from jsonpath_ng import parse
-from selenium import webdriver
-from selenium.common.exceptions import JavascriptException
-from selenium.webdriver.chrome.options import Options
 
-from flathunter.crawlers.captcha.captchasolvers import get_captcha_solver
+from flathunter import metrics
+from flathunter.crawlers import RateLimited
+from flathunter.crawlers.driver_pool import DriverPool
 from flathunter.crawlers.headers import Headers
+from flathunter.crawlers.incremental import IncrementalCrawl
+
+# Selenium and jsonpath are slow to import, and only needed when the crawler is
+# configured with a web driver, so they are imported on first use.
+# pylint: disable=import-outside-toplevel
+
+
+@functools.lru_cache(maxsize=None)
+def _jsonpath(expression):
+    """Compiles a JSON path expression, once per process"""
+    from jsonpath_ng import parse
+    return parse(expression)
 
 
 def _configure_driver(driver_path, driver_arguments):
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
     chrome_options = Options()
     if driver_arguments is not None:
         for driver_argument in driver_arguments:
@@ -27,16 +43,24 @@ class CrawlImmobilienscout:
     __log__ = logging.getLogger('flathunt')
     URL_PATTERN = re.compile(r'https://www\.immobilienscout24\.de')
     RESULT_LIMIT = 50
+    MAX_WORKERS = 4
+
+    REAL_ESTATE_PATH = "$..['resultlist.realEstate']"
+    PAGING_PATH = "$..paging"
+    IMAGE_PATH = "$..galleryAttachments..['@xlink.href']"
 
     headers = Headers()
 
     def __init__(self, config):
         logging.getLogger("requests").setLevel(logging.WARNING)
         self.config = config
-        self.driver = None
+        self.driver_pool = None
         self.captcha_api_key = None
         self.checkbox = None
         self.afterlogin_string = None
+        is24_config = config.get('immobilienscout') or dict()
+        self.result_limit = is24_config.get('result_limit', self.RESULT_LIMIT)
+        self.max_workers = is24_config.get('max_workers', self.MAX_WORKERS)
         if config.captcha_enabled():
             captcha_config = config.get('captcha')
             self.captcha_api_key = captcha_config.get('api_key', '')
@@ -51,73 +75,178 @@ class CrawlImmobilienscout:
             else:
                 self.afterlogin_string = captcha_config.get('afterlogin_string', '')
             if self.captcha_api_key is not None or self.driver_executable_path is not None:
-                self.driver = _configure_driver(self.driver_executable_path, self.driver_arguments)
+                self.driver_pool = DriverPool(
+                    lambda: _configure_driver(self.driver_executable_path, self.driver_arguments),
+                    size=captcha_config.get('driver_pool_size', 1),
+                    max_pages=captcha_config.get('driver_max_pages', 50),
+                    max_memory=captcha_config.get('driver_max_memory'))
 
-    def _get_results(self, search_url, max_pages=None):
-        """Loads the exposes from the ImmoScout site, starting at the provided URL"""
+    def _get_results(self, search_url, max_pages=None, id_watch=None):
+        """Loads the exposes from the ImmoScout site, starting at the provided URL. Once the
+           first page tells the number of results, the remaining pages are fetched
+           concurrently, and their exposes are yielded as soon as each page is parsed.
+           If an id_watch is given, pages are instead fetched one by one until a page
+           holds no new exposes"""
         # convert to paged URL
         # if '/P-' in search_url:
         #     search_url = re.sub(r"/Suche/(.+?)/P-\d+", "/Suche/\1/P-{0}", search_url)
         # else:
         #     search_url = re.sub(r"/Suche/(.+?)/", r"/Suche/\1/P-{0}/", search_url)
         if '&pagenumber' in search_url:
-            search_url = re.sub(r"&pagenumber=[0-9]", "&pagenumber={0}", search_url)
+            search_url = re.sub(r"&pagenumber=[0-9]+", "&pagenumber={0}", search_url)
         else:
             search_url = search_url + '&pagenumber={0}'
         self.__log__.debug("Got search URL %s", search_url)
 
-        # load first page to get number of entries
+        # If we are using Selenium, just parse the results from the JSON in the page response
+        if self.driver_pool is not None:
+            result_json = self.get_page_json(search_url, 1)
+            entries = self._parse(self.get_entries_from_json, result_json)
+            no_of_results = self.get_result_count_from_json(result_json)
+
+            def get_page_entries(page_no):
+                return self._parse(self.get_entries_from_json, self.get_page_json(search_url, page_no))
+        else:
+            soup = self.get_page(search_url, None, 1)
+            entries = self._parse(self.extract_data, soup)
+            no_of_results = self.get_result_count(soup)
+
+            def get_page_entries(page_no):
+                return self.get_page_entries(search_url, page_no)
+
+        # Without a result count, the first page is still used, and no further pages
+        # are requested
+        no_of_results = min(max(no_of_results, len(entries)), self.result_limit)
+        entries = entries[:no_of_results]
+        if id_watch is not None:
+            yield from self._get_results_incrementally(entries, no_of_results, max_pages, get_page_entries,
+                                                       IncrementalCrawl(id_watch, search_url))
+            return
+        yield from entries
+        if not entries:
+            return
+
+        # the number of results is known now, so all remaining pages can be requested at once
+        last_page = math.ceil(no_of_results / len(entries))
+        if max_pages is not None:
+            last_page = min(last_page, max_pages)
+        seen_ids = set(entry['id'] for entry in entries)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pages = {executor.submit(get_page_entries, page_no): page_no
+                     for page_no in range(2, last_page + 1)}
+            try:
+                for page in as_completed(pages):
+                    if page.cancelled():
+                        continue
+                    page_entries = page.result()
+                    if not page_entries:
+                        self.__log__.debug('Page %d is empty, not fetching later pages', pages[page])
+                        for later_page, page_no in pages.items():
+                            if page_no > pages[page]:
+                                later_page.cancel()
+                        continue
+                    page_entries = [entry for entry in page_entries if entry['id'] not in seen_ids]
+                    page_entries = page_entries[:no_of_results - len(seen_ids)]
+                    seen_ids.update(entry['id'] for entry in page_entries)
+                    yield from page_entries
+                    if len(seen_ids) >= no_of_results:
+                        break
+            finally:
+                # don't wait for pages nobody is going to look at
+                for page in pages:
+                    page.cancel()
+
+    def _get_results_incrementally(self, entries, no_of_results, max_pages, get_page_entries, incremental):
+        """Yields the exposes of one page after the other, starting with the entries of the
+           first page, until a page holds no new exposes"""
         page_no = 1
-        soup = self.get_page(search_url, self.driver, page_no)
+        seen_ids = set()
+        while entries:
+            last_page = incremental.is_last_page(entries)
+            entries = [entry for entry in entries if entry['id'] not in seen_ids]
+            entries = entries[:no_of_results - len(seen_ids)]
+            seen_ids.update(entry['id'] for entry in entries)
+            yield from entries
+            if last_page or len(seen_ids) >= no_of_results or \
+                    (max_pages is not None and page_no >= max_pages):
+                break
+            page_no += 1
+            entries = get_page_entries(page_no)
+        self.__log__.debug('Stopped incremental crawl after page %d', page_no)
+        incremental.finish()
 
-        # If we are using Selenium, just parse the results from the JSON in the page response
-        if self.driver is not None:
-            return self.get_entries_from_javascript()
+    def get_page_entries(self, search_url, page_no):
+        """Fetches a page of search results and extracts its exposes"""
+        self.__log__.debug('Fetching page %d', page_no)
+        return self._parse(self.extract_data, self.get_page(search_url, None, page_no))
 
+    def _parse(self, extract, page):
+        """Extracts the exposes from a page, recording how long it takes"""
+        with metrics.PARSE_SECONDS.time(crawler=metrics.crawler_name(self)):
+            return extract(page)
+
+    def get_result_count(self, soup):
+        """Reads the total number of results from a page of search results"""
         try:
-            no_of_results = int(
+            return int(
                 soup.find_all(lambda e: e.has_attr('data-is24-qa') and \
                                         e['data-is24-qa'] == 'resultlist-resultCount')[0] \
                     .text.replace('.', ''))
         except IndexError:
             self.__log__.debug('Index Error occurred')
-            no_of_results = 0
-
-        # get data from first page
-        entries = self.extract_data(soup)
+            return 0
 
-        # iterate over all remaining pages
-        while len(entries) < min(no_of_results, self.RESULT_LIMIT) and \
-                (max_pages is None or page_no < max_pages):
-            self.__log__.debug(
-                'Next Page, Number of entries : %d, no of results: %d',
-                len(entries), no_of_results)
-            page_no += 1
-            soup = self.get_page(search_url, self.driver, page_no)
-            cur_entry = self.extract_data(soup)
-            if cur_entry is list():
-                break
-            entries.extend(cur_entry)
-        return entries
+    def get_page_json(self, search_url, page_no):
+        """Loads a page of search results in a web driver and returns the result list
+           embedded in it, without parsing the page's HTML"""
+        self.__log__.debug('Fetching page %d', page_no)
+        with self.driver_pool.driver() as driver:
+            self._load_in_driver(search_url.format(page_no), driver, self.captcha_api_key,
+                                 self.checkbox, self.afterlogin_string)
+            return self.get_json_from_javascript(driver)
 
-    def get_entries_from_javascript(self):
+    def get_json_from_javascript(self, driver):
+        """Returns the IS24 result list from the page loaded in the driver"""
+        from selenium.common.exceptions import JavascriptException
         try:
-            result_json = self.driver.execute_script('return window.IS24.resultList;')
+            return driver.execute_script('return window.IS24.resultList;')
         except JavascriptException:
-            self.__log__.warn("Unable to find IS24 variable in window")
-            return []
-        return self.get_entries_from_json(result_json)
+            self.__log__.warning("Unable to find IS24 variable in window")
+            return None
+
+    def get_entries_from_javascript(self, driver):
+        return self.get_entries_from_json(self.get_json_from_javascript(driver))
+
+    @staticmethod
+    def _get_result_list(json):
+        """The part of the IS24 JSON that holds the results, or the whole JSON if it has an
+           unexpected structure. Narrows down the tree that the JSON paths have to search"""
+        try:
+            return json['resultListModel']['searchResponseModel']['resultlist.resultlist']
+        except (KeyError, TypeError):
+            return json
 
     def get_entries_from_json(self, json):
-        jsonpath_expr = parse("$..['resultlist.realEstate']")
-        return [self.extract_entry_from_javascript(entry.value) for entry in jsonpath_expr.find(json)]
+        if json is None:
+            return []
+        return [self.extract_entry_from_javascript(entry.value)
+                for entry in _jsonpath(self.REAL_ESTATE_PATH).find(self._get_result_list(json))]
+
+    def get_result_count_from_json(self, json):
+        """Reads the total number of results from the paging information in the IS24 JSON"""
+        if json is None:
+            return 0
+        paging = [match.value for match in _jsonpath(self.PAGING_PATH).find(self._get_result_list(json))]
+        try:
+            return int(paging[0]['numberOfHits'])
+        except (IndexError, KeyError, TypeError, ValueError):
+            return 0
 
     def extract_entry_from_javascript(self, entry):
-        image_path = parse("$..galleryAttachments..['@xlink.href']")
         return {
             'id': int(entry["@id"]),
             'url': ("https://www.immobilienscout24.de/expose/" + str(entry["@id"])),
-            'image': next(iter([galleryImage.value for galleryImage in image_path.find(entry)]),
+            'image': next(iter([galleryImage.value for galleryImage in _jsonpath(self.IMAGE_PATH).find(entry)]),
                           "https://www.static-immobilienscout24.de/statpic/placeholder_house/496c95154de31a357afa978cdb7f15f0_placeholder_medium.png"),
             'title': entry["title"],
             'address': entry["address"]["description"]["text"],
@@ -134,7 +263,7 @@ class CrawlImmobilienscout:
 
     def get_expose_details(self, expose):
         """Loads additional details for an expose by processing the expose detail URL"""
-        soup = self._get_soup_from_url(expose['url'])
+        soup = self._get_soup(expose['url'])
         date = soup.find('dd', {"class": "is24qa-bezugsfrei-ab"})
         expose['from'] = datetime.datetime.now().strftime("%2d.%2m.%Y")
         if date is not None:
@@ -216,20 +345,42 @@ class CrawlImmobilienscout:
         self.__log__.debug('extracted: %d', len(entries))
         return entries
 
+    def _get_soup(self, url):
+        """Fetches the URL, through a web driver from the pool if one is configured"""
+        if self.driver_pool is None:
+            return self._get_soup_from_url(url)
+        with self.driver_pool.driver() as driver:
+            return self._get_soup_from_url(url, driver=driver, captcha_api_key=self.captcha_api_key,
+                                           checkbox=self.checkbox, afterlogin_string=self.afterlogin_string)
+
     def _get_soup_from_url(self, url, driver=None, captcha_api_key=None, checkbox=None, afterlogin_string=None):
         """Creates a Soup object from the HTML at the provided URL"""
+        if driver is None:
+            self.headers.rotate_user_agent()
+            start = time.perf_counter()
+            resp = requests.get(url, headers=self.headers.headers)
+            metrics.record_fetch(self, time.perf_counter() - start, len(resp.content))
+            if resp.status_code == 429:
+                raise RateLimited(url)
+            if resp.status_code != 200:
+                self.__log__.error("Got response (%i): %s", resp.status_code, resp.content)
+            return BeautifulSoup(resp.content, 'html.parser')
+        self._load_in_driver(url, driver, captcha_api_key, checkbox, afterlogin_string)
+        return BeautifulSoup(driver.page_source, 'html.parser')
 
+    def _load_in_driver(self, url, driver, captcha_api_key=None, checkbox=None, afterlogin_string=None):
+        """Loads the URL in the web driver, solving a captcha if one is shown"""
+        from flathunter.crawlers.captcha.captcha_service import get_captcha_service
+        start = time.perf_counter()
         driver.get(url)
-        if re.search("g-recaptcha", driver.page_source):
-            get_captcha_solver(driver, checkbox).resolve_captcha(afterlogin_string, captcha_api_key)
-        return BeautifulSoup(driver.page_source, 'html.parser')
+        metrics.record_fetch(self, time.perf_counter() - start, len(driver.page_source))
+        get_captcha_service(captcha_api_key, checkbox, afterlogin_string).ensure_solved(driver)
 
-    def crawl(self, url, max_pages=None):
-        """Load as many exposes as possible from the provided URL"""
+    def crawl(self, url, max_pages=None, id_watch=None):
+        """Load as many exposes as possible from the provided URL. With an id_watch, stop
+           once the exposes are ones that have been seen before"""
         if re.search(self.URL_PATTERN, url):
             try:
-                return self._get_results(url, max_pages)
+                yield from self._get_results(url, max_pages, id_watch)
             except requests.exceptions.ConnectionError:
                 self.__log__.warning("Connection to %s failed. Retrying.", url.split('/')[2])
-                return []
-        return []
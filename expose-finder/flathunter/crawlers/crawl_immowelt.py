@@ -14,7 +14,7 @@ class CrawlImmowelt(Crawler):
 
     def __init__(self, config):
         logging.getLogger("requests").setLevel(logging.WARNING)
-        self.config = config
+        super().__init__(config)
 
     def get_expose_details(self, expose):
         """Loads additional details for an expose by processing the expose detail URL"""
@@ -1,12 +1,13 @@
 """Expose crawler for WgGesucht"""
 import logging
 import re
+import time
 
 import requests
 from bs4 import BeautifulSoup
 
+from flathunter import metrics
 from flathunter.crawlers.abstract_crawler import Crawler
-from flathunter.crawlers.captcha.captchasolvers import get_captcha_solver
 from flathunter.string_utils import remove_prefix
 
 
@@ -18,7 +19,7 @@ class CrawlWgGesucht(Crawler):
 
     def __init__(self, config):
         logging.getLogger("requests").setLevel(logging.WARNING)
-        self.config = config
+        super().__init__(config)
 
     # pylint: disable=too-many-locals
     def extract_data(self, soup):
@@ -98,15 +99,18 @@ class CrawlWgGesucht(Crawler):
         # First page load to set filters; response is discarded
         sess.get(url, headers=self.headers.headers)
         # Second page load
-        resp = sess.get(url, headers=self.headers.headers)
+        resp = self._fetch(url, sess)
 
         if resp.status_code != 200:
             self.__log__.error("Got response (%i): %s", resp.status_code, resp.content)
-        if self.config.use_proxy():
+        if self.config.settings.use_proxy:
             return self._get_soup_with_proxy(url)
         if driver is not None:
+            # pylint: disable=import-outside-toplevel
+            from flathunter.crawlers.captcha.captcha_service import get_captcha_service
+            start = time.perf_counter()
             driver.get(url)
-            if re.search("g-recaptcha", driver.page_source):
-                get_captcha_solver(driver, checkbox).resolve_captcha(afterlogin_string, captcha_api_key)
+            metrics.record_fetch(self, time.perf_counter() - start, len(driver.page_source))
+            get_captcha_service(captcha_api_key, checkbox, afterlogin_string).ensure_solved(driver)
             return BeautifulSoup(driver.page_source, 'html.parser')
         return BeautifulSoup(resp.content, 'html.parser')
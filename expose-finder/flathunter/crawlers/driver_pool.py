@@ -0,0 +1,104 @@
+"""Pool of reusable web driver sessions"""
+import atexit
+import logging
+import queue
+import threading
+from contextlib import contextmanager
+
+
+class DriverPool:
+    """Bounded pool of web driver sessions. Starting a browser is slow, so sessions
+       are kept warm between pages. A session that fails a health check, has served
+       'max_pages' pages or grew beyond 'max_memory' megabytes of JavaScript heap is
+       shut down and replaced on the next checkout"""
+    __log__ = logging.getLogger('flathunt')
+
+    def __init__(self, factory, size=1, max_pages=50, max_memory=None):
+        self.factory = factory
+        self.max_pages = max_pages
+        self.max_memory = max_memory
+        self.available = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(size)
+        self.pages = dict()
+        self.lock = threading.Lock()
+        atexit.register(self.close)
+
+    @contextmanager
+    def driver(self):
+        """Check out a driver for the duration of the 'with' block. Blocks while all
+           drivers of the pool are in use"""
+        with self.slots:
+            driver = self._checkout()
+            healthy = False
+            try:
+                yield driver
+                healthy = True
+            finally:
+                self._checkin(driver, healthy)
+
+    def _checkout(self):
+        while True:
+            try:
+                driver = self.available.get_nowait()
+            except queue.Empty:
+                self.__log__.debug("Starting new web driver")
+                driver = self.factory()
+                with self.lock:
+                    self.pages[driver] = 0
+                return driver
+            if self._is_healthy(driver):
+                return driver
+            self.__log__.info("Web driver failed health check, replacing it")
+            self._quit(driver)
+
+    def _checkin(self, driver, healthy):
+        with self.lock:
+            self.pages[driver] += 1
+            pages = self.pages[driver]
+        if not healthy:
+            self.__log__.debug("Web driver raised an error, replacing it")
+            self._quit(driver)
+        elif pages >= self.max_pages:
+            self.__log__.debug("Web driver served %d pages, recycling it", pages)
+            self._quit(driver)
+        elif self._uses_too_much_memory(driver):
+            self.__log__.debug("Web driver uses too much memory, recycling it")
+            self._quit(driver)
+        else:
+            self.available.put(driver)
+
+    @staticmethod
+    def _is_healthy(driver):
+        try:
+            driver.execute_script('return 1;')
+            return True
+        # pylint: disable=broad-except
+        except Exception:
+            return False
+
+    def _uses_too_much_memory(self, driver):
+        if self.max_memory is None:
+            return False
+        try:
+            used = driver.execute_script('return window.performance.memory.usedJSHeapSize;')
+        # pylint: disable=broad-except
+        except Exception:
+            return False
+        return used is not None and used > self.max_memory * 1024 * 1024
+
+    def _quit(self, driver):
+        with self.lock:
+            self.pages.pop(driver, None)
+        try:
+            driver.quit()
+        # pylint: disable=broad-except
+        except Exception as error:
+            self.__log__.warning("Unable to shut down web driver: %s", error)
+
+    def close(self):
+        """Shut down all drivers that are not checked out"""
+        while True:
+            try:
+                self._quit(self.available.get_nowait())
+            except queue.Empty:
+                return
@@ -1,24 +1,20 @@
 """Interface for webcrawlers. Crawler implementations should subclass this"""
 import logging
 
-from random_user_agent.params import HardwareType, Popularity
-from random_user_agent.user_agent import UserAgent
-
 
 class Headers:
     """Defines the Crawler interface"""
 
     __log__ = logging.getLogger('flathunt')
 
-    _user_agent_rotator = UserAgent(popularity=[Popularity.COMMON._value_],
-                                    hardware_types=[HardwareType.COMPUTER._value_])
+    # Loading the user agent database takes seconds, so it is only done on first use
+    _user_agent_rotator = None
 
     _headers = {
         'Connection': 'keep-alive',
         'Pragma': 'no-cache',
         'Cache-Control': 'no-cache',
         'Upgrade-Insecure-Requests': '1',
-        'User-Agent': _user_agent_rotator.get_random_user_agent(),
         'Accept': 'text/html,application/xhtml+xml,application/xml;'
                   'q=0.9,image/webp,image/apng,*/*;q=0.8,'
                   'application/signed-exchange;v=b3;q=0.9',
@@ -29,10 +25,22 @@ class Headers:
         'Accept-Language': 'en-US,en;q=0.9',
     }
 
+    @classmethod
+    def _get_user_agent_rotator(cls):
+        if Headers._user_agent_rotator is None:
+            # pylint: disable=import-outside-toplevel
+            from random_user_agent.params import HardwareType, Popularity
+            from random_user_agent.user_agent import UserAgent
+            Headers._user_agent_rotator = UserAgent(popularity=[Popularity.COMMON._value_],
+                                                    hardware_types=[HardwareType.COMPUTER._value_])
+        return Headers._user_agent_rotator
+
     @property
     def headers(self):
+        if 'User-Agent' not in self._headers:
+            self.rotate_user_agent()
         return self._headers
 
     def rotate_user_agent(self):
         """Choose a new random user agent"""
-        self._headers['User-Agent'] = self._user_agent_rotator.get_random_user_agent()
+        self._headers['User-Agent'] = self._get_user_agent_rotator().get_random_user_agent()
@@ -0,0 +1,36 @@
+"""Support for crawling newest-first search results incrementally"""
+import logging
+
+
+class IncrementalCrawl:
+    """Decides when paginating through a search sorted by newest first can stop: once
+       a page holds nothing but exposes that were already processed, or holds the
+       newest expose seen on the previous crawl of the same URL (its high-water mark)"""
+    __log__ = logging.getLogger('flathunt')
+
+    def __init__(self, id_watch, search_url):
+        self.id_watch = id_watch
+        self.search_url = search_url
+        self.mark = id_watch.get_high_water_mark(search_url)
+        self.new_mark = None
+
+    def is_last_page(self, entries):
+        """True if no page after this one can hold new exposes. Has to be called
+           before the entries are passed on, as that marks them as processed"""
+        expose_ids = [entry['id'] for entry in entries]
+        if not expose_ids:
+            return True
+        if self.new_mark is None:
+            self.new_mark = expose_ids[0]
+        if self.mark in expose_ids:
+            self.__log__.debug("Reached high-water mark %s for %s", self.mark, self.search_url)
+            return True
+        if len(self.id_watch.get_processed(expose_ids)) == len(expose_ids):
+            self.__log__.debug("Page has only known exposes for %s", self.search_url)
+            return True
+        return False
+
+    def finish(self):
+        """Remember the newest expose of this crawl for the next one"""
+        if self.new_mark is not None:
+            self.id_watch.set_high_water_mark(self.search_url, self.new_mark)
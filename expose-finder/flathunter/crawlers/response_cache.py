@@ -0,0 +1,75 @@
+"""Conditional requests for search result pages"""
+import hashlib
+import logging
+import threading
+
+
+class PageUnchanged(Exception):
+    """Raised when a search page has not changed since it was last crawled"""
+
+
+class ResponseCache:
+    """Remembers the ETag, Last-Modified date and a hash of the body of each
+       tracked search URL. Requests for those URLs are sent as conditional
+       requests, and a response that the server reports as not modified, or
+       whose body hashes to the same value as before, is recognized as unchanged.
+       New responses are only remembered once commit() is called, after the
+       exposes on the pages have been handled, so that a page whose crawl failed
+       is fetched and parsed again next time"""
+    __log__ = logging.getLogger('flathunt')
+
+    def __init__(self):
+        self.entries = dict()
+        self.pending = dict()
+        self.tracked = set()
+        self.lock = threading.Lock()
+
+    def track(self, url):
+        """Start caching responses for the URL"""
+        with self.lock:
+            self.tracked.add(url)
+
+    def request_headers(self, url):
+        """Returns the headers that make a request for the URL conditional"""
+        with self.lock:
+            entry = self.entries.get(url)
+        headers = dict()
+        if entry is None:
+            return headers
+        if entry['etag'] is not None:
+            headers['If-None-Match'] = entry['etag']
+        if entry['last_modified'] is not None:
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def is_unchanged(self, url, response):
+        """Returns true if the response is the same as the committed one. Otherwise,
+           the response is recorded, to be remembered on commit()"""
+        if url not in self.tracked:
+            return False
+        if response.status_code == 304:
+            self.__log__.debug("Server reports %s as not modified", url)
+            with self.lock:
+                self.pending.pop(url, None)
+            return True
+        if response.status_code != 200:
+            return False
+        content_hash = hashlib.sha256(response.content).hexdigest()
+        with self.lock:
+            previous = self.entries.get(url)
+            if previous is not None and previous['content_hash'] == content_hash:
+                self.pending.pop(url, None)
+                self.__log__.debug("Content of %s has not changed", url)
+                return True
+            self.pending[url] = {
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'content_hash': content_hash
+            }
+        return False
+
+    def commit(self):
+        """Remember the responses recorded since the last commit"""
+        with self.lock:
+            self.entries.update(self.pending)
+            self.pending.clear()
@@ -20,6 +20,7 @@ class Filter(Processor):
 class AddressResolver(Processor):
     """Processor to extract apartment addresses from expose links"""
     __log__ = logging.getLogger('flathunt')
+    concurrent = True
 
     def __init__(self, searchers):
         self.searchers = searchers
@@ -38,6 +39,7 @@ class AddressResolver(Processor):
 
 class CrawlExposeDetails(Processor):
     """Processor to extract additional apartment details by parsing page at expose URL"""
+    concurrent = True
 
     def __init__(self, searchers):
         self.searchers = searchers
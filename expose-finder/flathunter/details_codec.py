@@ -0,0 +1,108 @@
+"""Compression of the JSON details stored for each expose"""
+import re
+import struct
+import threading
+import zlib
+
+MAGIC = b'\x00FZ'
+HEADER = struct.Struct('<3sI')
+# zlib refers back at most 32 KiB, so a longer dictionary would not be used
+DICTIONARY_SIZE = 32 * 1024
+FIELD = re.compile(rb'[^,{}\[\]]+[,{}\[\]]?')
+FRAGMENT = re.compile(rb'[^,{}\[\]0-9]+[,{}\[\]]?')
+
+
+def train_dictionary(samples, size=DICTIONARY_SIZE):
+    """Builds a preset dictionary from sample documents. Fragments that occur in many
+       samples (the keys, URL prefixes, recurring phrases) are what a dictionary helps
+       with; zlib finds matches near the end of the dictionary cheapest, so the
+       fragments shared by the most samples go last"""
+    counts = {}
+    for sample in samples:
+        for fragment in set(_fragments(sample)):
+            counts[fragment] = counts.get(fragment, 0) + 1
+    shared = [fragment for fragment, count in counts.items() if count > 1]
+    shared.sort(key=lambda fragment: (counts[fragment], len(fragment)))
+    dictionary = b''
+    for fragment in reversed(shared):
+        if len(dictionary) + len(fragment) > size:
+            break
+        dictionary = fragment + dictionary
+    return dictionary
+
+
+def _fragments(sample):
+    """The parts of a JSON document between commas and brackets, which are whole
+       keys and values, and the parts between numbers as well, which catches the text
+       around IDs in URLs"""
+    return FIELD.findall(sample) + FRAGMENT.findall(sample)
+
+
+class DetailsCodec:
+    """Compresses the details of exposes with zlib and a preset dictionary per crawler.
+       The dictionary of a crawler is trained from its first 'train_samples' exposes;
+       until then, they are compressed without one. Blobs start with a header naming
+       the dictionary, so that blobs written with older dictionaries can still be read.
+       Text that does not start with the header is returned as it is, which covers
+       details saved before they were compressed"""
+
+    TRAIN_SAMPLES = 50
+    LEVEL = 6
+    # Raw deflate streams, without zlib's header and checksum: the details are small,
+    # and SQLite has its own integrity checks
+    WBITS = -15
+
+    def __init__(self, load_dictionary=None, store_dictionary=None, train_samples=TRAIN_SAMPLES):
+        self.load_dictionary = load_dictionary
+        self.store_dictionary = store_dictionary
+        self.train_samples = train_samples
+        self.dictionaries = {0: b''}
+        self.current = {}
+        self.samples = {}
+        self.lock = threading.Lock()
+
+    def add_dictionary(self, dictionary_id, crawler, dictionary):
+        """Use the dictionary for new details of the crawler"""
+        self.dictionaries[dictionary_id] = dictionary
+        self.current[crawler] = dictionary_id
+
+    def encode(self, crawler, text):
+        """Compresses the details of an expose of the crawler"""
+        data = text.encode('utf-8')
+        dictionary_id = self.current.get(crawler)
+        if dictionary_id is None:
+            dictionary_id = self._sample(crawler, data)
+        if dictionary_id:
+            compressor = zlib.compressobj(self.LEVEL, zlib.DEFLATED, self.WBITS, zdict=self.dictionaries[dictionary_id])
+        else:
+            compressor = zlib.compressobj(self.LEVEL, zlib.DEFLATED, self.WBITS)
+        return HEADER.pack(MAGIC, dictionary_id) + compressor.compress(data) + compressor.flush()
+
+    def _sample(self, crawler, data):
+        with self.lock:
+            if crawler in self.current:
+                return self.current[crawler]
+            samples = self.samples.setdefault(crawler, [])
+            samples.append(data)
+            if len(samples) < self.train_samples or self.store_dictionary is None:
+                return 0
+            dictionary = train_dictionary(samples)
+            del self.samples[crawler]
+            self.add_dictionary(self.store_dictionary(crawler, dictionary), crawler, dictionary)
+            return self.current[crawler]
+
+    def decode(self, blob):
+        """The details text of a stored blob"""
+        if blob is None or isinstance(blob, str):
+            return blob
+        blob = bytes(blob)
+        if not blob.startswith(MAGIC):
+            return blob.decode('utf-8')
+        _, dictionary_id = HEADER.unpack_from(blob)
+        if dictionary_id not in self.dictionaries:
+            self.dictionaries[dictionary_id] = self.load_dictionary(dictionary_id)
+        if dictionary_id:
+            decompressor = zlib.decompressobj(self.WBITS, zdict=self.dictionaries[dictionary_id])
+        else:
+            decompressor = zlib.decompressobj(self.WBITS)
+        return (decompressor.decompress(blob[HEADER.size:]) + decompressor.flush()).decode('utf-8')
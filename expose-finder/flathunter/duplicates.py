@@ -0,0 +1,97 @@
+"""Detection of the same flat being listed on several portals"""
+import datetime
+import logging
+import re
+
+from flathunter.string_utils import parse_number, parse_price
+
+UMLAUTS = (('ä', 'ae'), ('ö', 'oe'), ('ü', 'ue'), ('ß', 'ss'))
+
+
+def normalize_address(address):
+    """Reduces an address to its street and house number, spelled the same way on every
+       portal: 'Musterstraße 5a, 10115 Berlin' and 'Musterstr. 5 A (Mitte)' both become
+       'musterstr5a'. Returns None for addresses without a house number, which are too
+       vague to tell flats apart"""
+    if not address or address.startswith('http'):
+        return None
+    text = address.lower()
+    for umlaut, replacement in UMLAUTS:
+        text = text.replace(umlaut, replacement)
+    street = re.split(r',|\(|\b\d{5}\b', text)[0]
+    street = re.sub(r'strasse|str\.', 'str', street)
+    street = re.sub(r'[^a-z0-9]', '', street)
+    if not re.search(r'[a-z]', street) or not re.search(r'[0-9]', street):
+        return None
+    return street
+
+
+def fingerprint(expose):
+    """The normalized address, rooms, size and price of the expose, or None if any
+       of them is unknown"""
+    address = normalize_address(expose.get('address'))
+    rooms = parse_number(expose.get('rooms'))
+    size = parse_number(expose.get('size'))
+    price = parse_price(expose.get('price'))
+    if address is None or rooms is None or size is None or price is None:
+        return None
+    return address, rooms, size, price
+
+
+class DuplicateFilter:
+    """Filter exposes of a flat that has already been found on another portal. Two
+       exposes are the same flat if their addresses are the same after normalization,
+       they have the same number of rooms, and their sizes and prices differ by no more
+       than the tolerances. Exposes whose address is still a link to be resolved
+       later are always kept. Fingerprints older than 'max_age_days' are deleted,
+       at most once every EXPIRY_INTERVAL"""
+    __log__ = logging.getLogger('flathunt')
+
+    EXPIRY_INTERVAL = datetime.timedelta(hours=1)
+
+    def __init__(self, id_watch, size_tolerance=2.0, price_tolerance=0.05, max_age_days=30,
+                 clock=datetime.datetime.now):
+        self.id_watch = id_watch
+        self.size_tolerance = size_tolerance
+        self.price_tolerance = price_tolerance
+        self.max_age = datetime.timedelta(days=max_age_days)
+        self.clock = clock
+        self.next_expiry = None
+
+    def expire_fingerprints(self):
+        """Deletes the fingerprints older than the maximum age, if that was not done
+           recently"""
+        now = self.clock()
+        if self.next_expiry is not None and now < self.next_expiry:
+            return
+        self.next_expiry = now + self.EXPIRY_INTERVAL
+        expired = self.id_watch.expire_fingerprints(now - self.max_age)
+        if expired:
+            self.__log__.debug("Deleted %d expired fingerprints", expired)
+
+    def find_original(self, expose):
+        """The fingerprint of the expose, and the stored fingerprint of an expose from
+           another portal that matches it, if there is one"""
+        expose_fingerprint = fingerprint(expose)
+        if expose_fingerprint is None:
+            return None, None
+        address, rooms, size, price = expose_fingerprint
+        for other in self.id_watch.get_fingerprints(address, rooms):
+            if other['crawler'] == expose.get('crawler'):
+                continue
+            if abs(other['size'] - size) <= self.size_tolerance \
+                    and abs(other['price'] - price) <= self.price_tolerance * max(other['price'], price):
+                return expose_fingerprint, other
+        return expose_fingerprint, None
+
+    def is_interesting(self, expose):
+        """Returns true unless the expose duplicates one from another portal"""
+        self.expire_fingerprints()
+        expose_fingerprint, original = self.find_original(expose)
+        if original is not None:
+            self.__log__.info("Expose %s duplicates %s on %s", expose.get('url'), original['id'],
+                              original['crawler'])
+            return False
+        if expose_fingerprint is not None:
+            self.id_watch.save_fingerprint(expose['id'], expose.get('crawler'), *expose_fingerprint)
+        return True
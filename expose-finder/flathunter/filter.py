@@ -1,8 +1,18 @@
 """Module with implementations of standard expose filters"""
 import re
-from functools import reduce
 
+from flathunter import metrics
+from flathunter.aho_corasick import AhoCorasick
+from flathunter.duplicates import DuplicateFilter
 from flathunter.idmaintainer import AlreadySeenFilter
+from flathunter.string_utils import parse_number, parse_price
+
+REGEX_SYNTAX = re.compile(r'[.^$*+?{}\[\]\\|()]')
+
+
+def is_plain_term(term):
+    """True if the exclusion term is a plain word, which a regex would match literally"""
+    return bool(term) and not REGEX_SYNTAX.search(term)
 
 
 class ExposeHelper:
@@ -11,26 +21,17 @@ class ExposeHelper:
     @staticmethod
     def get_price(expose):
         """Extracts the price from a price text"""
-        price_match = re.search(r'\d+([\.,]\d+)?', expose['price'])
-        if price_match is None:
-            return None
-        return float(price_match[0].replace(".", "").replace(",", "."))
+        return parse_price(expose['price'])
 
     @staticmethod
     def get_size(expose):
         """Extracts the size from a size text"""
-        size_match = re.search(r'\d+([\.,]\d+)?', expose['size'])
-        if size_match is None:
-            return None
-        return float(size_match[0].replace(",", "."))
+        return parse_number(expose['size'])
 
     @staticmethod
     def get_rooms(expose):
         """Extracts the number of rooms from a room text"""
-        rooms_match = re.search(r'\d+([\.,]\d+)?', expose['rooms'])
-        if rooms_match is None:
-            return None
-        return float(rooms_match[0].replace(",", "."))
+        return parse_number(expose['rooms'])
 
 
 class MaxPriceFilter:
@@ -46,6 +47,10 @@ class MaxPriceFilter:
             return True
         return price <= self.max_price
 
+    def sql_predicate(self):
+        """The filter as a (field, operator, value) condition that can be run in SQL"""
+        return 'price', '<=', self.max_price
+
 
 class MinPriceFilter:
     """Exclude exposes below a given price"""
@@ -60,6 +65,10 @@ class MinPriceFilter:
             return True
         return price >= self.min_price
 
+    def sql_predicate(self):
+        """The filter as a (field, operator, value) condition that can be run in SQL"""
+        return 'price', '>=', self.min_price
+
 
 class MaxSizeFilter:
     """Exclude exposes above a given size"""
@@ -74,6 +83,10 @@ class MaxSizeFilter:
             return True
         return size <= self.max_size
 
+    def sql_predicate(self):
+        """The filter as a (field, operator, value) condition that can be run in SQL"""
+        return 'size', '<=', self.max_size
+
 
 class MinSizeFilter:
     """Exclude exposes below a given size"""
@@ -88,6 +101,10 @@ class MinSizeFilter:
             return True
         return size >= self.min_size
 
+    def sql_predicate(self):
+        """The filter as a (field, operator, value) condition that can be run in SQL"""
+        return 'size', '>=', self.min_size
+
 
 class MaxRoomsFilter:
     """Exclude exposes above a given number of rooms"""
@@ -102,6 +119,10 @@ class MaxRoomsFilter:
             return True
         return rooms <= self.max_rooms
 
+    def sql_predicate(self):
+        """The filter as a (field, operator, value) condition that can be run in SQL"""
+        return 'rooms', '<=', self.max_rooms
+
 
 class MinRoomsFilter:
     """Exclude exposes below a given number of rooms"""
@@ -116,21 +137,39 @@ class MinRoomsFilter:
             return True
         return rooms >= self.min_rooms
 
+    def sql_predicate(self):
+        """The filter as a (field, operator, value) condition that can be run in SQL"""
+        return 'rooms', '>=', self.min_rooms
+
+
+class TitleMatcher:
+    """Matches titles against a list of exclusion terms. Plain words are found with a
+       single automaton, however many there are; only terms that use regex syntax are
+       combined into a regex"""
+
+    def __init__(self, terms):
+        literals = [term for term in terms if is_plain_term(term)]
+        patterns = [term for term in terms if not is_plain_term(term)]
+        self.automaton = AhoCorasick(literals) if literals else None
+        self.regex = re.compile("(" + ")|(".join(patterns) + ")") if patterns else None
+
+    def matches(self, title):
+        """True if any of the terms occurs in the (lowercase) title"""
+        if self.automaton is not None and self.automaton.contains_any(title):
+            return True
+        return self.regex is not None and self.regex.search(title) is not None
+
 
 class TitleFilter:
     """Exclude exposes whose titles match the provided terms"""
 
     def __init__(self, filtered_titles):
         self.filtered_titles = filtered_titles
+        self.matcher = TitleMatcher(filtered_titles)
 
     def is_interesting(self, expose):
         """True unless title matches the filtered titles"""
-        combined_excludes = "(" + ")|(".join(self.filtered_titles) + ")"
-        found_objects = re.search(combined_excludes, expose['title'].lower())
-        # send all non matching regex patterns
-        if not found_objects:
-            return True
-        return False
+        return not self.matcher.matches(expose['title'].lower())
 
 
 class PPSFilter:
@@ -148,6 +187,10 @@ class PPSFilter:
         pps = price / size
         return pps <= self.max_pps
 
+    def sql_predicate(self):
+        """The filter as a (field, operator, value) condition that can be run in SQL"""
+        return 'pps', '<=', self.max_pps
+
 
 class PredicateFilter:
     """Include only those exposes satisfying the predicate"""
@@ -168,12 +211,13 @@ class FilterBuilder:
 
     def read_config(self, config):
         """Adds filters from a config dictionary"""
+        excluded_titles = None
         if "excluded_titles" in config:
-            self.filters.append(TitleFilter(config["excluded_titles"]))
+            excluded_titles = list(config["excluded_titles"] or [])
         if "filters" in config and config["filters"] is not None:
             filters_config = config["filters"]
             if "excluded_titles" in filters_config:
-                self.filters.append(TitleFilter(filters_config["excluded_titles"]))
+                excluded_titles = (excluded_titles or []) + list(filters_config["excluded_titles"] or [])
             if "min_price" in filters_config:
                 self.filters.append(MinPriceFilter(filters_config["min_price"]))
             if "max_price" in filters_config:
@@ -188,6 +232,8 @@ class FilterBuilder:
                 self.filters.append(MaxRoomsFilter(filters_config["max_rooms"]))
             if "max_price_per_square" in filters_config:
                 self.filters.append(PPSFilter(filters_config["max_price_per_square"]))
+        if excluded_titles is not None:
+            self.filters.append(TitleFilter(excluded_titles))
         return self
 
     def max_size_filter(self, size):
@@ -205,6 +251,11 @@ class FilterBuilder:
         self.filters.append(AlreadySeenFilter(id_watch))
         return self
 
+    def filter_duplicates(self, id_watch, size_tolerance=2.0, price_tolerance=0.05, max_age_days=30):
+        """Filter exposes of flats that have already been found on another portal"""
+        self.filters.append(DuplicateFilter(id_watch, size_tolerance, price_tolerance, max_age_days))
+        return self
+
     def build(self):
         """Return the compiled filter"""
         return Filter(self.filters)
@@ -218,13 +269,32 @@ class Filter:
 
     def is_interesting_expose(self, expose):
         """Apply all filters to this expose"""
-        return reduce((lambda x, y: x and y),
-                      map((lambda x: x.is_interesting(expose)), self.filters), True)
+        # Every filter sees the expose, even once it is rejected: the already-seen
+        # filter has to record the expose either way
+        interesting = True
+        for expose_filter in self.filters:
+            if not expose_filter.is_interesting(expose):
+                metrics.FILTER_REJECTIONS.inc(filter=type(expose_filter).__name__)
+                interesting = False
+        return interesting
 
     def filter(self, exposes):
         """Apply all filters to every expose in the list"""
         return filter(self.is_interesting_expose, exposes)
 
+    def split_predicates(self):
+        """Separates the filters that can be expressed as (field, operator, value)
+           conditions from the rest. Returns the conditions, and a filter of the rest"""
+        predicates = []
+        remaining = []
+        for expose_filter in self.filters:
+            sql_predicate = getattr(expose_filter, 'sql_predicate', None)
+            if sql_predicate is not None:
+                predicates.append(sql_predicate())
+            else:
+                remaining.append(expose_filter)
+        return predicates, Filter(remaining)
+
     @staticmethod
     def builder():
         """Return a new filter builder"""
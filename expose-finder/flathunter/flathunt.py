@@ -11,12 +11,13 @@ import time
 from pprint import pformat
 
 from flathunter.config import Config
-from flathunter.crawlers.crawl_ebaykleinanzeigen import CrawlEbayKleinanzeigen
-from flathunter.crawlers.crawl_immobilienscout import CrawlImmobilienscout
-from flathunter.crawlers.crawl_immowelt import CrawlImmowelt
-from flathunter.crawlers.crawl_wggesucht import CrawlWgGesucht
+from flathunter.crawlers import load_crawlers
 from flathunter.hunter import Hunter
 from flathunter.idmaintainer import IdMaintainer
+from flathunter.metrics import MetricsServer
+from flathunter.redis_id_maintainer import RedisIdMaintainer
+from flathunter.retention import Retention
+from flathunter.scheduler import Scheduler
 
 __author__ = "Jan Harrie"
 __version__ = "1.0"
@@ -46,21 +47,49 @@ __log__ = logging.getLogger('flathunt')
 
 def launch_flat_hunt(config):
     """Start the crawler loop"""
-    id_watch = IdMaintainer('%s/processed_ids.db' % config.database_location())
+    id_watch = load_id_maintainer(config)
+    if config.settings.metrics_port is not None:
+        MetricsServer(config.settings.metrics_port, config.settings.metrics_host).start()
 
     hunter = Hunter(config, all_searchers(config), id_watch, RedisPubsub(config))
+    if config.settings.loop_active and config.settings.loop_adaptive:
+        hunt_adaptively(hunter, Scheduler.from_settings(config.settings))
+        return
+
     hunter.hunt_flats()
 
-    while config.get('loop', dict()).get('active', False):
-        time.sleep(config.get('loop', dict()).get('sleeping_time', 60 * 10))
+    while config.settings.loop_active:
+        time.sleep(config.settings.loop_sleeping_time)
         hunter.hunt_flats()
 
 
+def load_id_maintainer(config):
+    """The store of processed IDs and exposes: a SQLite file, or a Redis server that
+       several finders can share"""
+    if config.settings.id_store == 'redis':
+        return RedisIdMaintainer.from_settings(config.settings)
+    id_watch = IdMaintainer('%s/processed_ids.db' % config.settings.database_location) \
+        .use_seen_set('%s/processed_ids.seen' % config.settings.database_location)
+    if config.settings.retention:
+        retention = Retention.from_settings(id_watch, config.settings)
+        retention.enable_incremental_vacuum()
+        retention.start(config.settings.retention_interval)
+    id_watch.start_backfill()
+    return id_watch
+
+
+def hunt_adaptively(hunter, scheduler):
+    """Crawl each URL whenever the scheduler says it is due"""
+    while True:
+        for url in scheduler.due():
+            exposes = hunter.hunt_flats(urls=[url])
+            scheduler.record(url, len(exposes), url in hunter.rate_limited)
+        time.sleep(scheduler.seconds_until_due())
+
+
 def all_searchers(config):
-    return [CrawlImmobilienscout(config),
-            CrawlWgGesucht(config),
-            CrawlEbayKleinanzeigen(config),
-            CrawlImmowelt(config), ]
+    """Crawlers for the portals in the configured URLs"""
+    return load_crawlers(config)
 
 
 def main():
@@ -74,18 +103,30 @@ def main():
                         help="Config file to use. If not set, try to use '%s/config.yaml' " %
                              os.path.dirname(os.path.abspath(__file__))
                         )
+    parser.add_argument('--redis_host', help="Redis host, overrides the config file")
+    parser.add_argument('--redis_port', type=int, help="Redis port, overrides the config file")
+    parser.add_argument('--metrics_port', type=int, help="Port to serve metrics on, overrides the config file")
+    parser.add_argument('--compact', action='store_true',
+                        help="Compress the details of exposes saved by older versions, shrink the database "
+                             "file, and exit. Stop the finder first")
     args = parser.parse_known_args()[0]
 
     # load config
     config_handle = args.config
-    config = Config(config_handle.name)
+    config = Config(config_handle.name,
+                    overrides={'redis_host': args.redis_host, 'redis_port': args.redis_port,
+                               'metrics_port': args.metrics_port})
+
+    if args.compact:
+        IdMaintainer('%s/processed_ids.db' % config.settings.database_location).compact()
+        return
 
     # check config
-    if not config.urls():
+    if not config.settings.urls:
         __log__.warning("No urls configured. No crawling will be done.")
 
     # adjust log level, if required
-    if config.get('verbose'):
+    if config.settings.verbose:
         __log__.setLevel(logging.DEBUG)
         __log__.debug("Settings from config: %s", pformat(config))
 
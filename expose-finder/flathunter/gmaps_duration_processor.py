@@ -6,6 +6,7 @@ import urllib
 
 import requests
 
+from flathunter import metrics
 from flathunter.abstract_processor import Processor
 
 
@@ -16,10 +17,17 @@ class GMapsDurationProcessor(Processor):
     GM_MODE_BICYCLE = 'bicycling'
     GM_MODE_DRIVING = 'driving'
 
+    concurrent = True
+
     __log__ = logging.getLogger('flathunt')
 
     def __init__(self, config):
         self.config = config
+        gm_config = config.get('google_maps_api') or dict()
+        self.durations = config.get('durations') or list()
+        self.gm_url = gm_config.get('url')
+        self.gm_key = gm_config.get('key')
+        self.gm_key_configured = 'key' in gm_config
 
     def process_expose(self, expose):
         """Calculate the durations for an expose"""
@@ -29,13 +37,12 @@ class GMapsDurationProcessor(Processor):
     def get_formatted_durations(self, address):
         """Return a formatted list of GoogleMaps durations"""
         out = ""
-        for duration in self.config.get('durations', list()):
+        for duration in self.durations:
             if 'destination' in duration and 'name' in duration:
                 dest = duration.get('destination')
                 name = duration.get('name')
                 for mode in duration.get('modes', list()):
-                    if 'gm_id' in mode and 'title' in mode \
-                            and 'key' in self.config.get('google_maps_api', dict()):
+                    if 'gm_id' in mode and 'title' in mode and self.gm_key_configured:
                         duration = self.get_gmaps_distance(address, dest, mode['gm_id'])
                         out += "> %s (%s): %s\n" % (name, mode['title'], duration)
 
@@ -53,9 +60,8 @@ class GMapsDurationProcessor(Processor):
         dest = urllib.parse.quote_plus(dest.strip().encode('utf8'))
         self.__log__.debug("Got address: %s", address)
 
-        # get google maps config stuff
-        base_url = self.config.get('google_maps_api', dict()).get('url')
-        gm_key = self.config.get('google_maps_api', dict()).get('key')
+        base_url = self.gm_url
+        gm_key = self.gm_key
 
         if not gm_key and mode != self.GM_MODE_DRIVING:
             self.__log__.warning("No Google Maps API key configured and without using a mode "
@@ -68,6 +74,7 @@ class GMapsDurationProcessor(Processor):
         url = base_url.format(dest=dest, mode=mode, origin=address,
                               key=gm_key, arrival=arrival_time)
         result = requests.get(url).json()
+        metrics.GMAPS_REQUESTS.inc(status=result['status'])
         if result['status'] != 'OK':
             self.__log__.error("Failed retrieving distance to address %s: %s", address, result)
             return None
@@ -1,11 +1,15 @@
 """Default Flathunter implementation for the command line"""
 import logging
+from concurrent.futures import wait
 from itertools import chain
 
+from flathunter import metrics
 from flathunter.config import Config
+from flathunter.crawlers import CaptchaPending, RateLimited
 from flathunter.filter import Filter
 from flathunter.processor import ProcessorChain
 from flathunter.pubsub.nop_pubsub import NopPubsub
+from flathunter.subscriptions import SubscriptionIndexCache
 
 
 class Hunter:
@@ -19,32 +23,97 @@ class Hunter:
             raise Exception("Invalid config for hunter - should be a 'Config' object")
         self.id_watch = id_watch
         self.pubsub = pubsub
+        self.rate_limited = set()
+        self.subscriptions = SubscriptionIndexCache(id_watch)
 
-    def crawl_for_exposes(self, max_pages=None):
-        """Trigger a new crawl of the configured URLs"""
-        return chain(*[searcher.crawl(url, max_pages)
-                       for searcher in self.searchers
-                       for url in self.config.urls()])
+    def crawl_for_exposes(self, max_pages=None, urls=None):
+        """Trigger a new crawl of the given URLs, or of all configured URLs. URLs held
+           up by a captcha are crawled again after the others, once it is solved"""
+        id_watch = self.id_watch if self.config.settings.incremental else None
+        urls = self.config.settings.urls if urls is None else urls
+        held_up = []
+        return map(self._count_found,
+                   chain(*[self._crawl(searcher, url, max_pages, id_watch, held_up)
+                           for searcher in self.searchers
+                           for url in urls],
+                         self._crawl_held_up(held_up, max_pages, id_watch)))
 
-    def hunt_flats(self, max_pages=None):
-        """Crawl, process and filter exposes"""
+    def _crawl(self, searcher, url, max_pages, id_watch, held_up=None):
+        try:
+            yield from searcher.crawl(url, max_pages, id_watch)
+        except RateLimited:
+            self.__log__.warning("Rate limited while crawling %s", url)
+            self.rate_limited.add(url)
+        except CaptchaPending as pending:
+            if held_up is None:
+                self.__log__.warning("Still held up by a captcha while crawling %s", url)
+                return
+            self.__log__.info("Crawling %s again once its captcha is solved", url)
+            held_up.append((searcher, url, pending.solution))
+
+    def _crawl_held_up(self, held_up, max_pages, id_watch):
+        # Only runs once the other URLs are crawled, as the chain is lazy
+        for searcher, url, solution in held_up:
+            wait([solution])
+            yield from self._crawl(searcher, url, max_pages, id_watch)
+
+    @staticmethod
+    def _count_found(expose):
+        metrics.EXPOSES_FOUND.inc(crawler=expose.get('crawler', ''))
+        return expose
+
+    def hunt_flats(self, max_pages=None, urls=None):
+        """Crawl, process and filter exposes. URLs that the portal refused to serve
+           because of rate limiting are collected in 'rate_limited'"""
+        self.rate_limited = set()
         filter_set = Filter.builder() \
             .read_config(self.config) \
             .filter_already_seen(self.id_watch) \
             .build()
 
-        processor_chain = ProcessorChain.builder(self.config) \
-            .save_all_exposes(self.id_watch) \
-            .apply_filter(filter_set) \
+        chain_builder = ProcessorChain.builder(self.config) \
+            .save_all_exposes(self.id_watch, self.pubsub) \
+            .apply_filter(filter_set)
+        if self.config.settings.duplicates:
+            # Only new exposes that passed the filters are compared with the other portals
+            chain_builder.apply_filter(Filter.builder()
+                                       .filter_duplicates(self.id_watch,
+                                                          self.config.settings.duplicate_size_tolerance,
+                                                          self.config.settings.duplicate_price_tolerance,
+                                                          self.config.settings.duplicate_max_age_days)
+                                       .build())
+        chain_builder \
             .resolve_addresses(self.searchers) \
             .calculate_durations() \
-            .publish_exposes(self.pubsub) \
-            .build()
+            .match_subscriptions(self.subscriptions) \
+            .publish_exposes(self.pubsub)
+        if self.config.settings.stage_timing:
+            profile = self.config.settings.stage_profiling
+            if profile and self.config.settings.pipeline:
+                self.__log__.warning("Stages are not profiled in a pipeline, only timed")
+                profile = False
+            chain_builder.time_stages(profile)
+        if self.config.settings.pipeline:
+            chain_builder.pipelined(self.config.settings.pipeline_workers,
+                                    self.config.settings.pipeline_queue_size,
+                                    self.config.settings.pipeline_preserve_order)
+        processor_chain = chain_builder.build()
 
         result = []
         # We need to iterate over this list to force the evaluation of the pipeline
-        for expose in processor_chain.process(self.crawl_for_exposes(max_pages)):
-            self.__log__.info('New offer: %s', expose['title'])
-            result.append(expose)
+        with metrics.CYCLE_SECONDS.time():
+            for expose in processor_chain.process(self.crawl_for_exposes(max_pages, urls)):
+                self.__log__.info('New offer: %s', expose['title'])
+                metrics.EXPOSES_NEW.inc(crawler=expose.get('crawler', ''))
+                result.append(expose)
+
+        # Only now that their exposes are handled, the pages count as crawled
+        for searcher in self.searchers:
+            if getattr(searcher, 'response_cache', None) is not None:
+                searcher.response_cache.commit()
+
+        if processor_chain.timing is not None:
+            processor_chain.timing.record_metrics()
+            self.__log__.info("Time spent per stage:\n%s", processor_chain.timing.summary())
 
         return result
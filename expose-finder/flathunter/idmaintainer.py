@@ -1,11 +1,17 @@
 """SQLite implementation of IDMaintainer interface"""
 import datetime
+import hashlib
 import json
 import logging
 import sqlite3 as lite
 import threading
+from itertools import islice
 
+from flathunter import metrics
 from flathunter.abstract_processor import Processor
+from flathunter.details_codec import DetailsCodec
+from flathunter.seen_set import SeenSet
+from flathunter.string_utils import parse_number, parse_price
 
 __author__ = "Nody"
 __version__ = "0.1"
@@ -13,19 +19,54 @@ __maintainer__ = "Nody"
 __email__ = "harrymcfly@protonmail.com"
 __status__ = "Prodction"
 
+# The fields of an expose that, when they change, make it worth telling subscribers
+SIGNIFICANT_FIELDS = ('title', 'price', 'size', 'rooms', 'address', 'url')
+NEW = 'new'
+UPDATED = 'updated'
+UNCHANGED = 'unchanged'
+
+
+def content_hash(expose):
+    """A short hash of the significant fields of an expose"""
+    fields = json.dumps([expose.get(field) for field in SIGNIFICANT_FIELDS], ensure_ascii=False)
+    return hashlib.blake2b(fields.encode('utf-8'), digest_size=8).hexdigest()
+
 
 class SaveAllExposesProcessor(Processor):
-    """Processor that saves all exposes to the database"""
+    """Processor that saves all exposes to the database. Known exposes whose
+       significant fields changed are published on the 'expose_updates' channel"""
+    __log__ = logging.getLogger('flathunt')
 
-    def __init__(self, config, id_watch):
+    def __init__(self, config, id_watch, pubsub=None):
         self.config = config
         self.id_watch = id_watch
+        self.pubsub = pubsub
 
     def process_expose(self, expose):
         """Save a single expose"""
-        self.id_watch.save_expose(expose)
+        self._save(expose, touch=True)
         return expose
 
+    def process_exposes(self, exposes):
+        """Save the exposes. Unchanged exposes are only marked as seen, all at once
+           when the sequence ends"""
+        unchanged = []
+        for expose in exposes:
+            if self._save(expose, touch=False) == UNCHANGED:
+                unchanged.append(expose)
+            yield expose
+        self.id_watch.touch_exposes(unchanged)
+
+    def _save(self, expose, touch):
+        status, changes = self.id_watch.save_expose(expose, touch=touch)
+        if status == UPDATED:
+            self.__log__.debug("Expose %s changed: %s", expose['id'], changes)
+            metrics.EXPOSES_UPDATED.inc(crawler=expose.get('crawler', ''))
+            if self.pubsub is not None:
+                self.pubsub.publish("expose_updates", json.dumps(
+                    {'event': UPDATED, 'expose': expose, 'changes': changes}, ensure_ascii=False))
+        return status
+
 
 class AlreadySeenFilter:
     """Filter exposes that have already been processed"""
@@ -35,98 +76,413 @@ class AlreadySeenFilter:
 
     def is_interesting(self, expose):
         """Returns true if an expose should be kept in the pipeline"""
-        if not self.id_watch.is_processed(expose['id']):
-            self.id_watch.mark_processed(expose['id'])
-            return True
-        return False
+        return self.id_watch.mark_if_new(expose['id'])
 
 
 class IdMaintainer:
     """SQLite back-end for the database"""
     __log__ = logging.getLogger('flathunt')
 
+    PAGE_SIZE = 100
+    BACKFILL_BATCH_SIZE = 500
+    # Seconds a connection waits for another one's write to finish, e.g. of the
+    # backfill or of retention, before failing with 'database is locked'
+    BUSY_TIMEOUT = 30
+    # Columns that were added to the exposes table after its first release
+    EXPOSE_COLUMNS = (('price', 'REAL'), ('size', 'REAL'), ('rooms', 'REAL'), ('pps', 'REAL'),
+                      ('first_seen', 'TIMESTAMP'), ('last_seen', 'TIMESTAMP'), ('content_hash', 'TEXT'))
+    # How the values of the columns are computed from the details of an expose
+    FIELD_SQL = {
+        'price': "flathunter_price(json_extract(flathunter_details(details), '$.price'))",
+        'size': "flathunter_number(json_extract(flathunter_details(details), '$.size'))",
+        'rooms': "flathunter_number(json_extract(flathunter_details(details), '$.rooms'))",
+    }
+    FIELD_SQL['pps'] = "(%s / %s)" % (FIELD_SQL['price'], FIELD_SQL['size'])
+    OPERATORS = ('<', '<=', '>', '>=', '=')
+
     def __init__(self, db_name):
         self.db_name = db_name
         self.threadlocal = threading.local()
+        self.backfilled = False
+        self.seen_set = None
+        self.codec = DetailsCodec(self._load_dictionary, self._store_dictionary)
+        self.dictionaries_loaded = False
 
     def get_connection(self):
         """Connects to the SQLite database. Connections are thread-local"""
         connection = getattr(self.threadlocal, 'connection', None)
         if connection is None:
             try:
-                self.threadlocal.connection = lite.connect(self.db_name)
+                self.threadlocal.connection = lite.connect(self.db_name, timeout=self.BUSY_TIMEOUT)
                 connection = self.threadlocal.connection
+                connection.create_function('flathunter_price', 1, parse_price, deterministic=True)
+                connection.create_function('flathunter_number', 1, parse_number, deterministic=True)
+                connection.create_function('flathunter_details', 1, self.codec.decode, deterministic=True)
                 cur = self.threadlocal.connection.cursor()
-                cur.execute('CREATE TABLE IF NOT EXISTS processed (ID INTEGER)')
+                # Only takes effect on new databases; Retention converts older ones
+                cur.execute('PRAGMA auto_vacuum = INCREMENTAL')
+                cur.execute('CREATE TABLE IF NOT EXISTS processed (ID INTEGER, created TIMESTAMP)')
+                self._add_processed_created(cur)
+                cur.execute('CREATE INDEX IF NOT EXISTS processed_id ON processed (ID)')
+                cur.execute('CREATE INDEX IF NOT EXISTS processed_created ON processed (created)')
                 cur.execute('CREATE TABLE IF NOT EXISTS executions (timestamp timestamp)')
+                cur.execute('CREATE INDEX IF NOT EXISTS executions_timestamp ON executions (timestamp)')
                 cur.execute('CREATE TABLE IF NOT EXISTS exposes (id INTEGER, created TIMESTAMP, \
-                                    crawler STRING, details BLOB, PRIMARY KEY (id, crawler))')
+                                    crawler STRING, details BLOB, price REAL, size REAL, rooms REAL, \
+                                    pps REAL, first_seen TIMESTAMP, last_seen TIMESTAMP, \
+                                    content_hash TEXT, PRIMARY KEY (id, crawler))')
+                self._add_expose_columns(cur)
+                cur.execute('CREATE INDEX IF NOT EXISTS exposes_created ON exposes (created, id, crawler)')
+                # One index per column filtered on, as filters rarely restrict all of them
+                cur.execute('DROP INDEX IF EXISTS exposes_numbers')
+                for column in self.FIELD_SQL:
+                    cur.execute('CREATE INDEX IF NOT EXISTS exposes_%s ON exposes (%s)' % (column, column))
+                cur.execute('CREATE INDEX IF NOT EXISTS exposes_crawler_seen ON exposes (crawler, first_seen)')
                 cur.execute('CREATE TABLE IF NOT EXISTS users \
                                     (id INTEGER PRIMARY KEY, settings BLOB)')
+                # Counts the changes to the users table, including those of other processes
+                cur.execute('CREATE TABLE IF NOT EXISTS users_version (version INTEGER)')
+                cur.execute('INSERT INTO users_version SELECT 0 WHERE NOT EXISTS (SELECT * FROM users_version)')
+                for event in ('INSERT', 'UPDATE', 'DELETE'):
+                    cur.execute('CREATE TRIGGER IF NOT EXISTS users_%s AFTER %s ON users \
+                                    BEGIN UPDATE users_version SET version = version + 1; END' % (event.lower(), event))
+                cur.execute('CREATE TABLE IF NOT EXISTS crawl_marks \
+                                    (url STRING PRIMARY KEY, expose_id INTEGER, updated TIMESTAMP)')
+                cur.execute('CREATE TABLE IF NOT EXISTS fingerprints (id INTEGER, crawler STRING, \
+                                    address STRING, rooms REAL, size REAL, price REAL, created TIMESTAMP, \
+                                    PRIMARY KEY (id, crawler))')
+                cur.execute('CREATE INDEX IF NOT EXISTS fingerprints_address ON fingerprints (address, rooms)')
+                cur.execute('CREATE INDEX IF NOT EXISTS fingerprints_created ON fingerprints (created)')
+                cur.execute('CREATE TABLE IF NOT EXISTS details_dictionaries \
+                                    (id INTEGER PRIMARY KEY AUTOINCREMENT, crawler STRING, dictionary BLOB)')
                 self.threadlocal.connection.commit()
+                if not self.dictionaries_loaded:
+                    self.dictionaries_loaded = True
+                    cur.execute('SELECT id, crawler, dictionary FROM details_dictionaries ORDER BY id')
+                    for dictionary_id, crawler, dictionary in cur.fetchall():
+                        self.codec.add_dictionary(dictionary_id, crawler, dictionary)
             except lite.Error as error:
                 self.__log__.error("Error %s:", error.args[0])
                 raise error
         return connection
 
+    def _load_dictionary(self, dictionary_id):
+        """Loads a compression dictionary, e.g. one added by another finder"""
+        cur = self.get_connection().cursor()
+        cur.execute('SELECT dictionary FROM details_dictionaries WHERE id = ?', (dictionary_id,))
+        return cur.fetchone()[0]
+
+    def _store_dictionary(self, crawler, dictionary):
+        """Saves a newly trained compression dictionary, returning its ID"""
+        with metrics.DB_WRITE_SECONDS.time(operation='store_dictionary'):
+            cur = self.get_connection().cursor()
+            cur.execute('INSERT INTO details_dictionaries (crawler, dictionary) VALUES (?, ?)',
+                        (crawler, dictionary))
+            self.get_connection().commit()
+        return cur.lastrowid
+
+    def decode_details(self, blob):
+        """The JSON text of the details column of an expose"""
+        return self.codec.decode(blob)
+
+    def _add_processed_created(self, cur):
+        """Adds the time an expose was processed to databases created by older versions.
+           IDs processed before count as processed at the time of the upgrade"""
+        cur.execute('PRAGMA table_info(processed)')
+        if 'created' not in set(row[1] for row in cur.fetchall()):
+            self.__log__.info("Adding column created to the processed table")
+            cur.execute('ALTER TABLE processed ADD COLUMN created TIMESTAMP')
+            cur.execute('UPDATE processed SET created = ?', (datetime.datetime.now(),))
+
+    def _add_expose_columns(self, cur):
+        """Adds the columns that databases created by older versions lack. The new
+           columns start out empty, and are filled by backfill_expose_columns"""
+        cur.execute('PRAGMA table_info(exposes)')
+        existing = set(row[1] for row in cur.fetchall())
+        for column, column_type in self.EXPOSE_COLUMNS:
+            if column not in existing:
+                self.__log__.info("Adding column %s to the exposes table", column)
+                cur.execute('ALTER TABLE exposes ADD COLUMN %s %s' % (column, column_type))
+
+    def backfill_expose_columns(self, batch_size=BACKFILL_BATCH_SIZE):
+        """Fills the numeric columns of exposes saved before the columns existed. Works
+           in small batches, each in its own transaction, so that the crawler can keep
+           writing in between. Returns the number of exposes updated"""
+        updated = 0
+        now = datetime.datetime.now()
+        while True:
+            with metrics.DB_WRITE_SECONDS.time(operation='backfill_expose_columns'):
+                cur = self.get_connection().cursor()
+                # Rows without a creation time count as first seen now, so that every
+                # batch leaves no row it touched with first_seen unset
+                cur.execute('UPDATE exposes SET price = %s, size = %s, rooms = %s, pps = %s, \
+                             first_seen = coalesce(created, ?), last_seen = coalesce(created, ?) \
+                             WHERE rowid IN (SELECT rowid FROM exposes WHERE first_seen IS NULL LIMIT ?)'
+                            % (self.FIELD_SQL['price'], self.FIELD_SQL['size'], self.FIELD_SQL['rooms'],
+                               self.FIELD_SQL['pps']), (now, now, batch_size))
+                self.get_connection().commit()
+            updated += cur.rowcount
+            if cur.rowcount < batch_size:
+                self.backfilled = True
+                return updated
+
+    def compress_details(self, batch_size=BACKFILL_BATCH_SIZE):
+        """Compresses the details of exposes saved before details were compressed. Works
+           in batches along the rowid, like backfill_expose_columns. A row that was saved
+           again since it was read is left alone. The rows shrink in place, so the file
+           only gets smaller with compact(). Returns the number of exposes compressed"""
+        compressed = 0
+        last_rowid = 0
+        while True:
+            cur = self.get_connection().cursor()
+            cur.execute('SELECT rowid, crawler, details FROM exposes WHERE rowid > ? ORDER BY rowid LIMIT ?',
+                        (last_rowid, batch_size))
+            rows = cur.fetchall()
+            if not rows:
+                break
+            last_rowid = rows[-1][0]
+            updates = [(self.codec.encode(crawler, details), rowid, details)
+                       for rowid, crawler, details in rows if isinstance(details, str)]
+            if updates:
+                with metrics.DB_WRITE_SECONDS.time(operation='compress_details'):
+                    cur.executemany('UPDATE exposes SET details = ? WHERE rowid = ? AND details = ?', updates)
+                    self.get_connection().commit()
+                compressed += cur.rowcount
+        return compressed
+
+    def compact(self):
+        """Compresses the details of older exposes and rebuilds the database, which
+           returns the space saved to the file system. The rebuild locks the database
+           until it is done, so this is a maintenance task for when no finder runs"""
+        compressed = self.compress_details()
+        self.__log__.info("Compressed the details of %d exposes, rebuilding the database", compressed)
+        self.get_connection().execute('VACUUM')
+        return compressed
+
+    def start_backfill(self):
+        """Backfill the numeric columns, and compress the details of older exposes, on
+           a background thread"""
+        def backfill():
+            try:
+                self.backfill_expose_columns()
+                self.compress_details()
+            except lite.Error as error:
+                self.__log__.error("Backfill failed: %s", error)
+        threading.Thread(target=backfill, name='backfill', daemon=True).start()
+
+    def _field_sql(self, field):
+        """SQL for a numeric field of the exposes. Until the backfill has finished,
+           older rows have no values in the columns yet, so they are computed"""
+        if not self.backfilled:
+            cur = self.get_connection().cursor()
+            cur.execute('SELECT EXISTS (SELECT 1 FROM exposes WHERE first_seen IS NULL)')
+            self.backfilled = not cur.fetchone()[0]
+        if self.backfilled:
+            return field
+        return 'coalesce(%s, %s)' % (field, self.FIELD_SQL[field])
+
+    def use_seen_set(self, path):
+        """Answer whether exposes were processed from an on-disk seen-set, rather than
+           from the database. The seen-set is built from the database the first time,
+           and rebuilt if it does not hold as many IDs as the database, e.g. because
+           rows were added to the database by other means"""
+        building = not SeenSet.exists(path)
+        self.seen_set = SeenSet(path)
+        cur = self.get_connection().cursor()
+        if not building:
+            cur.execute('SELECT count(DISTINCT id) FROM processed')
+            processed = cur.fetchone()[0]
+            if processed == len(self.seen_set):
+                return self
+            self.__log__.info("Seen-set at %s holds %d IDs, the database %d",
+                              path, len(self.seen_set), processed)
+        self.__log__.info("Building seen-set at %s", path)
+        cur.execute('SELECT DISTINCT id FROM processed')
+        self.seen_set.replace(row[0] for row in cur)
+        return self
+
     def is_processed(self, expose_id):
         """Returns true if an expose has already been processed"""
         self.__log__.debug('is_processed(%d)', expose_id)
+        if self.seen_set is not None:
+            return expose_id in self.seen_set
         cur = self.get_connection().cursor()
         cur.execute('SELECT id FROM processed WHERE id = ?', (expose_id,))
         row = cur.fetchone()
         return row is not None
 
+    def get_processed(self, expose_ids):
+        """Returns the subset of the given IDs that have already been processed"""
+        expose_ids = list(expose_ids)
+        if not expose_ids:
+            return set()
+        if self.seen_set is not None:
+            return set(expose_id for expose_id in expose_ids if expose_id in self.seen_set)
+        return self.get_processed_in_database(expose_ids)
+
+    def get_processed_in_database(self, expose_ids):
+        """Returns the subset of the given IDs that the processed table holds, even
+           when the seen-set is used"""
+        expose_ids = list(expose_ids)
+        found = set()
+        cur = self.get_connection().cursor()
+        for start in range(0, len(expose_ids), self.PAGE_SIZE):
+            batch = expose_ids[start:start + self.PAGE_SIZE]
+            cur.execute('SELECT id FROM processed WHERE id IN (%s)' % ','.join('?' * len(batch)), batch)
+            found.update(row[0] for row in cur.fetchall())
+        return found
+
     def mark_processed(self, expose_id):
         """Mark an expose as processed in the database"""
         self.__log__.debug('mark_processed(%d)', expose_id)
-        cur = self.get_connection().cursor()
-        cur.execute('INSERT INTO processed VALUES(?)', (expose_id,))
-        self.get_connection().commit()
+        with metrics.DB_WRITE_SECONDS.time(operation='mark_processed'):
+            cur = self.get_connection().cursor()
+            cur.execute('INSERT INTO processed VALUES(?, ?)', (expose_id, datetime.datetime.now()))
+            self.get_connection().commit()
+        # Added after the row is committed, which Retention relies on when it prunes
+        if self.seen_set is not None:
+            self.seen_set.add(expose_id)
 
-    def save_expose(self, expose):
-        """Saves an expose to a database"""
+    def mark_if_new(self, expose_id):
+        """Mark an expose as processed, unless it already is. Returns true if it was new"""
+        if self.is_processed(expose_id):
+            return False
+        self.mark_processed(expose_id)
+        return True
+
+    def save_expose(self, expose, touch=True):
+        """Saves an expose to a database. The time the expose was first seen is kept
+           when it is saved again. An expose that is already saved is only written if
+           its significant fields changed; otherwise, with 'touch', the time it was
+           last seen is updated. Returns the status (NEW, UPDATED or UNCHANGED) and,
+           for updated exposes, the changed fields as {field: [old, new]}"""
+        expose_hash = content_hash(expose)
         cur = self.get_connection().cursor()
-        cur.execute('INSERT OR REPLACE INTO exposes(id, created, crawler, details) \
-                     VALUES (?, ?, ?, ?)',
-                    (int(expose['id']), datetime.datetime.now(),
-                     expose['crawler'], json.dumps(expose)))
-        self.get_connection().commit()
+        cur.execute('SELECT content_hash, details FROM exposes WHERE id = ? AND crawler = ?',
+                    (int(expose['id']), expose['crawler']))
+        row = cur.fetchone()
+        if row is not None:
+            # Rows saved before the hash existed have it computed from their details
+            stored_hash = row[0] if row[0] is not None else content_hash(json.loads(self.codec.decode(row[1])))
+            if stored_hash == expose_hash:
+                if touch:
+                    self.touch_exposes([expose])
+                return UNCHANGED, {}
+        price = parse_price(expose.get('price'))
+        size = parse_number(expose.get('size'))
+        rooms = parse_number(expose.get('rooms'))
+        pps = price / size if price is not None and size else None
+        now = datetime.datetime.now()
+        with metrics.DB_WRITE_SECONDS.time(operation='save_expose'):
+            cur.execute('INSERT INTO exposes(id, created, crawler, details, price, size, rooms, pps, \
+                                             first_seen, last_seen, content_hash) \
+                         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) \
+                         ON CONFLICT (id, crawler) DO UPDATE SET created = excluded.created, \
+                             details = excluded.details, price = excluded.price, size = excluded.size, \
+                             rooms = excluded.rooms, pps = excluded.pps, last_seen = excluded.last_seen, \
+                             content_hash = excluded.content_hash',
+                        (int(expose['id']), now, expose['crawler'],
+                         self.codec.encode(expose['crawler'], json.dumps(expose)),
+                         price, size, rooms, pps, now, now, expose_hash))
+            self.get_connection().commit()
+        if row is None:
+            return NEW, None
+        previous = json.loads(self.codec.decode(row[1]))
+        return UPDATED, {field: [previous.get(field), expose.get(field)] for field in SIGNIFICANT_FIELDS
+                         if previous.get(field) != expose.get(field)}
 
-    def get_exposes_since(self, min_datetime):
-        """Loads all exposes since the specified date"""
+    def touch_exposes(self, exposes):
+        """Marks saved exposes as seen again, in a single transaction"""
+        if not exposes:
+            return
+        now = datetime.datetime.now()
+        with metrics.DB_WRITE_SECONDS.time(operation='touch_exposes'):
+            cur = self.get_connection().cursor()
+            cur.executemany('UPDATE exposes SET created = ?, last_seen = ? WHERE id = ? AND crawler = ?',
+                            [(now, now, int(expose['id']), expose['crawler']) for expose in exposes])
+            self.get_connection().commit()
 
-        def row_to_expose(row):
-            obj = json.loads(row[2])
-            obj['created_at'] = row[0]
-            return obj
+    def get_exposes_since(self, min_datetime):
+        """Loads all exposes since the specified date, newest first"""
+        return list(self.iter_exposes_since(min_datetime))
 
-        cur = self.get_connection().cursor()
-        cur.execute('SELECT created, crawler, details FROM exposes \
-                     WHERE created >= ? ORDER BY created DESC', (min_datetime,))
-        return list(map(row_to_expose, cur.fetchall()))
+    def iter_exposes_since(self, min_datetime, page_size=PAGE_SIZE):
+        """Yields the exposes since the specified date, newest first. Rows are read
+           page by page along the index on the creation date"""
+        for created, _, _, details in self._iter_exposes(['created >= ?'], [min_datetime], page_size):
+            expose = json.loads(details)
+            expose['created_at'] = created
+            yield expose
 
     def get_recent_exposes(self, count, filter_set=None):
         """Returns up to 'count' recent exposes, filtered by the provided filter"""
-        cur = self.get_connection().cursor()
-        cur.execute('SELECT details FROM exposes ORDER BY created DESC')
-        res = []
-        next_batch = []
-        while len(res) < count:
-            if len(next_batch) == 0:
-                next_batch = cur.fetchmany()
-                if len(next_batch) == 0:
-                    break
-            expose = json.loads(next_batch.pop()[0])
+        return list(islice(self.iter_recent_exposes(filter_set, min(count, self.PAGE_SIZE)), count))
+
+    def iter_recent_exposes(self, filter_set=None, page_size=PAGE_SIZE):
+        """Yields the exposes newest first, filtered by the provided filter. Filters on
+           price, size and rooms are evaluated by the database, so that rows that do
+           not match are not decoded at all"""
+        clauses = []
+        params = []
+        if filter_set is not None:
+            predicates, filter_set = filter_set.split_predicates()
+            clauses, params = self._predicate_clauses(predicates)
+            if not filter_set.filters:
+                filter_set = None
+        for _, _, _, details in self._iter_exposes(clauses, params, page_size):
+            expose = json.loads(details)
             if filter_set is None or filter_set.is_interesting_expose(expose):
-                res.append(expose)
-        return res
+                yield expose
+
+    def _predicate_clauses(self, predicates):
+        """SQL clauses and parameters for (field, operator, value) conditions. The
+           conditions on a field are joined into one clause, in a form that can be
+           looked up in the field's index. Exposes that lack the value are not
+           excluded, as in the filters"""
+        conditions = {}
+        for field, operator, value in predicates:
+            if field not in self.FIELD_SQL or operator not in self.OPERATORS:
+                raise ValueError("Can not filter on %s %s in the database" % (field, operator))
+            conditions.setdefault(field, []).append((operator, value))
+        clauses = []
+        params = []
+        for field, field_conditions in conditions.items():
+            column = self._field_sql(field)
+            clauses.append('(%s OR %s IS NULL)' % (' AND '.join('%s %s ?' % (column, operator)
+                                                                for operator, _ in field_conditions), column))
+            params.extend(value for _, value in field_conditions)
+        return clauses, params
+
+    def _iter_exposes(self, clauses, params, page_size):
+        """Yields (created, id, crawler, details) rows matching the clauses, newest first,
+           with the details decompressed. Each page continues after the last row of the
+           previous one, rather than skipping an offset, so every page is a short range
+           scan of the index"""
+        last = None
+        while True:
+            page_clauses = list(clauses)
+            page_params = list(params)
+            if last is not None:
+                page_clauses.append('(created, id, crawler) < (?, ?, ?)')
+                page_params.extend(last)
+            where = ' WHERE ' + ' AND '.join(page_clauses) if page_clauses else ''
+            cur = self.get_connection().cursor()
+            cur.execute('SELECT created, id, crawler, details FROM exposes%s \
+                         ORDER BY created DESC, id DESC, crawler DESC LIMIT ?' % where,
+                        page_params + [page_size])
+            rows = cur.fetchall()
+            for created, expose_id, crawler, details in rows:
+                yield created, expose_id, crawler, self.codec.decode(details)
+            if len(rows) < page_size:
+                return
+            last = rows[-1][:3]
 
     def save_settings_for_user(self, user_id, settings):
         """Saves the user settings to the database"""
-        cur = self.get_connection().cursor()
-        cur.execute('INSERT OR REPLACE INTO users VALUES (?, ?)', (user_id, json.dumps(settings)))
-        self.get_connection().commit()
+        with metrics.DB_WRITE_SECONDS.time(operation='save_settings_for_user'):
+            cur = self.get_connection().cursor()
+            cur.execute('INSERT OR REPLACE INTO users VALUES (?, ?)', (user_id, json.dumps(settings)))
+            self.get_connection().commit()
 
     def get_settings_for_user(self, user_id):
         """Loads the settings for a user from the database"""
@@ -146,6 +502,58 @@ class IdMaintainer:
             res.append((row[0], json.loads(row[1])))
         return res
 
+    def get_user_settings_version(self):
+        """A number that changes whenever a user's settings are saved or removed"""
+        cur = self.get_connection().cursor()
+        cur.execute('SELECT version FROM users_version')
+        return cur.fetchone()[0]
+
+    def get_high_water_mark(self, url):
+        """Returns the ID of the newest expose seen when the URL was last crawled"""
+        cur = self.get_connection().cursor()
+        cur.execute('SELECT expose_id FROM crawl_marks WHERE url = ?', (url,))
+        row = cur.fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def set_high_water_mark(self, url, expose_id):
+        """Saves the ID of the newest expose seen for the URL"""
+        with metrics.DB_WRITE_SECONDS.time(operation='set_high_water_mark'):
+            cur = self.get_connection().cursor()
+            cur.execute('INSERT OR REPLACE INTO crawl_marks VALUES (?, ?, ?)',
+                        (url, expose_id, datetime.datetime.now()))
+            self.get_connection().commit()
+
+    def save_fingerprint(self, expose_id, crawler, address, rooms, size, price):
+        """Saves the fingerprint of an expose, for finding the same flat on other portals"""
+        with metrics.DB_WRITE_SECONDS.time(operation='save_fingerprint'):
+            cur = self.get_connection().cursor()
+            cur.execute('INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?, ?, ?, ?, ?)',
+                        (expose_id, crawler, address, rooms, size, price, datetime.datetime.now()))
+            self.get_connection().commit()
+
+    def expire_fingerprints(self, before, batch_size=BACKFILL_BATCH_SIZE):
+        """Deletes the fingerprints saved before the given time, in batches. Returns
+           the number deleted"""
+        deleted = 0
+        while True:
+            with metrics.DB_WRITE_SECONDS.time(operation='expire_fingerprints'):
+                cur = self.get_connection().cursor()
+                cur.execute('DELETE FROM fingerprints WHERE rowid IN \
+                             (SELECT rowid FROM fingerprints WHERE created < ? LIMIT ?)', (before, batch_size))
+                self.get_connection().commit()
+            deleted += cur.rowcount
+            if cur.rowcount < batch_size:
+                return deleted
+
+    def get_fingerprints(self, address, rooms):
+        """Loads the fingerprints of the exposes with the given address and number of rooms"""
+        cur = self.get_connection().cursor()
+        cur.execute('SELECT id, crawler, size, price FROM fingerprints WHERE address = ? AND rooms = ?',
+                    (address, rooms))
+        return [dict(id=row[0], crawler=row[1], size=row[2], price=row[3]) for row in cur.fetchall()]
+
     def get_last_run_time(self):
         """Returns the time of the last hunt"""
         cur = self.get_connection().cursor()
@@ -157,8 +565,9 @@ class IdMaintainer:
 
     def update_last_run_time(self):
         """Saves the time of the most recent hunt to the database"""
-        cur = self.get_connection().cursor()
-        result = datetime.datetime.now()
-        cur.execute('INSERT INTO executions VALUES(?);', (result,))
-        self.get_connection().commit()
+        with metrics.DB_WRITE_SECONDS.time(operation='update_last_run_time'):
+            cur = self.get_connection().cursor()
+            result = datetime.datetime.now()
+            cur.execute('INSERT INTO executions VALUES(?);', (result,))
+            self.get_connection().commit()
         return result
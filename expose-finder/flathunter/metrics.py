@@ -0,0 +1,221 @@
+"""Crawl metrics, and an HTTP endpoint that serves them in the Prometheus text format"""
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{%s}" % ",".join('%s="%s"' % (name, str(value).replace('\\', r'\\').replace('"', r'\"'))
+                             for name, value in pairs)
+
+
+def _format_value(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    """A value that only goes up, kept per combination of label values"""
+
+    kind = 'counter'
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.values = dict()
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        """Add to the counter"""
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels):
+        """The current value for the label values"""
+        return self.values.get(tuple(labels.get(name, '') for name in self.labels), 0)
+
+    def samples(self):
+        """Lines of the text exposition"""
+        with self.lock:
+            values = sorted(self.values.items())
+        for key, value in values:
+            yield "%s%s %s" % (self.name, _format_labels(self.labels, key), _format_value(value))
+
+
+class Histogram:
+    """Distribution of observed values, such as latencies in seconds"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, description, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self.values = dict()
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        """Record an observation"""
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * (len(self.buckets) + 1), 0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the number of seconds that the 'with' block takes"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels):
+        """Number of observations for the label values"""
+        counts, _ = self.values.get(tuple(labels.get(name, '') for name in self.labels), ([0], 0))
+        return sum(counts)
+
+    def samples(self):
+        """Lines of the text exposition"""
+        with self.lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self.values.items())
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                upper = '+Inf' if bound == float('inf') else _format_value(bound)
+                yield "%s_bucket%s %d" % (self.name, _format_labels(self.labels, key, [('le', upper)]),
+                                          cumulative)
+            yield "%s_sum%s %s" % (self.name, _format_labels(self.labels, key), repr(float(total)))
+            yield "%s_count%s %d" % (self.name, _format_labels(self.labels, key), cumulative)
+
+
+class Registry:
+    """Collection of metrics that are exposed together"""
+
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, description, labels=()):
+        """Create and register a counter"""
+        return self._register(Counter(name, description, labels))
+
+    def histogram(self, name, description, labels=(), buckets=DEFAULT_BUCKETS):
+        """Create and register a histogram"""
+        return self._register(Histogram(name, description, labels, buckets))
+
+    def _register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def exposition(self):
+        """All metrics in the Prometheus text format"""
+        lines = []
+        for metric in self.metrics:
+            lines.append("# HELP %s %s" % (metric.name, metric.description))
+            lines.append("# TYPE %s %s" % (metric.name, metric.kind))
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+FETCH_SECONDS = REGISTRY.histogram(
+    'flathunter_fetch_seconds', 'Time taken to fetch a page', ('crawler',))
+PAGES_FETCHED = REGISTRY.counter(
+    'flathunter_pages_fetched_total', 'Pages fetched', ('crawler',))
+BYTES_FETCHED = REGISTRY.counter(
+    'flathunter_bytes_fetched_total', 'Bytes of page content fetched', ('crawler',))
+PARSE_SECONDS = REGISTRY.histogram(
+    'flathunter_parse_seconds', 'Time taken to extract the exposes from a page', ('crawler',))
+EXPOSES_FOUND = REGISTRY.counter(
+    'flathunter_exposes_found_total', 'Exposes found on search pages', ('crawler',))
+EXPOSES_NEW = REGISTRY.counter(
+    'flathunter_exposes_new_total', 'Exposes that passed all filters', ('crawler',))
+EXPOSES_UPDATED = REGISTRY.counter(
+    'flathunter_exposes_updated_total', 'Known exposes whose details changed', ('crawler',))
+FILTER_REJECTIONS = REGISTRY.counter(
+    'flathunter_filter_rejections_total', 'Exposes rejected, by filter', ('filter',))
+DB_WRITE_SECONDS = REGISTRY.histogram(
+    'flathunter_db_write_seconds', 'Time taken by database writes', ('operation',))
+GMAPS_REQUESTS = REGISTRY.counter(
+    'flathunter_gmaps_requests_total', 'Google Maps distance matrix requests, by status', ('status',))
+STAGE_SECONDS = REGISTRY.histogram(
+    'flathunter_stage_seconds', 'Time spent in each processor of a crawl cycle', ('stage',))
+CYCLE_SECONDS = REGISTRY.histogram(
+    'flathunter_cycle_seconds', 'Duration of a complete crawl cycle',
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1200))
+
+
+def crawler_name(crawler):
+    """Label value for a crawler, e.g. 'immowelt' for CrawlImmowelt"""
+    name = type(crawler).__name__
+    if name.startswith('Crawl'):
+        name = name[len('Crawl'):]
+    return name.lower()
+
+
+def record_fetch(crawler, seconds, size):
+    """Record that the crawler fetched a page of 'size' bytes in 'seconds'"""
+    name = crawler_name(crawler)
+    FETCH_SECONDS.observe(seconds, crawler=name)
+    PAGES_FETCHED.inc(crawler=name)
+    BYTES_FETCHED.inc(size, crawler=name)
+
+
+class MetricsServer:
+    """Serves the metrics of a registry at /metrics, on a background thread"""
+    __log__ = logging.getLogger('flathunt')
+
+    def __init__(self, port, host='127.0.0.1', registry=REGISTRY):
+        self.registry = registry
+        registry_ref = registry
+
+        class Handler(BaseHTTPRequestHandler):
+            """Answers scrapes of the metrics endpoint"""
+
+            def do_GET(self):  # pylint: disable=invalid-name
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = registry_ref.exposition().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):  # pylint: disable=arguments-differ
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def port(self):
+        """The port the server listens on"""
+        return self.server.server_address[1]
+
+    def start(self):
+        """Start serving in the background"""
+        self.thread = threading.Thread(target=self.server.serve_forever, name='metrics', daemon=True)
+        self.thread.start()
+        self.__log__.info("Serving metrics at http://%s:%d/metrics", *self.server.server_address[:2])
+        return self
+
+    def stop(self):
+        """Stop serving"""
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,152 @@
+"""Pipelined execution of a processor chain, with the stages running on threads"""
+import heapq
+import logging
+import queue
+import threading
+
+_END = object()
+
+
+class _Failure:
+    """Carries an exception raised by a stage down to the consumer of the pipeline"""
+
+    def __init__(self, error):
+        self.error = error
+
+
+class _Stage:
+    """One processor, run by 'workers' threads that take exposes from the inbox and put
+       the results into the outbox. With 'preserve_order', results leave the stage in
+       the order their exposes arrived, even if the workers finish out of order"""
+
+    def __init__(self, pipeline, processor, inbox, outbox, workers, preserve_order):
+        self.pipeline = pipeline
+        self.processor = processor
+        self.inbox = inbox
+        self.outbox = outbox
+        self.workers = workers
+        self.preserve_order = preserve_order
+        self.lock = threading.Lock()
+        self.finished = []
+        self.next_seq = 0
+        self.out_seq = 0
+        self.running = workers
+
+    def start(self):
+        for idx in range(self.workers):
+            threading.Thread(target=self._work, daemon=True,
+                             name='%s-%d' % (type(self.processor).__name__, idx)).start()
+
+    def _work(self):
+        while True:
+            item = self.pipeline.get(self.inbox)
+            if item is None:
+                return
+            if item is _END:
+                # let the other workers of this stage see the end too
+                self.pipeline.put(self.inbox, _END)
+                with self.lock:
+                    self.running -= 1
+                    last = self.running == 0
+                if last:
+                    self.pipeline.put(self.outbox, _END)
+                return
+            seq, expose = item
+            if isinstance(expose, _Failure):
+                results = [expose]
+            else:
+                try:
+                    results = list(self.processor.process_exposes([expose]))
+                # pylint: disable=broad-except
+                except Exception as error:
+                    results = [_Failure(error)]
+            if not self._emit(seq, results):
+                return
+
+    def _emit(self, seq, results):
+        with self.lock:
+            if not self.preserve_order:
+                return self._put_all(results)
+            heapq.heappush(self.finished, (seq, results))
+            while self.finished and self.finished[0][0] == self.next_seq:
+                _, ready = heapq.heappop(self.finished)
+                self.next_seq += 1
+                if not self._put_all(ready):
+                    return False
+            return True
+
+    def _put_all(self, results):
+        for result in results:
+            if not self.pipeline.put(self.outbox, (self.out_seq, result)):
+                return False
+            self.out_seq += 1
+        return True
+
+
+class Pipeline:
+    """Runs the processors of a chain at the same time: each stage has its own
+       threads, and exposes move between the stages through bounded queues. Stages
+       whose processors are marked 'concurrent' get 'workers' threads, the others
+       get one, so that stateful processors see the exposes one at a time"""
+    __log__ = logging.getLogger('flathunt')
+
+    POLL_INTERVAL = 0.1
+
+    def __init__(self, processors, workers=4, queue_size=16, preserve_order=True):
+        self.processors = processors
+        self.workers = workers
+        self.queue_size = queue_size
+        self.preserve_order = preserve_order
+        self.cancelled = threading.Event()
+
+    def get(self, inbox):
+        """Take the next item from the queue. Returns None once the pipeline is cancelled"""
+        while not self.cancelled.is_set():
+            try:
+                return inbox.get(timeout=self.POLL_INTERVAL)
+            except queue.Empty:
+                continue
+        return None
+
+    def put(self, outbox, item):
+        """Put the item into the queue. Returns false once the pipeline is cancelled"""
+        while not self.cancelled.is_set():
+            try:
+                outbox.put(item, timeout=self.POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _feed(self, exposes, outbox):
+        seq = 0
+        try:
+            for expose in exposes:
+                if not self.put(outbox, (seq, expose)):
+                    return
+                seq += 1
+        # pylint: disable=broad-except
+        except Exception as error:
+            self.put(outbox, (seq, _Failure(error)))
+        self.put(outbox, _END)
+
+    def process(self, exposes):
+        """Run the exposes through all stages, yielding them as they come out of the last"""
+        inbox = queue.Queue(self.queue_size)
+        threading.Thread(target=self._feed, args=(exposes, inbox), daemon=True, name='pipeline-feed').start()
+        for processor in self.processors:
+            outbox = queue.Queue(self.queue_size)
+            workers = self.workers if getattr(processor, 'concurrent', False) else 1
+            _Stage(self, processor, inbox, outbox, workers, self.preserve_order).start()
+            inbox = outbox
+        try:
+            while True:
+                item = self.get(inbox)
+                if item is _END or item is None:
+                    return
+                _, expose = item
+                if isinstance(expose, _Failure):
+                    raise expose.error
+                yield expose
+        finally:
+            self.cancelled.set()
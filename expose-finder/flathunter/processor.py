@@ -1,4 +1,5 @@
 """Utility classes for building chains for processors"""
+import time
 from functools import reduce
 
 from flathunter.default_processors import AddressResolver
@@ -8,6 +9,9 @@ from flathunter.default_processors import LambdaProcessor
 from flathunter.expose_publisher import ExposePublisher
 from flathunter.gmaps_duration_processor import GMapsDurationProcessor
 from flathunter.idmaintainer import SaveAllExposesProcessor
+from flathunter.pipeline import Pipeline
+from flathunter.stage_timing import ChainTiming
+from flathunter.subscriptions import SubscriptionMatcher
 
 
 class ProcessorChainBuilder:
@@ -16,6 +20,10 @@ class ProcessorChainBuilder:
     def __init__(self, config):
         self.processors = []
         self.config = config
+        self.timed = False
+        self.profiled = False
+        self.clock = time.perf_counter
+        self.pipeline = None
 
     def publish_exposes(self, pubsub):
         self.processors.append(ExposePublisher(pubsub))
@@ -49,26 +57,62 @@ class ProcessorChainBuilder:
         self.processors.append(Filter(self.config, filter_set))
         return self
 
-    def save_all_exposes(self, id_watch):
-        """Add processor that saves all exposes to disk"""
-        self.processors.append(SaveAllExposesProcessor(self.config, id_watch))
+    def save_all_exposes(self, id_watch, pubsub=None):
+        """Add processor that saves all exposes to disk, and publishes changes to
+           known exposes if a pubsub is given"""
+        self.processors.append(SaveAllExposesProcessor(self.config, id_watch, pubsub))
+        return self
+
+    def match_subscriptions(self, subscriptions):
+        """Add processor that finds the users interested in each expose, if there are users.
+           The index is taken from a SubscriptionIndexCache"""
+        index = subscriptions.current()
+        if len(index) > 0:
+            self.processors.append(SubscriptionMatcher(index))
+        return self
+
+    def time_stages(self, profile=False, clock=time.perf_counter):
+        """Measure the time spent in each processor with the clock, and optionally
+           profile them"""
+        self.timed = True
+        self.profiled = profile
+        self.clock = clock
+        return self
+
+    def pipelined(self, workers=4, queue_size=16, preserve_order=True):
+        """Run the processors at the same time, on threads connected by queues"""
+        self.pipeline = dict(workers=workers, queue_size=queue_size, preserve_order=preserve_order)
         return self
 
     def build(self):
         """Build the processor chain"""
-        return ProcessorChain(self.processors)
+        if self.profiled and self.pipeline is not None:
+            raise ValueError("Stages can not be profiled in a pipeline, which runs them on several threads")
+        return ProcessorChain(self.processors, self.timed, self.profiled, self.pipeline, self.clock)
 
 
 class ProcessorChain:
     """Class to hold a chain of processors"""
 
-    def __init__(self, processors):
+    def __init__(self, processors, timed=False, profiled=False, pipeline=None, clock=time.perf_counter):
         self.processors = processors
+        self.timed = timed
+        self.profiled = profiled
+        self.pipeline = pipeline
+        self.clock = clock
+        self.timing = None
 
     def process(self, exposes):
-        """Process the sequences of exposes with the processor chain"""
+        """Process the sequences of exposes with the processor chain. If the chain is
+           timed, the timings of the stages are kept in 'timing'"""
+        processors = self.processors
+        if self.timed:
+            self.timing = ChainTiming(self.processors, self.profiled, self.clock)
+            processors = self.timing.stages
+        if self.pipeline is not None:
+            return Pipeline(processors, **self.pipeline).process(exposes)
         return reduce((lambda exposes, processor: processor.process_exposes(exposes)),
-                      self.processors, exposes)
+                      processors, exposes)
 
     @staticmethod
     def builder(config):
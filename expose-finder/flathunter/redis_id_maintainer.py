@@ -0,0 +1,261 @@
+"""Redis implementation of the IdMaintainer interface, for several finders sharing one state"""
+import datetime
+import json
+import logging
+from itertools import islice
+
+import redis
+
+from flathunter import metrics
+from flathunter.idmaintainer import NEW, SIGNIFICANT_FIELDS, UNCHANGED, UPDATED, content_hash
+from flathunter.string_utils import parse_number, parse_price
+
+# Compares the hash of an expose with the stored one and writes the expose only if it
+# changed, in one step, so that finders saving the same expose do not interfere.
+# KEYS: expose hash, index of exposes by time
+# ARGV: content hash, details, now, now as score, price, size, rooms, index member, touch
+SAVE_EXPOSE = """
+local stored = redis.call('HMGET', KEYS[1], 'content_hash', 'details')
+if stored[1] == ARGV[1] then
+    if ARGV[9] == '1' then
+        redis.call('HSET', KEYS[1], 'created', ARGV[3], 'last_seen', ARGV[3])
+        redis.call('ZADD', KEYS[2], ARGV[4], ARGV[8])
+    end
+    return {'unchanged'}
+end
+redis.call('HSET', KEYS[1], 'content_hash', ARGV[1], 'details', ARGV[2], 'created', ARGV[3],
+           'last_seen', ARGV[3], 'price', ARGV[5], 'size', ARGV[6], 'rooms', ARGV[7])
+redis.call('HSETNX', KEYS[1], 'first_seen', ARGV[3])
+redis.call('ZADD', KEYS[2], ARGV[4], ARGV[8])
+if stored[2] then
+    return {'updated', stored[2]}
+end
+return {'new'}
+"""
+
+
+def _timestamp(value):
+    """Seconds since the epoch of a datetime, or of a date as stored by SQLite"""
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value)
+    return value.timestamp()
+
+
+def _format(moment):
+    """A datetime as SQLite stores it"""
+    return moment.strftime('%Y-%m-%d %H:%M:%S.%f')
+
+
+def _text(value):
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+
+class RedisIdMaintainer:
+    """Redis back-end for the database. Processed IDs are a set, so that an ID is
+       marked and checked in one atomic SADD; exposes are hashes, indexed by time in
+       a sorted set. All keys start with 'prefix'"""
+    __log__ = logging.getLogger('flathunt')
+
+    PAGE_SIZE = 100
+
+    def __init__(self, client, prefix='flathunter:'):
+        self.client = client
+        self.prefix = prefix
+        self.save_script = client.register_script(SAVE_EXPOSE)
+
+    @staticmethod
+    def from_settings(settings):
+        """Connect to the Redis server of the settings"""
+        return RedisIdMaintainer(redis.Redis(settings.redis_host, settings.redis_port))
+
+    def _key(self, *parts):
+        return self.prefix + ':'.join(str(part) for part in parts)
+
+    def is_processed(self, expose_id):
+        """Returns true if an expose has already been processed"""
+        return bool(self.client.sismember(self._key('processed'), expose_id))
+
+    def get_processed(self, expose_ids):
+        """Returns the subset of the given IDs that have already been processed. The
+           IDs are checked in a single round trip"""
+        expose_ids = list(expose_ids)
+        pipeline = self.client.pipeline(transaction=False)
+        for expose_id in expose_ids:
+            pipeline.sismember(self._key('processed'), expose_id)
+        return set(expose_id for expose_id, seen in zip(expose_ids, pipeline.execute()) if seen)
+
+    def mark_processed(self, expose_id):
+        """Mark an expose as processed"""
+        self.mark_if_new(expose_id)
+
+    def mark_if_new(self, expose_id):
+        """Mark an expose as processed, unless it already is. Returns true if it was new.
+           Of several finders marking the same expose, exactly one sees it as new"""
+        with metrics.DB_WRITE_SECONDS.time(operation='mark_processed'):
+            return self.client.sadd(self._key('processed'), expose_id) == 1
+
+    def save_expose(self, expose, touch=True):
+        """Saves an expose, unless its significant fields are unchanged. Returns the
+           status (NEW, UPDATED or UNCHANGED) and, for updated exposes, the changed
+           fields as {field: [old, new]}"""
+        now = datetime.datetime.now()
+        member = '%s:%s' % (expose['crawler'], expose['id'])
+        numbers = [parse_price(expose.get('price')), parse_number(expose.get('size')),
+                   parse_number(expose.get('rooms'))]
+        with metrics.DB_WRITE_SECONDS.time(operation='save_expose'):
+            result = self.save_script(
+                keys=[self._key('expose', expose['crawler'], expose['id']), self._key('exposes')],
+                args=[content_hash(expose), json.dumps(expose), _format(now), now.timestamp()]
+                + ['' if number is None else number for number in numbers]
+                + [member, '1' if touch else '0'])
+        status = _text(result[0])
+        if status == UNCHANGED:
+            return UNCHANGED, {}
+        if status == NEW:
+            return NEW, None
+        previous = json.loads(_text(result[1]))
+        return UPDATED, {field: [previous.get(field), expose.get(field)] for field in SIGNIFICANT_FIELDS
+                         if previous.get(field) != expose.get(field)}
+
+    def touch_exposes(self, exposes):
+        """Marks saved exposes as seen again, in a single round trip"""
+        if not exposes:
+            return
+        now = datetime.datetime.now()
+        pipeline = self.client.pipeline(transaction=False)
+        for expose in exposes:
+            pipeline.hset(self._key('expose', expose['crawler'], expose['id']),
+                          mapping={'created': _format(now), 'last_seen': _format(now)})
+            pipeline.zadd(self._key('exposes'), {'%s:%s' % (expose['crawler'], expose['id']): now.timestamp()})
+        with metrics.DB_WRITE_SECONDS.time(operation='touch_exposes'):
+            pipeline.execute()
+
+    def get_exposes_since(self, min_datetime):
+        """Loads all exposes since the specified date, newest first"""
+        return list(self.iter_exposes_since(min_datetime))
+
+    def iter_exposes_since(self, min_datetime, page_size=PAGE_SIZE):
+        """Yields the exposes since the specified date, newest first"""
+        for created, details in self._iter_exposes(_timestamp(min_datetime), page_size):
+            expose = json.loads(details)
+            expose['created_at'] = created
+            yield expose
+
+    def get_recent_exposes(self, count, filter_set=None):
+        """Returns up to 'count' recent exposes, filtered by the provided filter"""
+        return list(islice(self.iter_recent_exposes(filter_set, min(count, self.PAGE_SIZE)), count))
+
+    def iter_recent_exposes(self, filter_set=None, page_size=PAGE_SIZE):
+        """Yields the exposes newest first, filtered by the provided filter"""
+        for _, details in self._iter_exposes('-inf', page_size):
+            expose = json.loads(details)
+            if filter_set is None or filter_set.is_interesting_expose(expose):
+                yield expose
+
+    def _iter_exposes(self, min_score, page_size):
+        """Yields (created, details) of the exposes newest first, a page at a time, with
+           the details of each page fetched in one round trip. Each page continues at
+           the lowest score of the previous one, rather than skipping an offset, so that
+           exposes moved up by touch_exposes in between do not shift the pages. Members
+           of the previous page with that score are left out"""
+        max_score = '+inf'
+        boundary = set()
+        while True:
+            members = self.client.zrevrangebyscore(self._key('exposes'), max_score, min_score,
+                                                   start=0, num=page_size + len(boundary), withscores=True)
+            page = [(_text(member), score) for member, score in members if _text(member) not in boundary]
+            pipeline = self.client.pipeline(transaction=False)
+            for member, _ in page:
+                crawler, expose_id = member.rsplit(':', 1)
+                pipeline.hmget(self._key('expose', crawler, expose_id), 'created', 'details')
+            for created, details in pipeline.execute():
+                if details is not None:
+                    yield _text(created), _text(details)
+            if len(members) < page_size + len(boundary):
+                return
+            last_score = page[-1][1]
+            if last_score != max_score:
+                boundary = set()
+            boundary.update(member for member, score in page if score == last_score)
+            max_score = last_score
+
+    def save_settings_for_user(self, user_id, settings):
+        """Saves the user settings"""
+        pipeline = self.client.pipeline()
+        pipeline.hset(self._key('users'), user_id, json.dumps(settings))
+        pipeline.incr(self._key('users_version'))
+        pipeline.execute()
+
+    def get_settings_for_user(self, user_id):
+        """Loads the settings for a user"""
+        settings = self.client.hget(self._key('users'), user_id)
+        if settings is None:
+            return None
+        return json.loads(settings)
+
+    def get_user_settings(self):
+        """Loads all users' settings"""
+        return [(int(user_id), json.loads(settings))
+                for user_id, settings in self.client.hgetall(self._key('users')).items()]
+
+    def get_user_settings_version(self):
+        """A number that changes whenever a user's settings are saved"""
+        return int(self.client.get(self._key('users_version')) or 0)
+
+    def get_high_water_mark(self, url):
+        """Returns the ID of the newest expose seen when the URL was last crawled"""
+        expose_id = self.client.hget(self._key('crawl_marks'), url)
+        if expose_id is None:
+            return None
+        return int(expose_id)
+
+    def set_high_water_mark(self, url, expose_id):
+        """Saves the ID of the newest expose seen for the URL"""
+        self.client.hset(self._key('crawl_marks'), url, expose_id)
+
+    def save_fingerprint(self, expose_id, crawler, address, rooms, size, price):
+        """Saves the fingerprint of an expose, for finding the same flat on other portals.
+           A sorted set records when each fingerprint was saved, for expiring it"""
+        pipeline = self.client.pipeline(transaction=False)
+        pipeline.hset(self._key('fingerprints', address, rooms), '%s:%s' % (crawler, expose_id),
+                      json.dumps({'size': size, 'price': price}))
+        pipeline.zadd(self._key('fingerprints_saved'),
+                      {json.dumps([address, rooms, crawler, expose_id]): datetime.datetime.now().timestamp()})
+        pipeline.execute()
+
+    def expire_fingerprints(self, before):
+        """Deletes the fingerprints saved before the given time. Returns the number deleted"""
+        deleted = 0
+        while True:
+            members = self.client.zrangebyscore(self._key('fingerprints_saved'), '-inf', _timestamp(before),
+                                                start=0, num=self.PAGE_SIZE)
+            if not members:
+                return deleted
+            pipeline = self.client.pipeline(transaction=False)
+            for member in members:
+                address, rooms, crawler, expose_id = json.loads(_text(member))
+                pipeline.hdel(self._key('fingerprints', address, rooms), '%s:%s' % (crawler, expose_id))
+            pipeline.zrem(self._key('fingerprints_saved'), *members)
+            pipeline.execute()
+            deleted += len(members)
+
+    def get_fingerprints(self, address, rooms):
+        """Loads the fingerprints of the exposes with the given address and number of rooms"""
+        fingerprints = []
+        for member, values in self.client.hgetall(self._key('fingerprints', address, rooms)).items():
+            crawler, expose_id = _text(member).rsplit(':', 1)
+            fingerprints.append(dict(json.loads(values), id=int(expose_id), crawler=crawler))
+        return fingerprints
+
+    def get_last_run_time(self):
+        """Returns the time of the last hunt"""
+        last_run = self.client.get(self._key('last_run'))
+        if last_run is None:
+            return None
+        return datetime.datetime.strptime(_text(last_run), '%Y-%m-%d %H:%M:%S.%f')
+
+    def update_last_run_time(self):
+        """Saves the time of the most recent hunt"""
+        result = datetime.datetime.now()
+        self.client.set(self._key('last_run'), _format(result))
+        return result
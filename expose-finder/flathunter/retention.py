@@ -0,0 +1,213 @@
+"""Pruning of old rows from the database, and the archive that old exposes are moved to"""
+import datetime
+import glob
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+
+from flathunter import metrics
+
+TIMESTAMP_FORMAT = '%Y%m%dT%H%M%S%f'
+
+
+def parse_timestamp(text):
+    """Reads a timestamp as stored by SQLite"""
+    return datetime.datetime.fromisoformat(text)
+
+
+class ExposeArchive:
+    """Exposes removed from the database, in gzip-compressed segment files of one JSON
+       object per line. Segments are only ever added, never changed; the name of each
+       records the oldest and newest creation time in it, so that queries skip the
+       segments outside the requested time range"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def write_segment(self, rows):
+        """Writes the (created, id, crawler, details) rows, oldest first, to a new
+           segment. Returns the path of the segment"""
+        os.makedirs(self.directory, exist_ok=True)
+        oldest = parse_timestamp(rows[0][0]).strftime(TIMESTAMP_FORMAT)
+        newest = parse_timestamp(rows[-1][0]).strftime(TIMESTAMP_FORMAT)
+        path = os.path.join(self.directory, 'exposes-%s-%s.jsonl.gz' % (oldest, newest))
+        suffix = 0
+        while os.path.exists(path):
+            suffix += 1
+            path = os.path.join(self.directory, 'exposes-%s-%s.%d.jsonl.gz' % (oldest, newest, suffix))
+        with gzip.open(path + '.tmp', 'wt', encoding='utf-8') as segment:
+            for created, expose_id, crawler, details in rows:
+                segment.write(json.dumps({'created': created, 'id': expose_id, 'crawler': crawler,
+                                          'details': details}, ensure_ascii=False) + '\n')
+        os.replace(path + '.tmp', path)
+        return path
+
+    def segments(self, min_datetime=None, max_datetime=None):
+        """The paths of the segments that may hold exposes created in the time range"""
+        paths = []
+        for path in sorted(glob.glob(os.path.join(self.directory, 'exposes-*.jsonl.gz'))):
+            oldest, newest = os.path.basename(path).split('.')[0].split('-')[1:3]
+            if max_datetime is not None and datetime.datetime.strptime(oldest, TIMESTAMP_FORMAT) > max_datetime:
+                continue
+            if min_datetime is not None and datetime.datetime.strptime(newest, TIMESTAMP_FORMAT) < min_datetime:
+                continue
+            paths.append(path)
+        return paths
+
+    def iter_exposes(self, min_datetime=None, max_datetime=None, filter_set=None):
+        """Yields the archived exposes created in the time range, oldest segment first,
+           filtered by the provided filter"""
+        for path in self.segments(min_datetime, max_datetime):
+            with gzip.open(path, 'rt', encoding='utf-8') as segment:
+                for line in segment:
+                    row = json.loads(line)
+                    created = parse_timestamp(row['created'])
+                    if min_datetime is not None and created < min_datetime:
+                        continue
+                    if max_datetime is not None and created > max_datetime:
+                        continue
+                    expose = json.loads(row['details'])
+                    expose['created_at'] = row['created']
+                    if filter_set is None or filter_set.is_interesting_expose(expose):
+                        yield expose
+
+
+class Retention:
+    """Removes rows older than the configured number of days from the database.
+       Exposes are moved to the archive first; executions, processed IDs and expose
+       fingerprints are deleted, and processed IDs are removed from the seen-set as
+       well. Work is done in batches, each in its own transaction, and the pages freed
+       are returned to the file system a few at a time"""
+    __log__ = logging.getLogger('flathunt')
+
+    BATCH_SIZE = 500
+
+    def __init__(self, id_watch, archive, exposes_days=None, executions_days=None, processed_days=None,
+                 vacuum_pages=1000, batch_size=BATCH_SIZE, clock=datetime.datetime.now):
+        self.id_watch = id_watch
+        self.archive = archive
+        self.exposes_days = exposes_days
+        self.executions_days = executions_days
+        self.processed_days = processed_days
+        self.vacuum_pages = vacuum_pages
+        self.batch_size = batch_size
+        self.clock = clock
+
+    @staticmethod
+    def from_settings(id_watch, settings):
+        """Retention as configured in the settings"""
+        return Retention(id_watch, ExposeArchive(settings.retention_archive_dir),
+                         exposes_days=settings.retention_exposes_days,
+                         executions_days=settings.retention_executions_days,
+                         processed_days=settings.retention_processed_days,
+                         vacuum_pages=settings.retention_vacuum_pages)
+
+    def _cutoff(self, days):
+        return self.clock() - datetime.timedelta(days=days)
+
+    def run(self):
+        """Prune all tables once. Returns the number of rows removed, by table"""
+        removed = {}
+        if self.exposes_days is not None:
+            cutoff = self._cutoff(self.exposes_days)
+            removed['exposes'] = self.archive_exposes(cutoff)
+            removed['fingerprints'] = self._delete('fingerprints', 'created', cutoff)
+        if self.executions_days is not None:
+            removed['executions'] = self._delete('executions', 'timestamp', self._cutoff(self.executions_days))
+        if self.processed_days is not None:
+            removed['processed'] = self.delete_processed(self._cutoff(self.processed_days))
+        self.vacuum()
+        self.__log__.info("Retention removed %s", removed)
+        return removed
+
+    def archive_exposes(self, cutoff):
+        """Moves the exposes created before the cutoff to the archive"""
+        connection = self.id_watch.get_connection()
+        archived = 0
+        while True:
+            rows = connection.execute('SELECT created, id, crawler, details, rowid FROM exposes \
+                                       WHERE created < ? ORDER BY created, id, crawler LIMIT ?',
+                                      (cutoff, self.batch_size)).fetchall()
+            if not rows:
+                return archived
+            # The segment is written before the rows are deleted: if the process dies in
+            # between, the rows are archived twice rather than lost
+            self.archive.write_segment([(created, expose_id, crawler, self.id_watch.decode_details(details))
+                                        for created, expose_id, crawler, details, _ in rows])
+            with metrics.DB_WRITE_SECONDS.time(operation='archive_exposes'):
+                connection.executemany('DELETE FROM exposes WHERE rowid = ?', [(row[4],) for row in rows])
+                connection.commit()
+            archived += len(rows)
+
+    def delete_processed(self, cutoff):
+        """Deletes the IDs processed before the cutoff, from the database and from the
+           seen-set, so that the two hold the same IDs"""
+        connection = self.id_watch.get_connection()
+        expired = set()
+        deleted = 0
+        while True:
+            rows = connection.execute('SELECT rowid, id FROM processed WHERE created < ? LIMIT ?',
+                                      (cutoff, self.batch_size)).fetchall()
+            if not rows:
+                break
+            with metrics.DB_WRITE_SECONDS.time(operation='retention_processed'):
+                connection.executemany('DELETE FROM processed WHERE rowid = ?', [(row[0],) for row in rows])
+                connection.commit()
+            expired.update(row[1] for row in rows)
+            deleted += len(rows)
+        seen_set = getattr(self.id_watch, 'seen_set', None)
+        if seen_set is not None and expired:
+            # IDs processed again since are still processed. They are looked up while
+            # the seen-set is locked, and mark_processed writes to the database before
+            # it adds to the seen-set, so an ID marked meanwhile is either found in the
+            # database or added again after the discard
+            seen_set.discard(expired, keep=self.id_watch.get_processed_in_database)
+        return deleted
+
+    def _delete(self, table, column, cutoff):
+        connection = self.id_watch.get_connection()
+        deleted = 0
+        while True:
+            with metrics.DB_WRITE_SECONDS.time(operation='retention_' + table):
+                cur = connection.execute('DELETE FROM %s WHERE rowid IN \
+                                          (SELECT rowid FROM %s WHERE %s < ? LIMIT ?)' % (table, table, column),
+                                         (cutoff, self.batch_size))
+                connection.commit()
+            deleted += cur.rowcount
+            if cur.rowcount < self.batch_size:
+                return deleted
+
+    def enable_incremental_vacuum(self):
+        """Databases created before incremental vacuuming was enabled have to be
+           rebuilt once to use it. The rebuild locks the database for as long as it
+           takes, so it is done when the finder starts, before it writes anything"""
+        connection = self.id_watch.get_connection()
+        if connection.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+            self.__log__.info("Enabling incremental vacuum, which rebuilds the database once")
+            connection.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            connection.execute('VACUUM')
+
+    def vacuum(self):
+        """Returns up to 'vacuum_pages' free pages to the file system"""
+        connection = self.id_watch.get_connection()
+        if connection.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+            self.__log__.debug("Incremental vacuum is not enabled, keeping the free pages")
+            return
+        # The pragma frees one page per row fetched
+        connection.execute('PRAGMA incremental_vacuum(%d)' % int(self.vacuum_pages)).fetchall()
+        connection.commit()
+
+    def start(self, interval=24 * 60 * 60):
+        """Prune the database on a background thread, every 'interval' seconds"""
+        def run_periodically():
+            while True:
+                try:
+                    self.run()
+                # pylint: disable=broad-except
+                except Exception as error:
+                    self.__log__.error("Retention failed: %s", error)
+                time.sleep(interval)
+        threading.Thread(target=run_periodically, name='retention', daemon=True).start()
@@ -0,0 +1,121 @@
+"""Adaptive scheduling of the configured searches"""
+import logging
+import random
+import time
+from urllib.parse import urlparse
+
+
+class DomainBudget:
+    """Token bucket that limits how often a portal is crawled. A portal with n
+       search URLs gets n crawls per interval, as many as the fixed loop makes, but
+       they can be spent on whichever of its searches are busiest"""
+
+    def __init__(self, capacity, period, now):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = float(capacity)
+        self.updated = now
+
+    def _refill(self, now):
+        if now <= self.updated:
+            return
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, now):
+        """Use up a crawl, if there is one left"""
+        self._refill(now)
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def drain(self, now):
+        """Give up all saved up crawls, and pause the portal for a whole period. Used
+           when the portal asked us to slow down"""
+        self.tokens = 0.0
+        self.updated = max(self.updated, now) + self.capacity / self.rate
+
+    def ready_at(self, now):
+        """The time at which the next crawl will be available"""
+        self._refill(now)
+        if self.tokens >= 1:
+            return now
+        return max(now, self.updated) + (1 - self.tokens) / self.rate
+
+
+class SearchSchedule:
+    """When a search URL is crawled next, and how often"""
+
+    def __init__(self, url, interval, next_run):
+        self.url = url
+        self.domain = urlparse(url).hostname
+        self.interval = interval
+        self.next_run = next_run
+
+
+class Scheduler:
+    """Decides which searches are due. Every search has its own interval, which
+       shrinks while the search keeps turning up new exposes and grows while it is
+       quiet or the portal rate-limits us, within [min_interval, max_interval].
+       Intervals are jittered, and each portal is held to its DomainBudget"""
+    __log__ = logging.getLogger('flathunt')
+
+    SPEED_UP = 0.5
+    SLOW_DOWN = 1.25
+    RATE_LIMITED_SLOW_DOWN = 4
+
+    def __init__(self, urls, interval, min_interval=None, max_interval=None, jitter=0.1,
+                 clock=time.monotonic, rand=random.random):
+        self.interval = interval
+        self.min_interval = min_interval if min_interval is not None else interval / 4
+        self.max_interval = max_interval if max_interval is not None else interval * 4
+        self.jitter = jitter
+        self.clock = clock
+        self.rand = rand
+        now = clock()
+        self.searches = {url: SearchSchedule(url, interval, now) for url in urls}
+        per_domain = dict()
+        for search in self.searches.values():
+            per_domain[search.domain] = per_domain.get(search.domain, 0) + 1
+        self.budgets = {domain: DomainBudget(count, interval, now) for domain, count in per_domain.items()}
+
+    @staticmethod
+    def from_settings(settings):
+        """Build a scheduler for the configured URLs and loop settings"""
+        return Scheduler(settings.urls, settings.loop_sleeping_time,
+                         settings.loop_min_interval, settings.loop_max_interval, settings.loop_jitter)
+
+    def due(self):
+        """The URLs that should be crawled now, most overdue first"""
+        now = self.clock()
+        urls = []
+        for search in sorted(self.searches.values(), key=lambda search: search.next_run):
+            if search.next_run > now:
+                break
+            if self.budgets[search.domain].try_take(now):
+                urls.append(search.url)
+        return urls
+
+    def record(self, url, new_exposes, rate_limited=False):
+        """Adjust the URL's interval to the outcome of its crawl, and schedule the next one"""
+        search = self.searches[url]
+        now = self.clock()
+        if rate_limited:
+            search.interval *= self.RATE_LIMITED_SLOW_DOWN
+            self.budgets[search.domain].drain(now)
+        elif new_exposes > 0:
+            search.interval *= self.SPEED_UP
+        else:
+            search.interval *= self.SLOW_DOWN
+        search.interval = min(self.max_interval, max(self.min_interval, search.interval))
+        search.next_run = now + search.interval * (1 + self.jitter * (2 * self.rand() - 1))
+        self.__log__.debug("Next crawl of %s in %.0f seconds", url, search.next_run - now)
+
+    def seconds_until_due(self):
+        """How long to wait until the next search can be crawled"""
+        now = self.clock()
+        if not self.searches:
+            return self.interval
+        return max(0.0, min(max(search.next_run, self.budgets[search.domain].ready_at(now))
+                            for search in self.searches.values()) - now)
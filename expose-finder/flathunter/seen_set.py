@@ -0,0 +1,151 @@
+"""On-disk set of the IDs of processed exposes, for starting without reading the database"""
+import logging
+import mmap
+import os
+import struct
+import threading
+from array import array
+from bisect import bisect_left
+
+MAGIC = b'FHSEEN01'
+# The IDs are stored in the machine's byte order, so that the snapshot can be used
+# as an array in place
+HEADER = struct.Struct('=8sQ')
+RECORD = struct.Struct('=q')
+
+
+class SeenSet:
+    """The IDs of processed exposes, kept in two files: a snapshot of sorted 64 bit
+       IDs, which is memory-mapped rather than read when the set is opened, and an
+       append-only log of the IDs added since. Membership is a binary search in the
+       snapshot or a lookup in the (small) set of logged IDs. Once the log holds
+       'compact_after' IDs, they are merged into a new snapshot.
+
+       The snapshot and the logged IDs are published together as one (snapshot,
+       delta) tuple. A compaction builds the next tuple on the side and swaps it in,
+       so readers do not take the lock and never see one without the other; the old
+       mapping is unmapped once the last reader lets go of it"""
+    __log__ = logging.getLogger('flathunt')
+
+    COMPACT_AFTER = 10000
+
+    def __init__(self, path, compact_after=COMPACT_AFTER):
+        self.snapshot_path = path + '.snapshot'
+        self.delta_path = path + '.delta'
+        self.compact_after = compact_after
+        self.lock = threading.Lock()
+        self.state = (self._open_snapshot(), self._read_delta())
+        self.delta_file = open(self.delta_path, 'ab')
+        if len(self.delta) >= self.compact_after:
+            self._compact()
+
+    @staticmethod
+    def exists(path):
+        """True if a snapshot has been written for the path"""
+        return os.path.exists(path + '.snapshot')
+
+    @property
+    def snapshot(self):
+        """The sorted IDs of the snapshot"""
+        return self.state[0]
+
+    @property
+    def delta(self):
+        """The IDs logged since the snapshot was written"""
+        return self.state[1]
+
+    def _open_snapshot(self):
+        if not os.path.exists(self.snapshot_path) or os.path.getsize(self.snapshot_path) <= HEADER.size:
+            return ()
+        with open(self.snapshot_path, 'rb') as file:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count = HEADER.unpack_from(mapped)
+        if magic != MAGIC or len(mapped) != HEADER.size + count * RECORD.size:
+            mapped.close()
+            raise ValueError("%s is not a seen-set snapshot" % self.snapshot_path)
+        # The view keeps the mapping alive for as long as anyone holds it
+        return memoryview(mapped)[HEADER.size:].cast('q')
+
+    def _read_delta(self):
+        if not os.path.exists(self.delta_path):
+            return set()
+        with open(self.delta_path, 'rb') as file:
+            data = file.read()
+        # A record cut short by a crash is dropped, so that new records are appended
+        # after the last whole one
+        usable = len(data) - len(data) % RECORD.size
+        if usable < len(data):
+            os.truncate(self.delta_path, usable)
+        return set(item[0] for item in RECORD.iter_unpack(data[:usable]))
+
+    def __contains__(self, expose_id):
+        snapshot, delta = self.state
+        if expose_id in delta:
+            return True
+        idx = bisect_left(snapshot, expose_id)
+        return idx < len(snapshot) and snapshot[idx] == expose_id
+
+    def __len__(self):
+        snapshot, delta = self.state
+        return len(snapshot) + len(delta)
+
+    def add(self, expose_id):
+        """Add an ID, appending it to the log"""
+        with self.lock:
+            if expose_id in self:
+                return
+            self.delta_file.write(RECORD.pack(expose_id))
+            self.delta_file.flush()
+            self.state[1].add(expose_id)
+            if len(self.state[1]) >= self.compact_after:
+                self._compact()
+
+    def update(self, expose_ids):
+        """Add many IDs at once, for building the set from the database"""
+        with self.lock:
+            self._compact(added=expose_ids)
+
+    def replace(self, expose_ids):
+        """Replace all IDs, for rebuilding the set from the database"""
+        with self.lock:
+            self._write(sorted(set(expose_ids)))
+
+    def discard(self, expose_ids, keep=None):
+        """Remove IDs, writing a new snapshot without them. 'keep', if given, is called
+           with the IDs while the set is locked, and returns those to keep after all,
+           so that no ID can be added in between"""
+        with self.lock:
+            removed = set(expose_ids)
+            if keep is not None and removed:
+                removed -= keep(removed)
+            self._compact(removed=removed)
+
+    def compact(self):
+        """Merge the logged IDs into a new snapshot, and empty the log"""
+        with self.lock:
+            self._compact()
+
+    def _compact(self, added=(), removed=()):
+        snapshot, delta = self.state
+        self._write(sorted(set(snapshot).union(delta, added).difference(removed)))
+
+    def _write(self, expose_ids):
+        merged = array('q', expose_ids)
+        temp_path = self.snapshot_path + '.tmp'
+        with open(temp_path, 'wb') as file:
+            file.write(HEADER.pack(MAGIC, len(merged)))
+            file.write(merged.tobytes())
+            file.flush()
+            os.fsync(file.fileno())
+        # The mapping of the old snapshot stays valid after the file is replaced
+        os.replace(temp_path, self.snapshot_path)
+        self.delta_file.close()
+        self.delta_file = open(self.delta_path, 'wb')
+        self.state = (self._open_snapshot(), set())
+        self.__log__.debug("Compacted seen-set to %d IDs", len(merged))
+
+    def close(self):
+        """Close the files"""
+        with self.lock:
+            self.state = ((), set())
+            self.delta_file.close()
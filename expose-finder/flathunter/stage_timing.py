@@ -0,0 +1,118 @@
+"""Timing of the individual processors of a lazily evaluated processor chain"""
+import cProfile
+import io
+import pstats
+import threading
+import time
+
+from flathunter import metrics
+
+
+class StageTimer:
+    """Wraps a processor to measure how long it takes and how many exposes pass
+       through it. The chain is evaluated lazily, so pulling an expose out of a stage
+       also runs all stages before it: the time spent waiting for upstream stages is
+       measured separately and subtracted, leaving the stage's own time. In a
+       pipeline, the stage gets one expose at a time, possibly on several threads at
+       once, and its time is the sum over the threads. With 'profile' set, a profiler
+       runs only while the stage itself is working; profiling needs the stages to run
+       on one thread"""
+
+    def __init__(self, processor, profile=False, clock=time.perf_counter):
+        self.processor = processor
+        self.clock = clock
+        self.name = type(processor).__name__
+        self.concurrent = getattr(processor, 'concurrent', False)
+        self.items_in = 0
+        self.items_out = 0
+        self.total_time = 0.0
+        self.upstream_time = 0.0
+        self.lock = threading.Lock()
+        self.profiler = cProfile.Profile() if profile else None
+
+    @property
+    def own_time(self):
+        """Seconds spent in this stage, excluding the stages before it"""
+        return max(0.0, self.total_time - self.upstream_time)
+
+    def process_exposes(self, exposes):
+        """Apply the processor to the exposes, timing each step"""
+        outflow = None
+        inflow = self._pull(exposes)
+        while True:
+            start = self.clock()
+            self._resume_profiler()
+            try:
+                if outflow is None:
+                    outflow = iter(self.processor.process_exposes(inflow))
+                expose = next(outflow)
+            except StopIteration:
+                return
+            finally:
+                self._pause_profiler()
+                with self.lock:
+                    self.total_time += self.clock() - start
+            with self.lock:
+                self.items_out += 1
+            yield expose
+
+    def _pull(self, exposes):
+        upstream = iter(exposes)
+        while True:
+            self._pause_profiler()
+            start = self.clock()
+            try:
+                expose = next(upstream)
+            except StopIteration:
+                return
+            finally:
+                with self.lock:
+                    self.upstream_time += self.clock() - start
+                self._resume_profiler()
+            with self.lock:
+                self.items_in += 1
+            yield expose
+
+    def _resume_profiler(self):
+        if self.profiler is not None:
+            self.profiler.enable()
+
+    def _pause_profiler(self):
+        if self.profiler is not None:
+            self.profiler.disable()
+
+    def profile_report(self, limit=15):
+        """The functions this stage spent the most time in"""
+        if self.profiler is None:
+            return None
+        out = io.StringIO()
+        pstats.Stats(self.profiler, stream=out).sort_stats('cumulative').print_stats(limit)
+        return out.getvalue()
+
+
+class ChainTiming:
+    """Timers for all stages of one run of a processor chain"""
+
+    def __init__(self, processors, profile=False, clock=time.perf_counter):
+        self.stages = [StageTimer(processor, profile, clock) for processor in processors]
+
+    @property
+    def slowest(self):
+        """The stage that took the most time of its own"""
+        return max(self.stages, key=lambda stage: stage.own_time, default=None)
+
+    def record_metrics(self):
+        """Add the stage timings to the crawl metrics"""
+        for stage in self.stages:
+            metrics.STAGE_SECONDS.observe(stage.own_time, stage=stage.name)
+
+    def summary(self):
+        """A table of the stages, with the exposes in and out and the time spent"""
+        lines = ["%-28s %6s %6s %9s" % ("stage", "in", "out", "seconds")]
+        for stage in self.stages:
+            lines.append("%-28s %6d %6d %9.3f" % (stage.name, stage.items_in, stage.items_out, stage.own_time))
+        slowest = self.slowest
+        if slowest is not None and slowest.profiler is not None:
+            lines.append("Profile of the slowest stage, %s:" % slowest.name)
+            lines.append(slowest.profile_report())
+        return "\n".join(lines)
@@ -1,4 +1,25 @@
+import re
+
+NUMBER_PATTERN = re.compile(r'\d+([\.,]\d+)?')
+
+
 def remove_prefix(text, prefix):
     if text and text.startswith(prefix):
         return text[len(prefix):]
     return text
+
+
+def parse_price(text):
+    """Reads the first number from a price text, where '.' separates thousands"""
+    match = NUMBER_PATTERN.search(text or "")
+    if match is None:
+        return None
+    return float(match[0].replace(".", "").replace(",", "."))
+
+
+def parse_number(text):
+    """Reads the first number from a text such as a size or number of rooms"""
+    match = NUMBER_PATTERN.search(text or "")
+    if match is None:
+        return None
+    return float(match[0].replace(",", "."))
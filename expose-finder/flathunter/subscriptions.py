@@ -0,0 +1,197 @@
+"""Index of all users' filter settings, for finding the users interested in an expose"""
+import math
+import re
+from bisect import bisect_right
+
+from flathunter.abstract_processor import Processor
+from flathunter.aho_corasick import AhoCorasick
+from flathunter.filter import ExposeHelper, is_plain_term
+
+# (dimension, setting for the lower bound, setting for the upper bound)
+BOUNDS = [
+    ('price', 'min_price', 'max_price'),
+    ('size', 'min_size', 'max_size'),
+    ('rooms', 'min_rooms', 'max_rooms'),
+    ('pps', None, 'max_price_per_square'),
+]
+
+
+# The positions of the bits set in each byte value
+BYTE_BITS = [tuple(bit for bit in range(8) if value >> bit & 1) for value in range(256)]
+
+
+def bits_of(mask):
+    """The positions of the bits set in the mask. The mask is converted to bytes once,
+       as shifting the bits out of a mask of many users copies it for every bit"""
+    data = mask.to_bytes((mask.bit_length() + 7) // 8, 'little')
+    return [base + bit
+            for base, byte in zip(range(0, len(data) * 8, 8), data) if byte
+            for bit in BYTE_BITS[byte]]
+
+
+def mask_of(bits):
+    """The mask with the given bits set. Setting them one by one on an integer would
+       copy the mask for every bit"""
+    buffer = bytearray((max(bits, default=-1) + 8) // 8)
+    for bit in bits:
+        buffer[bit >> 3] |= 1 << (bit & 7)
+    return int.from_bytes(buffer, 'little')
+
+
+class PrefixMasks:
+    """Bit masks of the first n entries of a sorted list of users. A mask is stored for
+       every CHECKPOINT-th position only, and the entries since the last checkpoint are
+       added when looking one up. For N users this takes N²/64 bits rather than the N²
+       of a mask per position, about 5 MB for 50,000 users"""
+    CHECKPOINT = 64
+
+    def __init__(self, entries):
+        entries = sorted(entries)
+        self.keys = [key for key, _ in entries]
+        self.bits = [bit for _, bit in entries]
+        self.checkpoints = [0]
+        # The bits are set in a buffer, so that only the checkpoints are built as integers
+        mask = bytearray((max(self.bits, default=0) + 8) // 8)
+        for idx, bit in enumerate(self.bits, 1):
+            mask[bit >> 3] |= 1 << (bit & 7)
+            if idx % self.CHECKPOINT == 0:
+                self.checkpoints.append(int.from_bytes(mask, 'little'))
+
+    def up_to(self, key):
+        """The mask of the users whose key is at most 'key'"""
+        count = bisect_right(self.keys, key)
+        mask = self.checkpoints[count // self.CHECKPOINT]
+        for idx in range(count - count % self.CHECKPOINT, count):
+            mask |= 1 << self.bits[idx]
+        return mask
+
+
+class IntervalIndex:
+    """Finds the users whose [low, high] interval on one dimension contains a value"""
+
+    def __init__(self, intervals):
+        unbounded = []
+        lows = []
+        highs = []
+        for bit, low, high in intervals:
+            if low == -math.inf and high == math.inf:
+                unbounded.append(bit)
+                continue
+            lows.append((low, bit))
+            highs.append((-high, bit))
+        self.unbounded = mask_of(unbounded)
+        self.lows = PrefixMasks(lows)
+        self.highs = PrefixMasks(highs)
+
+    def containing(self, value):
+        """The mask of the users that accept the value"""
+        return self.unbounded | (self.lows.up_to(value) & self.highs.up_to(-value))
+
+
+class TitleIndex:
+    """Finds the users that exclude a title. The plain terms of all users are combined
+       into one automaton; terms that use regex syntax are matched one by one"""
+
+    def __init__(self, exclusions):
+        literals = {}
+        patterns = {}
+        for bit, terms in exclusions:
+            for term in terms:
+                target = literals if is_plain_term(term) else patterns
+                target.setdefault(term, []).append(bit)
+        self.literal_masks = [mask_of(bits) for bits in literals.values()]
+        self.automaton = AhoCorasick(literals.keys())
+        self.patterns = [(re.compile(pattern), mask_of(bits)) for pattern, bits in patterns.items()]
+
+    def excluding(self, title):
+        """The mask of the users that exclude the (lowercase) title"""
+        mask = 0
+        for idx in self.automaton.matches(title):
+            mask |= self.literal_masks[idx]
+        for pattern, pattern_mask in self.patterns:
+            if pattern_mask & ~mask and pattern.search(title):
+                mask |= pattern_mask
+        return mask
+
+
+class SubscriptionIndex:
+    """All users' filters, compiled so that the users interested in an expose are found
+       without evaluating each user's filters in turn. The settings have the layout of
+       the 'filters' section of the config file"""
+
+    def __init__(self, user_settings):
+        self.user_ids = []
+        intervals = {dimension: [] for dimension, _, _ in BOUNDS}
+        exclusions = []
+        for user_id, settings in user_settings:
+            bit = len(self.user_ids)
+            self.user_ids.append(user_id)
+            filters = (settings or {}).get('filters') or {}
+            for dimension, low_key, high_key in BOUNDS:
+                # A bound set to null in the settings does not restrict the user
+                low = filters.get(low_key) if low_key else None
+                high = filters.get(high_key)
+                intervals[dimension].append((bit, -math.inf if low is None else low,
+                                             math.inf if high is None else high))
+            titles = list((settings or {}).get('excluded_titles') or []) \
+                + list(filters.get('excluded_titles') or [])
+            if titles:
+                exclusions.append((bit, titles))
+        self.everyone = (1 << len(self.user_ids)) - 1
+        self.intervals = {dimension: IntervalIndex(entries) for dimension, entries in intervals.items()}
+        self.titles = TitleIndex(exclusions)
+
+    @staticmethod
+    def from_id_maintainer(id_watch):
+        """Build the index from the user settings in the database"""
+        return SubscriptionIndex(id_watch.get_user_settings())
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def interested_users(self, expose):
+        """The IDs of the users whose filters accept the expose"""
+        mask = self.everyone
+        price = ExposeHelper.get_price(expose)
+        size = ExposeHelper.get_size(expose)
+        values = {
+            'price': price,
+            'size': size,
+            'rooms': ExposeHelper.get_rooms(expose),
+            'pps': price / size if price is not None and size else None,
+        }
+        for dimension, value in values.items():
+            if value is not None and mask:
+                mask &= self.intervals[dimension].containing(value)
+        if mask and expose.get('title') is not None:
+            mask &= ~self.titles.excluding(expose['title'].lower())
+        return [self.user_ids[bit] for bit in bits_of(mask)]
+
+
+class SubscriptionIndexCache:
+    """Builds the index from the user settings in the database, and only builds it again
+       once the settings have changed"""
+
+    def __init__(self, id_watch):
+        self.id_watch = id_watch
+        self.version = None
+        self.index = None
+
+    def current(self):
+        """The index of the users' current settings"""
+        version = self.id_watch.get_user_settings_version()
+        if self.index is None or version != self.version:
+            self.index = SubscriptionIndex.from_id_maintainer(self.id_watch)
+            self.version = version
+        return self.index
+
+
+class SubscriptionMatcher(Processor):
+    """Processor that lists the users interested in each expose under 'subscribers'"""
+
+    def __init__(self, index):
+        self.index = index
+
+    def process_expose(self, expose):
+        expose['subscribers'] = self.index.interested_users(expose)
+        return expose
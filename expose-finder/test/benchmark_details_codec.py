@@ -0,0 +1,66 @@
+"""Compares the size of the database and the speed of reading exposes back with the
+   details stored as plain JSON text and compressed. Run with
+
+   python -m test.benchmark_details_codec [number of exposes]
+"""
+import datetime
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+from flathunter.config import Config
+from flathunter.crawlers.crawl_immobilienscout import CrawlImmobilienscout
+from flathunter.idmaintainer import IdMaintainer
+
+FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures', 'immo-scout-IS24-object.json')
+
+
+def sample_exposes(count):
+    """Exposes as the IS24 crawler extracts them, varied to the requested count"""
+    with open(FIXTURE) as fixture:
+        entries = CrawlImmobilienscout(Config(string="urls: []")).get_entries_from_json(json.load(fixture))
+    rand = random.Random(1)
+    for idx in range(count):
+        expose = dict(entries[idx % len(entries)])
+        expose['id'] = 100000000 + idx
+        expose['url'] = "https://www.immobilienscout24.de/expose/%d" % expose['id']
+        expose['price'] = str(rand.randrange(400, 3000))
+        yield expose
+
+
+def save_plain(id_watch, expose):
+    """Saves the details as JSON text, as before they were compressed"""
+    id_watch.get_connection().execute(
+        'INSERT INTO exposes (id, created, crawler, details) VALUES (?, ?, ?, ?)',
+        (expose['id'], datetime.datetime.now(), expose['crawler'], json.dumps(expose)))
+
+
+def measure(name, save, count):
+    with tempfile.TemporaryDirectory() as directory:
+        db_name = os.path.join(directory, 'processed_ids.db')
+        id_watch = IdMaintainer(db_name)
+        for expose in sample_exposes(count):
+            save(id_watch, expose)
+        id_watch.get_connection().commit()
+        id_watch.get_connection().execute('VACUUM')
+        size = os.path.getsize(db_name)
+        details = id_watch.get_connection().execute('SELECT sum(length(details)) FROM exposes').fetchone()[0]
+        reader = IdMaintainer(db_name)
+        start = time.perf_counter()
+        read = sum(1 for _ in reader.iter_exposes_since(datetime.datetime(2000, 1, 1)))
+        seconds = time.perf_counter() - start
+        print("%-12s %10d bytes in the database, %10d in details, %10.0f exposes read/s"
+              % (name, size, details, read / seconds))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    measure("plain", save_plain, count)
+    measure("compressed", lambda id_watch, expose: id_watch.save_expose(expose), count)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from flathunter.config import Config
+from flathunter.crawlers import CaptchaPending
+from flathunter.crawlers.captcha import captcha_service
+from flathunter.crawlers.captcha.captcha_service import CaptchaService, SolvedSessions
+from flathunter.crawlers.captcha.twocaptcha import CaptchaError, CaptchaTimeout, TwoCaptchaApi
+from flathunter.hunter import Hunter
+
+
+class FakeSolverApi(BaseHTTPRequestHandler):
+    """Stand-in for the 2captcha API: the captcha is solved after a number of polls"""
+    polls_until_ready = 2
+    polls = 0
+
+    def do_POST(self):
+        query = parse_qs(urlparse(self.path).query)
+        self._answer('OK|42' if query['key'] == ['KEY'] else 'ERROR_WRONG_USER_KEY')
+
+    def do_GET(self):
+        FakeSolverApi.polls += 1
+        self._answer('OK|TOKEN' if FakeSolverApi.polls > self.polls_until_ready else 'CAPCHA_NOT_READY')
+
+    def _answer(self, text):
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(text)))
+        self.end_headers()
+        self.wfile.write(text.encode())
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def solver_url():
+    FakeSolverApi.polls = 0
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeSolverApi)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield 'http://127.0.0.1:%d' % server.server_address[1]
+    server.shutdown()
+
+
+def test_polls_until_solved(solver_url):
+    api = TwoCaptchaApi('KEY', base_url=solver_url, initial_delay=0, poll_interval=0.01)
+    assert api.solve('site-key', 'https://example.com') == 'TOKEN'
+    assert FakeSolverApi.polls == 3
+
+
+def test_solves_in_the_background(solver_url):
+    api = TwoCaptchaApi('KEY', base_url=solver_url, initial_delay=0, poll_interval=0.01)
+    solution = api.solve_async('site-key', 'https://example.com')
+    assert solution.result(timeout=5) == 'TOKEN'
+
+
+def test_gives_up_at_deadline(solver_url):
+    FakeSolverApi.polls_until_ready = 1000
+    try:
+        api = TwoCaptchaApi('KEY', base_url=solver_url, initial_delay=0, poll_interval=0.05, timeout=0.2)
+        start = time.monotonic()
+        with pytest.raises(CaptchaTimeout):
+            api.solve('site-key', 'https://example.com')
+        assert time.monotonic() - start < 1
+    finally:
+        FakeSolverApi.polls_until_ready = 2
+
+
+def test_rejected_captcha_raises(solver_url):
+    api = TwoCaptchaApi('WRONG', base_url=solver_url, initial_delay=0, poll_interval=0.01)
+    with pytest.raises(CaptchaError):
+        api.solve('site-key', 'https://example.com')
+
+
+class FakeDriver:
+
+    def __init__(self, page_source, cookies=None):
+        self.page_source = page_source
+        self.current_url = 'https://www.immobilienscout24.de/Suche'
+        self.cookies = list(cookies or [])
+        self.refreshed = 0
+
+    def get_cookies(self):
+        return list(self.cookies)
+
+    def add_cookie(self, cookie):
+        self.cookies.append(cookie)
+
+    def refresh(self):
+        self.refreshed += 1
+        if any(cookie['name'] == 'solved' for cookie in self.cookies):
+            self.page_source = '<html>results</html>'
+
+
+class FakeSolver:
+    """Solves captchas straight away, unless it is handed a future to wait for"""
+
+    def __init__(self, driver, solution=None):
+        self.driver = driver
+        self.solution = solution
+
+    def request_solution(self, api_key):
+        if self.solution is not None:
+            return self.solution
+        solution = Future()
+        solution.set_result('TOKEN')
+        return solution
+
+    def submit_solution(self, recaptcha_answer):
+        self.driver.cookies.append({'name': 'solved', 'value': recaptcha_answer})
+        self.driver.page_source = '<html>results</html>'
+
+
+@pytest.fixture
+def solves(monkeypatch):
+    solved = []
+
+    def get_captcha_solver(driver, checkbox, api=None):
+        solved.append(driver)
+        return FakeSolver(driver, getattr(driver, 'solution', None))
+
+    monkeypatch.setattr(captcha_service, 'get_captcha_solver', get_captcha_solver)
+    return solved
+
+
+def test_page_without_captcha_is_not_solved(solves):
+    service = CaptchaService('KEY')
+    start = time.monotonic()
+    service.ensure_solved(FakeDriver('<html>results</html>'))
+    assert time.monotonic() - start < 0.5
+    assert solves == []
+
+
+def test_solved_session_is_reused(solves):
+    service = CaptchaService('KEY')
+    service.ensure_solved(FakeDriver('<div class="g-recaptcha"></div>'))
+    other_driver = FakeDriver('<div class="g-recaptcha"></div>')
+    service.ensure_solved(other_driver)
+    assert len(solves) == 1
+    assert other_driver.refreshed == 1
+    assert other_driver.page_source == '<html>results</html>'
+
+
+def test_expired_session_is_solved_again(solves):
+    now = [0]
+    service = CaptchaService('KEY', sessions=SolvedSessions(max_age=60, clock=lambda: now[0]))
+    service.ensure_solved(FakeDriver('<div class="g-recaptcha"></div>'))
+    now[0] = 61
+    service.ensure_solved(FakeDriver('<div class="g-recaptcha"></div>'))
+    assert len(solves) == 2
+
+
+def test_page_is_held_up_until_the_captcha_is_solved(solves):
+    service = CaptchaService('KEY')
+    driver = FakeDriver('<div class="g-recaptcha"></div>')
+    driver.solution = Future()
+    with pytest.raises(CaptchaPending) as pending:
+        service.ensure_solved(driver)
+    with pytest.raises(CaptchaPending):
+        service.ensure_solved(driver)
+    pending.value.solution.set_result('TOKEN')
+    service.ensure_solved(driver)
+    assert driver.page_source == '<html>results</html>'
+    assert driver.cookies == [{'name': 'solved', 'value': 'TOKEN'}]
+
+
+class HeldUpCrawler:
+    """Crawler whose first URL shows a captcha on the first visit"""
+
+    def __init__(self, solution):
+        self.solution = solution
+        self.crawled = []
+
+    def crawl(self, url, max_pages=None, id_watch=None):
+        self.crawled.append(url)
+        if url.endswith('captcha') and not self.solution.done():
+            raise CaptchaPending(url, self.solution)
+        yield {'id': len(self.crawled), 'url': url}
+
+
+def test_hunter_crawls_other_urls_while_a_captcha_is_solved():
+    solution = Future()
+    crawler = HeldUpCrawler(solution)
+    config = Config(string="urls:\n  - https://example.com/captcha\n  - https://example.com/other\n")
+    exposes = Hunter(config, [crawler], None).crawl_for_exposes()
+    assert next(exposes)['url'] == 'https://example.com/other'
+    threading.Timer(0.05, solution.set_result, ['TOKEN']).start()
+    assert next(exposes)['url'] == 'https://example.com/captcha'
+    assert list(exposes) == []
+    assert crawler.crawled == ['https://example.com/captcha', 'https://example.com/other', 'https://example.com/captcha']
@@ -1,3 +1,4 @@
+import copy
 import json
 import os
 
@@ -5,6 +6,8 @@ import pytest
 
 from flathunter.config import Config
 from flathunter.crawlers.crawl_immobilienscout import CrawlImmobilienscout
+from flathunter.crawlers.driver_pool import DriverPool
+from flathunter.idmaintainer import IdMaintainer
 from test.crawlers.crawler_test_helpers import common_entry_assertions, common_expose_assertions
 
 DUMMY_CONFIG = """
@@ -15,6 +18,10 @@ urls:
 TEST_URL = 'https://www.immobilienscout24.de/Suche/de/berlin/berlin/wohnung-mieten?numberofrooms=2.0-&price=-1500.0&livingspace=70.0-&sorting=2&pagenumber=1'
 
 
+FIXTURE = os.path.join(os.path.dirname(os.path.realpath(__file__)), "../fixtures",
+                       "immo-scout-IS24-object.json")
+
+
 @pytest.fixture
 def crawler():
     return CrawlImmobilienscout(Config(string=DUMMY_CONFIG))
@@ -22,11 +29,11 @@ def crawler():
 
 @pytest.mark.crawler
 def test_parse_exposes_from_json(crawler):
-    with open(os.path.join(os.path.dirname(os.path.realpath(__file__)), "../fixtures",
-                           "immo-scout-IS24-object.json")) as fixture:
+    with open(FIXTURE) as fixture:
         data = json.load(fixture)
     entries = crawler.get_entries_from_json(data)
     assert len(entries) > 0
+    assert crawler.get_result_count_from_json(data) == 34
 
 
 @pytest.mark.crawler
@@ -47,3 +54,130 @@ def get_entries(crawler):
     soup = crawler.get_page(TEST_URL, page_no=1)
     entries = crawler.extract_data(soup)
     return entries
+
+
+def fake_pages(crawler, page_sizes, no_of_results):
+    """Let the crawler see pages of the given sizes, without going to the network"""
+    requested = []
+
+    def get_page(search_url, driver=None, page_no=None):
+        requested.append(page_no)
+        return page_no
+
+    def extract_data(page_no):
+        if page_no > len(page_sizes):
+            return []
+        return [{'id': page_no * 100 + idx} for idx in range(page_sizes[page_no - 1])]
+
+    crawler.get_page = get_page
+    crawler.extract_data = extract_data
+    crawler.get_result_count = lambda soup: no_of_results
+    return requested
+
+
+def test_fetches_remaining_pages(crawler):
+    requested = fake_pages(crawler, [20, 20, 20], 60)
+    crawler.result_limit = 100
+    entries = list(crawler.crawl(TEST_URL))
+    assert len(entries) == 60
+    assert len(set(entry['id'] for entry in entries)) == 60
+    assert sorted(requested) == [1, 2, 3]
+
+
+def test_respects_result_limit(crawler):
+    requested = fake_pages(crawler, [20, 20, 20, 20], 80)
+    crawler.result_limit = 30
+    entries = list(crawler.crawl(TEST_URL))
+    assert len(entries) == 30
+    assert sorted(requested) == [1, 2]
+
+
+def test_respects_max_pages(crawler):
+    requested = fake_pages(crawler, [20, 20, 20, 20], 80)
+    crawler.result_limit = 100
+    entries = list(crawler.crawl(TEST_URL, max_pages=2))
+    assert len(entries) == 40
+    assert sorted(requested) == [1, 2]
+
+
+def test_keeps_first_page_without_result_count(crawler):
+    requested = fake_pages(crawler, [20, 20], 0)
+    crawler.result_limit = 100
+    entries = list(crawler.crawl(TEST_URL))
+    assert len(entries) == 20
+    assert requested == [1]
+
+
+def test_stops_at_empty_page(crawler):
+    fake_pages(crawler, [20, 20], 100)
+    crawler.result_limit = 100
+    entries = list(crawler.crawl(TEST_URL))
+    assert len(entries) == 40
+
+
+def test_incremental_crawl_stops_at_known_page(crawler):
+    requested = fake_pages(crawler, [20, 20, 20, 20], 80)
+    crawler.result_limit = 100
+    id_watch = IdMaintainer(":memory:")
+    for expose_id in range(300, 320):
+        id_watch.mark_processed(expose_id)
+    entries = list(crawler.crawl(TEST_URL, id_watch=id_watch))
+    assert len(entries) == 60
+    assert requested == [1, 2, 3]
+
+
+def test_incremental_crawl_stops_at_high_water_mark(crawler):
+    id_watch = IdMaintainer(":memory:")
+    fake_pages(crawler, [20, 20, 20, 20], 80)
+    crawler.result_limit = 100
+    assert len(list(crawler.crawl(TEST_URL, id_watch=id_watch))) == 80
+
+    requested = fake_pages(crawler, [20, 20, 20, 20], 80)
+    entries = list(crawler.crawl(TEST_URL, id_watch=id_watch))
+    assert len(entries) == 20
+    assert requested == [1]
+
+
+class FakeJsonDriver:
+    """Web driver that serves the IS24 fixture as the first page of results, and the
+       last 14 of its entries with other IDs as the second page"""
+
+    def __init__(self):
+        with open(FIXTURE) as fixture:
+            first_page = json.load(fixture)['resultList']
+        second_page = copy.deepcopy(first_page)
+        result_list = second_page['resultListModel']['searchResponseModel']['resultlist.resultlist']
+        result_list['paging']['pageNumber'] = 2
+        entries = result_list['resultlistEntries'][0]['resultlistEntry'][6:]
+        for entry in entries:
+            entry['resultlist.realEstate']['@id'] = str(int(entry['resultlist.realEstate']['@id']) + 1)
+        result_list['resultlistEntries'][0]['resultlistEntry'] = entries
+        self.pages = {1: first_page, 2: second_page}
+        self.page_source = ""
+        self.requested = []
+
+    def get(self, url):
+        self.requested.append(int(url.split('pagenumber=')[1]))
+
+    def execute_script(self, script):
+        if 'resultList' not in script:
+            return 1
+        return self.pages.get(self.requested[-1])
+
+    def quit(self):
+        pass
+
+
+def test_paginates_from_json_without_parsing_html(crawler):
+    driver = FakeJsonDriver()
+    crawler.driver_pool = DriverPool(lambda: driver)
+    crawler.result_limit = 100
+
+    def extract_data(soup):
+        raise AssertionError("HTML should not be parsed when the page JSON is available")
+
+    crawler.extract_data = extract_data
+    entries = list(crawler.crawl(TEST_URL))
+    assert len(entries) == 34
+    assert len(set(entry['id'] for entry in entries)) == 34
+    assert sorted(driver.requested) == [1, 2]
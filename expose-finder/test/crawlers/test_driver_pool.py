@@ -0,0 +1,103 @@
+import threading
+import time
+
+import pytest
+
+from flathunter.crawlers.driver_pool import DriverPool
+
+
+class FakeDriver:
+
+    def __init__(self, heap=0):
+        self.heap = heap
+        self.crashed = False
+        self.quit_called = False
+
+    def execute_script(self, script):
+        if self.crashed:
+            raise ConnectionError("Browser is gone")
+        if 'usedJSHeapSize' in script:
+            return self.heap
+        return 1
+
+    def quit(self):
+        self.quit_called = True
+
+
+def test_drivers_are_reused():
+    created = []
+    pool = DriverPool(lambda: created.append(FakeDriver()) or created[-1])
+    with pool.driver() as first:
+        pass
+    with pool.driver() as second:
+        pass
+    assert first is second
+    assert len(created) == 1
+
+
+def test_drivers_are_recycled_after_max_pages():
+    pool = DriverPool(FakeDriver, max_pages=2)
+    with pool.driver() as first:
+        pass
+    with pool.driver():
+        pass
+    with pool.driver() as third:
+        pass
+    assert first.quit_called
+    assert third is not first
+
+
+def test_drivers_are_recycled_on_memory_growth():
+    pool = DriverPool(lambda: FakeDriver(heap=600 * 1024 * 1024), max_memory=500)
+    with pool.driver() as first:
+        pass
+    assert first.quit_called
+
+
+def test_unhealthy_drivers_are_replaced():
+    pool = DriverPool(FakeDriver)
+    with pool.driver() as first:
+        pass
+    first.crashed = True
+    with pool.driver() as second:
+        pass
+    assert second is not first
+    assert first.quit_called
+
+
+def test_failing_drivers_are_replaced():
+    pool = DriverPool(FakeDriver)
+    with pytest.raises(ValueError):
+        with pool.driver() as first:
+            raise ValueError()
+    assert first.quit_called
+
+
+def test_checkout_is_bounded():
+    created = []
+    pool = DriverPool(lambda: created.append(FakeDriver()) or created[-1], size=2)
+    in_use = []
+    max_in_use = []
+
+    def work():
+        with pool.driver():
+            in_use.append(1)
+            max_in_use.append(len(in_use))
+            time.sleep(0.05)
+            in_use.pop()
+
+    threads = [threading.Thread(target=work) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert max(max_in_use) <= 2
+    assert len(created) == 2
+
+
+def test_close_quits_idle_drivers():
+    pool = DriverPool(FakeDriver)
+    with pool.driver() as first:
+        pass
+    pool.close()
+    assert first.quit_called
@@ -0,0 +1,66 @@
+import requests_mock
+
+from flathunter.config import Config
+from flathunter.crawlers.crawl_immowelt import CrawlImmowelt
+from flathunter.hunter import Hunter
+from flathunter.idmaintainer import IdMaintainer
+
+CACHE_CONFIG = """
+urls:
+  - https://www.immowelt.de/liste/berlin/wohnungen/mieten?sort=createdate%2Bdesc
+
+response_cache: yes
+"""
+
+TEST_URL = 'https://www.immowelt.de/liste/berlin/wohnungen/mieten?sort=createdate%2Bdesc'
+
+
+def test_unchanged_page_is_not_parsed(mocker):
+    crawler = CrawlImmowelt(Config(string=CACHE_CONFIG))
+    spy = mocker.spy(crawler, "extract_data")
+    with requests_mock.Mocker() as m:
+        m.get(TEST_URL, text="<html></html>", headers={'ETag': '"abc"'})
+        crawler.crawl(TEST_URL)
+        crawler.response_cache.commit()
+        m.get(TEST_URL, status_code=304)
+        assert crawler.crawl(TEST_URL) == []
+        assert m.last_request.headers['If-None-Match'] == '"abc"'
+    assert spy.call_count == 1
+
+
+def test_same_content_is_not_parsed(mocker):
+    crawler = CrawlImmowelt(Config(string=CACHE_CONFIG))
+    spy = mocker.spy(crawler, "extract_data")
+    with requests_mock.Mocker() as m:
+        m.get(TEST_URL, text="<html></html>")
+        crawler.crawl(TEST_URL)
+        crawler.response_cache.commit()
+        crawler.crawl(TEST_URL)
+        m.get(TEST_URL, text="<html><body></body></html>")
+        crawler.crawl(TEST_URL)
+    assert spy.call_count == 2
+
+
+def test_page_is_parsed_again_until_a_cycle_completes(mocker):
+    config = Config(string=CACHE_CONFIG)
+    crawler = CrawlImmowelt(config)
+    spy = mocker.spy(crawler, "extract_data")
+    hunter = Hunter(config, [crawler], IdMaintainer(":memory:"))
+    with requests_mock.Mocker() as m:
+        m.get(TEST_URL, text="<html></html>")
+        # fetched, but not handled, as if the cycle had failed
+        crawler.crawl(TEST_URL)
+        hunter.hunt_flats()
+        hunter.hunt_flats()
+    assert spy.call_count == 2
+
+
+def test_detail_pages_are_not_cached():
+    crawler = CrawlImmowelt(Config(string=CACHE_CONFIG))
+    with requests_mock.Mocker() as m:
+        m.get(TEST_URL, text="<html></html>")
+        crawler.crawl(TEST_URL)
+        m.get('https://www.immowelt.de/expose/123', text="<html></html>", headers={'ETag': '"abc"'})
+        crawler.get_page('https://www.immowelt.de/expose/123')
+        crawler.get_page('https://www.immowelt.de/expose/123')
+        assert 'If-None-Match' not in m.last_request.headers
@@ -87,3 +87,41 @@ filters:
         self.assertIsNotNone(config)
         self.assertEqual(config.database_location(),
                          os.path.abspath(os.path.dirname(os.path.abspath(__file__)) + "/.."))
+
+    REDIS_CONFIG = """
+urls:
+  - https://www.immowelt.de/liste/berlin/wohnungen/mieten?roomi=2&prima=1500&wflmi=70&sort=createdate%2Bdesc
+
+redis:
+  host: localhost
+  port: 6379
+
+loop:
+  active: yes
+  sleeping_time: 300
+"""
+
+    def test_resolves_settings_from_file(self):
+        config = Config(string=self.REDIS_CONFIG, environ={})
+        self.assertEqual("localhost", config.settings.redis_host)
+        self.assertEqual(6379, config.settings.redis_port)
+        self.assertTrue(config.settings.loop_active)
+        self.assertEqual(300, config.settings.loop_sleeping_time)
+        self.assertEqual(1, len(config.settings.urls))
+
+    def test_environment_overrides_file(self):
+        config = Config(string=self.REDIS_CONFIG,
+                        environ={"FLATHUNTER_REDIS_HOST": "redis", "FLATHUNTER_REDIS_PORT": "6380"})
+        self.assertEqual("redis", config.redis_host())
+        self.assertEqual(6380, config.redis_port())
+
+    def test_command_line_overrides_environment(self):
+        config = Config(string=self.REDIS_CONFIG, overrides={"redis_host": "cli-redis", "redis_port": None},
+                        environ={"FLATHUNTER_REDIS_HOST": "redis"})
+        self.assertEqual("cli-redis", config.redis_host())
+        self.assertEqual(6379, config.redis_port())
+
+    def test_settings_are_immutable(self):
+        config = Config(string=self.REDIS_CONFIG)
+        with self.assertRaises(AttributeError):
+            config.settings.redis_host = "elsewhere"
@@ -0,0 +1,71 @@
+import json
+import sqlite3
+
+from flathunter.details_codec import DetailsCodec
+from flathunter.filter import Filter
+from flathunter.idmaintainer import IdMaintainer
+
+
+def expose(idx, crawler='immowelt'):
+    return {'id': idx, 'crawler': crawler, 'title': 'Schöne Wohnung %d' % idx, 'price': '%d €' % (500 + idx),
+            'size': '%d m²' % (40 + idx % 30), 'rooms': '2', 'address': 'Musterstraße %d, Berlin' % idx,
+            'url': 'https://www.immowelt.de/expose/%d' % idx,
+            'image': 'https://media-pics1.immowelt.org/b/e/3/1/%d_ori.jpg?ci_seal=0123456789abcdef' % idx}
+
+
+def test_details_round_trip():
+    codec = DetailsCodec(train_samples=3, store_dictionary=lambda crawler, dictionary: 1)
+    texts = [json.dumps(expose(idx), ensure_ascii=False) for idx in range(6)]
+    blobs = [codec.encode('immowelt', text) for text in texts]
+    assert [codec.decode(blob) for blob in blobs] == texts
+    assert codec.current == {'immowelt': 1}
+    # Details saved before compression are read as they are
+    assert codec.decode(texts[0]) == texts[0]
+    assert codec.decode(texts[0].encode('utf-8')) == texts[0]
+
+
+def test_dictionary_makes_details_smaller():
+    plain = DetailsCodec()
+    trained = DetailsCodec(train_samples=20, store_dictionary=lambda crawler, dictionary: 1)
+    for idx in range(20):
+        trained.encode('immowelt', json.dumps(expose(idx)))
+    text = json.dumps(expose(100))
+    assert len(trained.encode('immowelt', text)) < 0.6 * len(plain.encode('immowelt', text))
+    assert len(plain.encode('immowelt', text)) < len(text)
+
+
+def test_dictionaries_are_kept_in_the_database(tmp_path):
+    db_name = str(tmp_path / 'processed_ids.db')
+    id_watch = IdMaintainer(db_name)
+    id_watch.codec.train_samples = 5
+    for idx in range(10):
+        id_watch.save_expose(expose(idx))
+    assert id_watch.get_connection().execute('SELECT count(*) FROM details_dictionaries').fetchone()[0] == 1
+
+    reopened = IdMaintainer(db_name)
+    assert sorted(item['id'] for item in reopened.get_exposes_since('2000-01-01')) == list(range(10))
+    cheap = Filter.builder().read_config({'filters': {'max_price': 503}}).build()
+    reopened.backfilled = False
+    reopened.get_connection().execute('UPDATE exposes SET first_seen = NULL, price = NULL')
+    assert sorted(item['id'] for item in reopened.get_recent_exposes(10, cheap)) == [0, 1, 2, 3]
+
+
+def test_details_saved_before_compression_are_compressed(tmp_path):
+    db_name = str(tmp_path / 'processed_ids.db')
+    old = sqlite3.connect(db_name)
+    old.execute('CREATE TABLE exposes (id INTEGER, created TIMESTAMP, crawler STRING, details BLOB, \
+                 PRIMARY KEY (id, crawler))')
+    for idx in range(200):
+        old.execute('INSERT INTO exposes VALUES (?, ?, ?, ?)',
+                    (idx, '2021-03-01 12:00:00.%06d' % idx, 'immowelt', json.dumps(expose(idx))))
+    old.commit()
+    old.close()
+
+    id_watch = IdMaintainer(db_name)
+    connection = id_watch.get_connection()
+    pages = connection.execute('PRAGMA page_count').fetchone()[0]
+    assert id_watch.compress_details(batch_size=30) == 200
+    assert connection.execute("SELECT count(*) FROM exposes WHERE typeof(details) = 'text'").fetchone()[0] == 0
+    assert [item['id'] for item in id_watch.get_recent_exposes(3)] == [199, 198, 197]
+    assert id_watch.compact() == 0
+    assert connection.execute('PRAGMA page_count').fetchone()[0] < pages
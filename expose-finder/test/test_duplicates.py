@@ -0,0 +1,71 @@
+import datetime
+
+from flathunter.config import Config
+from flathunter.duplicates import DuplicateFilter, normalize_address
+from flathunter.hunter import Hunter
+from flathunter.idmaintainer import IdMaintainer
+
+
+def expose(expose_id, crawler, address="Musterstraße 5a, 10115 Berlin", price="1.200 €", size="64 m²", rooms="2"):
+    return {'id': expose_id, 'crawler': crawler, 'url': 'https://www.example.com/%s/%d' % (crawler, expose_id),
+            'title': 'Altbau', 'address': address, 'price': price, 'size': size, 'rooms': rooms}
+
+
+def test_addresses_are_spelled_the_same_across_portals():
+    assert normalize_address("Musterstraße 5a, 10115 Berlin") == 'musterstr5a'
+    assert normalize_address("Musterstr. 5 A (Mitte)") == 'musterstr5a'
+    assert normalize_address("Muster Strasse 5a 10115 Berlin") == 'musterstr5a'
+    assert normalize_address("10115 Berlin Mitte") is None
+    assert normalize_address("https://www.example.com/expose/1") is None
+
+
+def test_same_flat_on_another_portal_is_suppressed():
+    duplicates = DuplicateFilter(IdMaintainer(":memory:"))
+    assert duplicates.is_interesting(expose(1, 'immowelt'))
+    assert not duplicates.is_interesting(expose(2, 'immobilienscout', address="Musterstr. 5 A",
+                                                price="1230 EUR", size="63,5 m²"))
+    # A second flat in the same building, from the same portal, is kept
+    assert duplicates.is_interesting(expose(3, 'immowelt'))
+
+
+def test_different_flats_are_kept():
+    duplicates = DuplicateFilter(IdMaintainer(":memory:"))
+    assert duplicates.is_interesting(expose(1, 'immowelt'))
+    assert duplicates.is_interesting(expose(2, 'immobilienscout', price="1.500 €"))
+    assert duplicates.is_interesting(expose(3, 'kleinanzeigen', size="80 m²"))
+    assert duplicates.is_interesting(expose(4, 'wggesucht', rooms="3"))
+    assert duplicates.is_interesting(expose(5, 'wggesucht', address="https://www.example.com/expose/5"))
+
+
+class PortalCrawler:
+    URL_PATTERN = 'https://www.example.com'
+
+    def __init__(self, exposes):
+        self.exposes = exposes
+
+    def crawl(self, url, max_pages=None, id_watch=None):
+        return iter(self.exposes)
+
+
+def test_old_fingerprints_expire():
+    now = datetime.datetime.now()
+    clock = [now]
+    id_watch = IdMaintainer(":memory:")
+    duplicates = DuplicateFilter(id_watch, max_age_days=30, clock=lambda: clock[0])
+    assert duplicates.is_interesting(expose(1, 'immowelt'))
+    id_watch.get_connection().execute('UPDATE fingerprints SET created = ?', (now - datetime.timedelta(days=31),))
+    # expiry runs at most once an hour
+    assert not duplicates.is_interesting(expose(2, 'immobilienscout'))
+    clock[0] = now + DuplicateFilter.EXPIRY_INTERVAL
+    assert duplicates.is_interesting(expose(3, 'kleinanzeigen'))
+    assert [fingerprint['id'] for fingerprint in id_watch.get_fingerprints('musterstr5a', 2)] == [3]
+
+
+def test_hunter_publishes_cross_listed_flats_once():
+    config = Config(string="urls:\n  - https://www.example.com/search\nduplicates:\n  enable: yes\n")
+    crawlers = [PortalCrawler([expose(1, 'immowelt')]),
+                PortalCrawler([expose(2, 'immobilienscout'), expose(3, 'immobilienscout', rooms="4")])]
+    exposes = Hunter(config, crawlers, IdMaintainer(":memory:")).hunt_flats()
+    assert [item['id'] for item in exposes] == [1, 3]
+    default = Config(string="urls:\n  - https://www.example.com/search\n")
+    assert len(Hunter(default, crawlers, IdMaintainer(":memory:")).hunt_flats()) == 3
@@ -0,0 +1,45 @@
+import random
+import re
+
+from flathunter.config import Config
+from flathunter.filter import Filter, TitleFilter, TitleMatcher
+
+WORDS = ['wg', 'tausch', 'zwischenmiete', 'pendler', 'souterrain', 'altbau', 'balkon', 'ruhig', 'gruen']
+
+
+def regex_matches(terms, title):
+    return re.search("(" + ")|(".join(terms) + ")", title) is not None
+
+
+def test_matcher_agrees_with_combined_regex():
+    rand = random.Random(7)
+    terms = rand.sample(WORDS, 4) + ['wg-zimmer', 'nur (fuer )?frauen', r'\bab sofort\b']
+    matcher = TitleMatcher(terms)
+    for _ in range(500):
+        title = ' '.join(rand.choice(WORDS + ['nur', 'fuer', 'frauen', 'ab', 'sofort', 'wg-zimmer'])
+                         for _ in range(4))
+        assert matcher.matches(title) == regex_matches(terms, title)
+
+
+def test_uppercase_terms_never_match_lowercased_titles():
+    assert TitleFilter(['WG']).is_interesting({'title': 'Schöne WG'})
+    assert TitleFilter(['Tausch']).is_interesting({'title': 'Tausch gesucht'})
+
+
+def test_title_lists_are_merged_into_one_filter():
+    config = Config(string="""
+excluded_titles:
+  - wg
+filters:
+  excluded_titles:
+    - tausch
+  max_rooms: 3
+""")
+    title_filters = [f for f in Filter.builder().read_config(config).build().filters if isinstance(f, TitleFilter)]
+    assert len(title_filters) == 1
+    assert title_filters[0].filtered_titles == ['wg', 'tausch']
+
+
+def test_empty_title_list_excludes_nothing():
+    config = Config(string="filters:\n  excluded_titles: []\n")
+    assert Filter.builder().read_config(config).build().is_interesting_expose({'title': 'Altbau'})
@@ -1,11 +1,14 @@
 import datetime
+import json
 import re
+import sqlite3
 import unittest
 
 from flathunter.config import Config
 from flathunter.filter import Filter
 from flathunter.hunter import Hunter
-from flathunter.idmaintainer import IdMaintainer
+from flathunter.idmaintainer import IdMaintainer, SaveAllExposesProcessor
+from flathunter.idmaintainer import NEW, UNCHANGED, UPDATED
 from test.dummy_crawler import DummyCrawler
 from test.test_util import count
 
@@ -33,6 +36,18 @@ filters:
         self.maintainer.mark_processed(12345)
         self.assertTrue(self.maintainer.is_processed(12345), "Expected ID to be saved")
 
+    def test_get_processed(self):
+        self.maintainer.mark_processed(12345)
+        self.maintainer.mark_processed(12346)
+        self.assertEqual({12345}, self.maintainer.get_processed([12345, 54321]))
+        self.assertEqual(set(), self.maintainer.get_processed([]))
+
+    def test_high_water_mark(self):
+        self.assertIsNone(self.maintainer.get_high_water_mark(self.TEST_URL))
+        self.maintainer.set_high_water_mark(self.TEST_URL, 12345)
+        self.maintainer.set_high_water_mark(self.TEST_URL, 12346)
+        self.assertEqual(12346, self.maintainer.get_high_water_mark(self.TEST_URL))
+
     def test_get_last_run_time_none_by_default(self):
         self.assertIsNone(self.maintainer.get_last_run_time(), "Expected last run time to be none")
 
@@ -107,3 +122,164 @@ def test_exposes_are_returned_filtered():
     assert len(saved) == 10
     for expose in saved:
         assert int(re.match(r'\d+', expose['size'])[0]) <= 70
+
+
+def save_exposes(id_watch, count):
+    start = datetime.datetime(2021, 3, 1, 12, 0, 0)
+    for idx in range(count):
+        expose = {'id': idx, 'crawler': 'dummy', 'title': 'Flat %d' % idx,
+                  'price': '%d EUR' % (500 + 100 * (idx % 10)), 'size': '%d m²' % (30 + idx % 50), 'rooms': '2'}
+        id_watch.get_connection().execute('INSERT INTO exposes(id, created, crawler, details) VALUES (?, ?, ?, ?)',
+                                          (idx, start + datetime.timedelta(minutes=idx // 3), 'dummy',
+                                           json.dumps(expose)))
+
+
+def test_recent_exposes_are_newest_first_across_pages():
+    id_watch = IdMaintainer(":memory:")
+    save_exposes(id_watch, 25)
+    ids = [expose['id'] for expose in id_watch.iter_recent_exposes(page_size=4)]
+    assert ids == list(reversed(range(25)))
+    assert [expose['id'] for expose in id_watch.get_recent_exposes(5)] == [24, 23, 22, 21, 20]
+
+
+def test_exposes_since_are_streamed_newest_first():
+    id_watch = IdMaintainer(":memory:")
+    save_exposes(id_watch, 30)
+    saved = list(id_watch.iter_exposes_since(datetime.datetime(2021, 3, 1, 12, 5, 0), page_size=2))
+    assert [expose['id'] for expose in saved] == list(reversed(range(15, 30)))
+    assert saved[0]['created_at'] == '2021-03-01 12:09:00'
+
+
+def test_filters_on_numbers_are_evaluated_in_sql(mocker):
+    id_watch = IdMaintainer(":memory:")
+    save_exposes(id_watch, 100)
+    filter_set = Filter.builder() \
+        .read_config({'filters': {'max_price': 700, 'min_size': 40}}) \
+        .predicate_filter(lambda expose: expose['id'] % 2 == 0) \
+        .build()
+    price_filter = filter_set.filters[0]
+    spy = mocker.spy(price_filter, "is_interesting")
+    saved = id_watch.get_recent_exposes(5, filter_set=filter_set)
+    assert [expose['id'] for expose in saved] == [92, 90, 82, 80, 72]
+    assert spy.call_count == 0
+
+
+def test_recent_exposes_are_read_along_the_index():
+    id_watch = IdMaintainer(":memory:")
+    plan = id_watch.get_connection().execute(
+        'EXPLAIN QUERY PLAN SELECT created, id, crawler, details FROM exposes \
+         WHERE (created, id, crawler) < (?, ?, ?) ORDER BY created DESC, id DESC, crawler DESC LIMIT 10',
+        ('2021-03-01', 1, 'dummy')).fetchall()
+    assert 'exposes_created' in str(plan)
+    assert 'TEMP B-TREE' not in str(plan)
+
+
+def test_filters_on_numbers_are_looked_up_in_their_index():
+    id_watch = IdMaintainer(":memory:")
+    id_watch.backfilled = True
+    for field, predicates in [('size', [('size', '>=', 50), ('size', '<=', 60)]),
+                              ('rooms', [('rooms', '>=', 3), ('rooms', '<=', 3)])]:
+        clauses, params = id_watch._predicate_clauses(predicates)
+        plan = id_watch.get_connection().execute(
+            'EXPLAIN QUERY PLAN SELECT details FROM exposes WHERE ' + ' AND '.join(clauses), params).fetchall()
+        assert 'exposes_%s' % field in str(plan)
+
+
+def test_numeric_columns_are_saved():
+    id_watch = IdMaintainer(":memory:")
+    expose = {'id': 1, 'crawler': 'dummy', 'title': 'Flat', 'price': '1.200,50 €', 'size': '60 m²', 'rooms': '2,5'}
+    id_watch.save_expose(expose)
+    first_seen = id_watch.get_connection().execute('SELECT first_seen FROM exposes').fetchone()[0]
+    id_watch.save_expose(dict(expose, price='1.100 €'))
+    row = id_watch.get_connection().execute(
+        'SELECT price, size, rooms, pps, first_seen, last_seen FROM exposes').fetchone()
+    assert row[:4] == (1100.0, 60.0, 2.5, 1100.0 / 60)
+    assert row[4] == first_seen
+    assert row[5] > first_seen
+
+
+def test_old_databases_are_migrated(tmp_path):
+    db_name = str(tmp_path / 'processed_ids.db')
+    old = sqlite3.connect(db_name)
+    old.execute('CREATE TABLE exposes (id INTEGER, created TIMESTAMP, crawler STRING, details BLOB, \
+                 PRIMARY KEY (id, crawler))')
+    for idx in range(7):
+        old.execute('INSERT INTO exposes VALUES (?, ?, ?, ?)',
+                    (idx, '2021-03-01 12:00:0%d' % idx, 'dummy',
+                     json.dumps({'id': idx, 'price': '%d EUR' % (100 * idx), 'size': '50 m²', 'rooms': '2'})))
+    old.commit()
+    old.close()
+
+    id_watch = IdMaintainer(db_name)
+    filter_set = Filter.builder().read_config({'filters': {'max_price': 300}}).build()
+    assert [expose['id'] for expose in id_watch.get_recent_exposes(10, filter_set)] == [3, 2, 1, 0]
+    assert id_watch.backfill_expose_columns(batch_size=3) == 7
+    rows = id_watch.get_connection().execute('SELECT id, price, pps, first_seen FROM exposes ORDER BY id').fetchall()
+    assert rows[4] == (4, 400.0, 8.0, '2021-03-01 12:00:04')
+    assert [expose['id'] for expose in id_watch.get_recent_exposes(10, filter_set)] == [3, 2, 1, 0]
+
+
+class RecordingPubsub:
+
+    def __init__(self):
+        self.messages = []
+
+    def publish(self, channel, message):
+        self.messages.append((channel, json.loads(message)))
+
+
+def test_unchanged_exposes_are_not_rewritten():
+    id_watch = IdMaintainer(":memory:")
+    expose = {'id': 1, 'crawler': 'dummy', 'title': 'Flat', 'price': '1.200 €', 'size': '60 m²', 'rooms': '2'}
+    assert id_watch.save_expose(expose) == (NEW, None)
+    writes = id_watch.get_connection().total_changes
+    assert id_watch.save_expose(dict(expose), touch=False) == (UNCHANGED, {})
+    assert id_watch.get_connection().total_changes == writes
+    assert id_watch.save_expose(dict(expose, price='1.100 €')) == (UPDATED, {'price': ['1.200 €', '1.100 €']})
+
+
+def test_rows_without_hash_are_not_reported_as_updated():
+    id_watch = IdMaintainer(":memory:")
+    expose = {'id': 1, 'crawler': 'dummy', 'title': 'Flat', 'price': '1.200 €'}
+    id_watch.save_expose(expose)
+    id_watch.get_connection().execute('UPDATE exposes SET content_hash = NULL')
+    assert id_watch.save_expose(dict(expose))[0] == UNCHANGED
+
+
+def test_processor_publishes_updates():
+    id_watch = IdMaintainer(":memory:")
+    pubsub = RecordingPubsub()
+    processor = SaveAllExposesProcessor(None, id_watch, pubsub)
+    exposes = [{'id': idx, 'crawler': 'dummy', 'title': 'Flat', 'price': '%d €' % (1000 + idx)} for idx in range(5)]
+    list(processor.process_exposes(exposes))
+    created = id_watch.get_connection().execute('SELECT max(last_seen) FROM exposes').fetchone()[0]
+    exposes[2] = dict(exposes[2], price='900 €')
+    list(processor.process_exposes(exposes))
+    assert pubsub.messages == [('expose_updates', {'event': 'updated', 'expose': exposes[2],
+                                                   'changes': {'price': ['1002 €', '900 €']}})]
+    rows = id_watch.get_connection().execute('SELECT last_seen FROM exposes').fetchall()
+    assert all(row[0] > created for row in rows)
+
+
+def test_mark_if_new():
+    id_watch = IdMaintainer(":memory:")
+    assert id_watch.mark_if_new(7)
+    assert not id_watch.mark_if_new(7)
+    assert id_watch.is_processed(7)
+
+
+def test_backfill_finishes_for_rows_without_creation_time(tmp_path):
+    db_name = str(tmp_path / 'processed_ids.db')
+    old = sqlite3.connect(db_name)
+    old.execute('CREATE TABLE exposes (id INTEGER, created TIMESTAMP, crawler STRING, details BLOB, \
+                 PRIMARY KEY (id, crawler))')
+    for idx in range(5):
+        old.execute('INSERT INTO exposes VALUES (?, NULL, ?, ?)', (idx, 'dummy', json.dumps({'id': idx})))
+    old.commit()
+    old.close()
+
+    id_watch = IdMaintainer(db_name)
+    assert id_watch.backfill_expose_columns(batch_size=2) == 5
+    assert id_watch.backfilled
+    assert id_watch.get_connection().execute(
+        'SELECT count(*) FROM exposes WHERE first_seen IS NULL').fetchone()[0] == 0
@@ -0,0 +1,69 @@
+import requests
+
+from flathunter import metrics
+from flathunter.config import Config
+from flathunter.hunter import Hunter
+from flathunter.idmaintainer import IdMaintainer
+from flathunter.metrics import MetricsServer, Registry
+from test.dummy_crawler import DummyCrawler
+
+FILTER_CONFIG = """
+urls:
+  - https://www.example.com/search/flats-in-berlin
+
+filters:
+  max_price: 1000
+"""
+
+
+def test_counter_exposition():
+    registry = Registry()
+    counter = registry.counter('pages_total', 'Pages fetched', ('crawler',))
+    counter.inc(crawler='immowelt')
+    counter.inc(2, crawler='immowelt')
+    counter.inc(crawler='wg"gesucht')
+    assert registry.exposition() == (
+        '# HELP pages_total Pages fetched\n'
+        '# TYPE pages_total counter\n'
+        'pages_total{crawler="immowelt"} 3\n'
+        'pages_total{crawler="wg\\"gesucht"} 1\n')
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    histogram = registry.histogram('fetch_seconds', 'Fetch time', buckets=(0.1, 1))
+    histogram.observe(0.05)
+    histogram.observe(0.1)
+    histogram.observe(5)
+    lines = registry.exposition().splitlines()
+    assert 'fetch_seconds_bucket{le="0.1"} 2' in lines
+    assert 'fetch_seconds_bucket{le="1"} 2' in lines
+    assert 'fetch_seconds_bucket{le="+Inf"} 3' in lines
+    assert 'fetch_seconds_count 3' in lines
+    assert 'fetch_seconds_sum 5.15' in lines
+
+
+def test_server_serves_metrics():
+    registry = Registry()
+    registry.counter('cycles_total', 'Crawl cycles').inc()
+    server = MetricsServer(0, registry=registry).start()
+    try:
+        resp = requests.get('http://127.0.0.1:%d/metrics' % server.port)
+        assert resp.status_code == 200
+        assert 'cycles_total 1' in resp.text
+        assert requests.get('http://127.0.0.1:%d/other' % server.port).status_code == 404
+    finally:
+        server.stop()
+
+
+def test_hunt_records_crawl_metrics():
+    found = metrics.EXPOSES_FOUND.get(crawler='dummy_crawler')
+    new = metrics.EXPOSES_NEW.get(crawler='dummy_crawler')
+    rejected = metrics.FILTER_REJECTIONS.get(filter='MaxPriceFilter')
+    cycles = metrics.CYCLE_SECONDS.count()
+    hunter = Hunter(Config(string=FILTER_CONFIG), [DummyCrawler()], IdMaintainer(":memory:"))
+    exposes = hunter.hunt_flats()
+    assert metrics.EXPOSES_NEW.get(crawler='dummy_crawler') - new == len(exposes)
+    assert metrics.EXPOSES_FOUND.get(crawler='dummy_crawler') - found > len(exposes)
+    assert metrics.FILTER_REJECTIONS.get(filter='MaxPriceFilter') > rejected
+    assert metrics.CYCLE_SECONDS.count() == cycles + 1
@@ -0,0 +1,173 @@
+import threading
+import time
+
+import pytest
+
+from flathunter.abstract_processor import Processor
+from flathunter.config import Config
+from flathunter.crawlers.incremental import IncrementalCrawl
+from flathunter.filter import Filter
+from flathunter.hunter import Hunter
+from flathunter.idmaintainer import IdMaintainer
+from flathunter.processor import ProcessorChain
+from test.dummy_crawler import DummyCrawler
+
+DUMMY_CONFIG = """
+urls:
+  - https://www.example.com/search/flats-in-berlin
+"""
+
+PIPELINE_CONFIG = DUMMY_CONFIG + """
+pipeline:
+  enable: yes
+  workers: 3
+"""
+
+
+class SlowLookup(Processor):
+    """Stands in for an I/O bound processor, such as the Google Maps lookup"""
+    concurrent = True
+
+    def __init__(self, delay):
+        self.delay = delay
+
+    def process_expose(self, expose):
+        time.sleep(self.delay(expose))
+        expose['looked_up'] = True
+        return expose
+
+
+class Failing(Processor):
+
+    def process_expose(self, expose):
+        if expose['id'] == 3:
+            raise ValueError("Lookup failed")
+        return expose
+
+
+def chain_of(*processors, **pipeline):
+    builder = ProcessorChain.builder(Config(string=DUMMY_CONFIG))
+    builder.processors.extend(processors)
+    return builder.pipelined(**pipeline).build()
+
+
+def test_preserves_order():
+    chain = chain_of(SlowLookup(lambda expose: 0.01 * (10 - expose['id'])),
+                     workers=4)
+    exposes = list(chain.process({'id': idx} for idx in range(10)))
+    assert [expose['id'] for expose in exposes] == list(range(10))
+    assert all(expose['looked_up'] for expose in exposes)
+
+
+def test_order_can_be_given_up():
+    chain = chain_of(SlowLookup(lambda expose: 0.02 * (4 - expose['id'])),
+                     workers=4, preserve_order=False)
+    exposes = list(chain.process({'id': idx} for idx in range(4)))
+    assert sorted(expose['id'] for expose in exposes) == list(range(4))
+    assert exposes[0]['id'] == 3
+
+
+def test_stages_overlap():
+    second_expose_started = threading.Event()
+
+    def first_stage(expose):
+        if expose['id'] == 1:
+            second_expose_started.set()
+        return expose
+
+    def second_stage(expose):
+        # run sequentially, the first stage would only get to the second expose
+        # after this returns
+        if expose['id'] == 0:
+            expose['overlapped'] = second_expose_started.wait(timeout=5)
+        return expose
+
+    chain = ProcessorChain.builder(Config(string=DUMMY_CONFIG)) \
+        .map(first_stage) \
+        .map(second_stage) \
+        .pipelined() \
+        .build()
+    exposes = list(chain.process({'id': idx} for idx in range(3)))
+    assert exposes[0]['overlapped']
+
+
+def test_stages_are_timed_in_a_pipeline():
+    chain = ProcessorChain.builder(Config(string=DUMMY_CONFIG)) \
+        .time_stages() \
+        .pipelined(workers=8) \
+        .build()
+    chain.processors.append(SlowLookup(lambda expose: 0))
+    assert len(list(chain.process({'id': idx} for idx in range(500)))) == 500
+    stage = chain.timing.stages[0]
+    assert (stage.items_in, stage.items_out) == (500, 500)
+
+
+def test_stages_can_not_be_profiled_in_a_pipeline():
+    with pytest.raises(ValueError):
+        ProcessorChain.builder(Config(string=DUMMY_CONFIG)).time_stages(profile=True).pipelined().build()
+
+
+def test_filtered_exposes_are_dropped():
+    config = Config(string=DUMMY_CONFIG)
+    chain = ProcessorChain.builder(config) \
+        .apply_filter(Filter.builder().predicate_filter(lambda expose: expose['id'] % 3 == 0).build()) \
+        .pipelined() \
+        .build()
+    assert [expose['id'] for expose in chain.process({'id': idx} for idx in range(10))] == [0, 3, 6, 9]
+
+
+def test_errors_reach_the_consumer():
+    chain = chain_of(Failing())
+    with pytest.raises(ValueError):
+        list(chain.process({'id': idx} for idx in range(10)))
+
+
+def test_hunter_finds_the_same_exposes_when_pipelined(tmp_path):
+    # Connections are per thread, so the stages only share a database in a file
+    sequential_watch = IdMaintainer(str(tmp_path / 'sequential.db'))
+    pipelined_watch = IdMaintainer(str(tmp_path / 'pipelined.db'))
+    sequential = Hunter(Config(string=DUMMY_CONFIG), [DummyCrawler()], sequential_watch).hunt_flats()
+    pipelined = Hunter(Config(string=PIPELINE_CONFIG), [DummyCrawler()], pipelined_watch).hunt_flats()
+    assert len(sequential) > 0
+    assert [expose['id'] for expose in pipelined] == [expose['id'] for expose in sequential]
+    assert pipelined_watch.get_processed_in_database(expose['id'] for expose in pipelined) == \
+        set(expose['id'] for expose in pipelined)
+
+
+class NewestFirstCrawler:
+    """Serves a search sorted by newest first, and stops paginating as the IS24 crawler
+       does when crawling incrementally"""
+    PAGE_SIZE = 5
+
+    def __init__(self, expose_ids):
+        self.expose_ids = expose_ids
+        self.pages = 0
+
+    def crawl(self, url, max_pages=None, id_watch=None):
+        incremental = IncrementalCrawl(id_watch, url)
+        for start in range(0, len(self.expose_ids), self.PAGE_SIZE):
+            self.pages += 1
+            entries = [{'id': expose_id, 'url': 'https://www.example.com/expose/%d' % expose_id,
+                        'title': 'Flat %d' % expose_id, 'price': '500 €', 'size': '50 m²', 'rooms': '2',
+                        'address': '1600 Pennsylvania Ave', 'crawler': 'newest_first'}
+                       for expose_id in self.expose_ids[start:start + self.PAGE_SIZE]]
+            last_page = incremental.is_last_page(entries)
+            yield from entries
+            if last_page:
+                break
+        incremental.finish()
+
+
+def test_incremental_crawl_and_filter_share_the_seen_set_when_pipelined(tmp_path):
+    id_watch = IdMaintainer(str(tmp_path / 'processed_ids.db')).use_seen_set(str(tmp_path / 'processed_ids.seen'))
+    config = Config(string=PIPELINE_CONFIG + "incremental: yes\n")
+    crawler = NewestFirstCrawler(list(range(20, 0, -1)))
+    assert [expose['id'] for expose in Hunter(config, [crawler], id_watch).hunt_flats()] == list(range(20, 0, -1))
+    # The previous crawl's newest expose is gone, so the crawler pages on until a page
+    # holds nothing but exposes that the filter stage marked as processed
+    crawler.expose_ids = list(range(27, 20, -1)) + list(range(19, 0, -1))
+    crawler.pages = 0
+    assert [expose['id'] for expose in Hunter(config, [crawler], id_watch).hunt_flats()] == list(range(27, 20, -1))
+    assert crawler.pages == 3
+    assert len(id_watch.seen_set) == 27
+    assert id_watch.get_processed_in_database(range(1, 28)) == set(range(1, 28))
@@ -1,6 +1,8 @@
+import time
 import unittest
 
 from flathunter.config import Config
+from flathunter.filter import Filter
 from flathunter.hunter import Hunter
 from flathunter.idmaintainer import IdMaintainer
 from flathunter.processor import ProcessorChain
@@ -39,3 +41,42 @@ google_maps_api:
         exposes = chain.process(exposes)
         for expose in exposes:
             self.assertFalse(expose['address'].startswith('http'), "Expected addresses to be processed")
+
+    def test_timed_chain_attributes_time_to_stages(self):
+        config = Config(string=self.DUMMY_CONFIG)
+        now = [0.0]
+
+        def slow(seconds):
+            def process(expose):
+                now[0] += seconds
+                return expose
+            return process
+
+        chain = ProcessorChain.builder(config) \
+            .map(slow(0.01)) \
+            .apply_filter(Filter.builder().predicate_filter(lambda expose: expose['id'] % 2 == 0).build()) \
+            .map(slow(0.03)) \
+            .time_stages(clock=lambda: now[0]) \
+            .build()
+        exposes = list(chain.process({'id': idx} for idx in range(10)))
+        self.assertEqual(5, len(exposes))
+        first, middle, last = chain.timing.stages
+        self.assertEqual((10, 10), (first.items_in, first.items_out))
+        self.assertEqual((10, 5), (middle.items_in, middle.items_out))
+        self.assertEqual((5, 5), (last.items_in, last.items_out))
+        self.assertAlmostEqual(0.1, first.own_time)
+        self.assertAlmostEqual(0.0, middle.own_time)
+        self.assertAlmostEqual(0.15, last.own_time)
+        self.assertIs(last, chain.timing.slowest)
+
+    def test_profiled_chain_reports_slowest_stage(self):
+        config = Config(string=self.DUMMY_CONFIG)
+        chain = ProcessorChain.builder(config) \
+            .map(lambda expose: expose) \
+            .map(lambda expose: time.sleep(0.01) or expose) \
+            .time_stages(profile=True) \
+            .build()
+        self.assertEqual(3, len(list(chain.process({'id': idx} for idx in range(3)))))
+        summary = chain.timing.summary()
+        self.assertIn("Profile of the slowest stage, LambdaProcessor", summary)
+        self.assertIn("sleep", summary)
@@ -0,0 +1,101 @@
+import datetime
+import threading
+import uuid
+
+import fakeredis
+import pytest
+import redis
+
+from flathunter.config import Config
+from flathunter.hunter import Hunter
+from flathunter.idmaintainer import NEW, UNCHANGED, UPDATED
+from flathunter.redis_id_maintainer import RedisIdMaintainer
+from test.dummy_crawler import DummyCrawler
+
+
+@pytest.fixture(scope='module')
+def client():
+    """A Redis server on localhost if there is one, and an in-process fake with the
+       same commands and Lua scripting otherwise"""
+    client = redis.Redis('localhost', 6379, socket_connect_timeout=0.5)
+    try:
+        client.ping()
+    except redis.exceptions.ConnectionError:
+        return fakeredis.FakeRedis()
+    return client
+
+
+@pytest.fixture
+def prefix(client):
+    prefix = 'flathunter-test-%s:' % uuid.uuid4().hex
+    yield prefix
+    for key in client.scan_iter(prefix + '*'):
+        client.delete(key)
+
+
+def test_mark_if_new_is_true_once(client, prefix):
+    first = RedisIdMaintainer(client, prefix)
+    second = RedisIdMaintainer(client, prefix)
+    assert first.mark_if_new(42)
+    assert not second.mark_if_new(42)
+    assert second.get_processed([41, 42, 43]) == {42}
+
+
+def test_only_one_of_many_finders_marks_an_expose(client, prefix):
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(RedisIdMaintainer(client, prefix).mark_if_new(7)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(results) == [False] * 7 + [True]
+
+
+def test_processed_ids_are_checked_in_one_round_trip(client, prefix, mocker):
+    id_watch = RedisIdMaintainer(client, prefix)
+    for expose_id in [1, 3, 5]:
+        id_watch.mark_processed(expose_id)
+    pipeline = mocker.spy(client, 'pipeline')
+    sismember = mocker.spy(client, 'sismember')
+    assert id_watch.get_processed(range(1, 7)) == {1, 3, 5}
+    assert pipeline.call_count == 1
+    assert sismember.call_count == 0
+
+
+def test_exposes_are_saved_and_read_back(client, prefix):
+    id_watch = RedisIdMaintainer(client, prefix)
+    expose = {'id': 1, 'crawler': 'dummy', 'title': 'Flat', 'price': '1.200 €', 'size': '60 m²', 'rooms': '2'}
+    assert id_watch.save_expose(expose) == (NEW, None)
+    assert id_watch.save_expose(dict(expose)) == (UNCHANGED, {})
+    assert id_watch.save_expose(dict(expose, price='1.100 €')) == (UPDATED, {'price': ['1.200 €', '1.100 €']})
+    id_watch.save_expose(dict(expose, id=2))
+    assert [item['id'] for item in id_watch.get_recent_exposes(10)] == [2, 1]
+    assert [item['id'] for item in id_watch.get_exposes_since(datetime.datetime.now() - datetime.timedelta(hours=1))] \
+        == [2, 1]
+
+
+def test_pages_follow_scores_while_exposes_are_touched(client, prefix):
+    id_watch = RedisIdMaintainer(client, prefix)
+    for expose_id in range(10):
+        id_watch.save_expose({'id': expose_id, 'crawler': 'dummy', 'title': 'Flat %d' % expose_id})
+    # two exposes with the same time, on the border between two pages
+    client.zadd(prefix + 'exposes', {'dummy:5': 100.0, 'dummy:4': 100.0})
+    for expose_id in range(4):
+        client.zadd(prefix + 'exposes', {'dummy:%d' % expose_id: float(expose_id)})
+    seen = []
+    for expose in id_watch.iter_recent_exposes(page_size=3):
+        seen.append(expose['id'])
+        if len(seen) == 4:
+            # another finder sees the oldest exposes again, which moves them to the front
+            id_watch.touch_exposes([{'id': 0, 'crawler': 'dummy'}])
+    assert len(seen) == len(set(seen))
+    assert sorted(seen) == list(range(1, 10))
+
+
+def test_replicas_publish_each_expose_once(client, prefix):
+    config = Config(string="urls:\n  - https://www.example.com/search/flats-in-berlin\n")
+    first = Hunter(config, [DummyCrawler()], RedisIdMaintainer(client, prefix)).hunt_flats()
+    second = Hunter(config, [DummyCrawler()], RedisIdMaintainer(client, prefix)).hunt_flats()
+    assert len(first) > 0
+    assert second == []
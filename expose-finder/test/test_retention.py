@@ -0,0 +1,101 @@
+import datetime
+import sqlite3
+import threading
+
+from flathunter.filter import Filter
+from flathunter.idmaintainer import IdMaintainer
+from flathunter.retention import ExposeArchive, Retention
+
+NOW = datetime.datetime(2022, 6, 1, 12, 0)
+
+
+def populate(id_watch):
+    connection = id_watch.get_connection()
+    for day in range(20):
+        created = NOW - datetime.timedelta(days=day)
+        id_watch.save_expose({'id': day, 'crawler': 'dummy', 'title': 'Flat %d' % day, 'price': '%d €' % (100 * day)})
+        connection.execute('UPDATE exposes SET created = ? WHERE id = ?', (created, day))
+        connection.execute('INSERT INTO executions VALUES (?)', (created,))
+        connection.execute('INSERT INTO processed VALUES (?, ?)', (day, created))
+    connection.commit()
+
+
+def test_old_rows_are_archived_and_deleted(tmp_path):
+    id_watch = IdMaintainer(str(tmp_path / 'processed_ids.db'))
+    populate(id_watch)
+    archive = ExposeArchive(str(tmp_path / 'archive'))
+    retention = Retention(id_watch, archive, exposes_days=10, executions_days=5, processed_days=15,
+                          batch_size=4, clock=lambda: NOW)
+    removed = retention.run()
+    assert removed['exposes'] == 9
+    assert removed['executions'] == 14
+    assert removed['processed'] == 4
+    connection = id_watch.get_connection()
+    assert connection.execute('SELECT min(id), max(id) FROM exposes').fetchone() == (0, 10)
+    assert len(archive.segments()) == 3
+    assert sorted(expose['id'] for expose in archive.iter_exposes()) == list(range(11, 20))
+    assert connection.execute('PRAGMA auto_vacuum').fetchone()[0] == 2
+    assert retention.run()['exposes'] == 0
+
+
+def test_archive_can_be_queried_by_time_and_filter(tmp_path):
+    id_watch = IdMaintainer(":memory:")
+    populate(id_watch)
+    archive = ExposeArchive(str(tmp_path / 'archive'))
+    Retention(id_watch, archive, exposes_days=0, batch_size=5, clock=lambda: NOW + datetime.timedelta(hours=1)).run()
+    since = NOW - datetime.timedelta(days=12)
+    until = NOW - datetime.timedelta(days=3)
+    assert len(archive.segments()) == 4
+    assert len(archive.segments(since, until)) == 3
+    cheap = Filter.builder().read_config({'filters': {'max_price': 800}}).build()
+    assert sorted(expose['id'] for expose in archive.iter_exposes(since, until, cheap)) == [3, 4, 5, 6, 7, 8]
+
+
+def test_expired_ids_are_removed_from_the_seen_set(tmp_path):
+    id_watch = IdMaintainer(str(tmp_path / 'processed_ids.db'))
+    populate(id_watch)
+    id_watch.use_seen_set(str(tmp_path / 'processed_ids.seen'))
+    # processed again recently, so it stays
+    id_watch.mark_processed(19)
+    retention = Retention(id_watch, ExposeArchive(str(tmp_path / 'archive')), processed_days=15,
+                          batch_size=3, clock=lambda: NOW)
+    assert retention.run()['processed'] == 4
+    assert sorted(id_watch.get_processed(range(20))) == list(range(16)) + [19]
+    id_watch.seen_set.close()
+    restarted = IdMaintainer(str(tmp_path / 'processed_ids.db')).use_seen_set(str(tmp_path / 'processed_ids.seen'))
+    assert not restarted.is_processed(17)
+
+
+def test_old_databases_are_rebuilt_only_when_asked(tmp_path):
+    db_name = str(tmp_path / 'processed_ids.db')
+    old = sqlite3.connect(db_name)
+    old.execute('CREATE TABLE executions (timestamp timestamp)')
+    old.commit()
+    old.close()
+    id_watch = IdMaintainer(db_name)
+    retention = Retention(id_watch, ExposeArchive(str(tmp_path / 'archive')), executions_days=5, clock=lambda: NOW)
+    retention.run()
+    assert id_watch.get_connection().execute('PRAGMA auto_vacuum').fetchone()[0] == 0
+    retention.enable_incremental_vacuum()
+    assert id_watch.get_connection().execute('PRAGMA auto_vacuum').fetchone()[0] == 2
+
+
+def test_ids_marked_during_pruning_stay_seen(tmp_path):
+    id_watch = IdMaintainer(str(tmp_path / 'processed_ids.db'))
+    populate(id_watch)
+    id_watch.use_seen_set(str(tmp_path / 'processed_ids.seen'))
+    lookup = id_watch.get_processed_in_database
+    markers = []
+
+    def lookup_while_marking(expose_ids):
+        # Another thread marks an expired ID again while the seen-set is pruned
+        markers.append(threading.Thread(target=id_watch.mark_processed, args=(18,)))
+        markers[0].start()
+        markers[0].join(timeout=0.2)
+        return lookup(expose_ids)
+
+    id_watch.get_processed_in_database = lookup_while_marking
+    Retention(id_watch, ExposeArchive(str(tmp_path / 'archive')), processed_days=15, clock=lambda: NOW).run()
+    markers[0].join()
+    assert 18 in id_watch.seen_set
+    assert 17 not in id_watch.seen_set
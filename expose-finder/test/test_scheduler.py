@@ -0,0 +1,92 @@
+from flathunter.config import Config
+from flathunter.crawlers import RateLimited
+from flathunter.hunter import Hunter
+from flathunter.idmaintainer import IdMaintainer
+from flathunter.scheduler import Scheduler
+
+HOT = 'https://www.immowelt.de/liste/berlin/wohnungen/mieten?sort=createdate%2Bdesc'
+QUIET = 'https://www.immowelt.de/liste/potsdam/wohnungen/mieten?sort=createdate%2Bdesc'
+OTHER = 'https://www.wg-gesucht.de/wohnungen-in-Berlin.8.2.1.0.html'
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def scheduler_for(urls, clock, interval=600, jitter=0):
+    return Scheduler(urls, interval, min_interval=60, max_interval=3600, jitter=jitter,
+                     clock=clock, rand=lambda: 0.5)
+
+
+def test_all_urls_are_due_at_start():
+    scheduler = scheduler_for([HOT, QUIET, OTHER], FakeClock())
+    assert sorted(scheduler.due()) == sorted([HOT, QUIET, OTHER])
+    assert scheduler.due() == []
+
+
+def test_hot_searches_are_polled_more_often():
+    clock = FakeClock()
+    scheduler = scheduler_for([HOT, QUIET], clock)
+    crawls = {HOT: 0, QUIET: 0}
+    while clock.now < 6 * 3600:
+        for url in scheduler.due():
+            crawls[url] += 1
+            scheduler.record(url, 3 if url == HOT else 0)
+        clock.now += max(1.0, scheduler.seconds_until_due())
+    assert crawls[HOT] > 3 * crawls[QUIET]
+    # The portal is crawled no more often than the fixed loop would crawl it
+    assert crawls[HOT] + crawls[QUIET] <= 2 * (6 * 3600 / 600 + 1)
+
+
+def test_intervals_stay_within_bounds():
+    clock = FakeClock()
+    scheduler = scheduler_for([HOT], clock)
+    for _ in range(20):
+        scheduler.record(HOT, 5)
+    assert scheduler.searches[HOT].interval == 60
+    for _ in range(20):
+        scheduler.record(HOT, 0)
+    assert scheduler.searches[HOT].interval == 3600
+
+
+def test_jitter_spreads_next_runs():
+    clock = FakeClock()
+    scheduler = Scheduler([HOT], 600, jitter=0.1, clock=clock, rand=lambda: 1.0)
+    scheduler.record(HOT, 1)
+    assert scheduler.searches[HOT].next_run == 330
+
+
+def test_rate_limit_backs_off_whole_portal():
+    clock = FakeClock()
+    scheduler = scheduler_for([HOT, QUIET, OTHER], clock)
+    scheduler.due()
+    scheduler.record(HOT, 0, rate_limited=True)
+    scheduler.record(QUIET, 0)
+    scheduler.record(OTHER, 0)
+    assert scheduler.searches[HOT].interval == 2400
+    clock.now = 750
+    # QUIET is due, but the portal's budget was used up by the rate limit
+    assert scheduler.due() == [OTHER]
+    clock.now = 900
+    assert scheduler.due() == [QUIET]
+
+
+class RateLimitedCrawler:
+    URL_PATTERN = 'https://www.example.com'
+
+    def crawl(self, url, max_pages=None, id_watch=None):
+        raise RateLimited(url)
+
+
+def test_hunter_reports_rate_limited_urls():
+    config = Config(string="urls:\n  - https://www.example.com/search\n")
+    hunter = Hunter(config, [RateLimitedCrawler()], IdMaintainer(":memory:"))
+    assert hunter.hunt_flats() == []
+    assert hunter.rate_limited == {'https://www.example.com/search'}
+    hunter.hunt_flats(urls=[])
+    assert hunter.rate_limited == set()
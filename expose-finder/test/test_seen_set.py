@@ -0,0 +1,87 @@
+import datetime
+import threading
+
+from flathunter.idmaintainer import IdMaintainer
+from flathunter.seen_set import SeenSet
+
+
+def test_ids_survive_reopening(tmp_path):
+    path = str(tmp_path / 'seen')
+    seen = SeenSet(path, compact_after=4)
+    for expose_id in [42, 7, 2 ** 40, 7, 13]:
+        seen.add(expose_id)
+    # The fourth new ID compacted the log into the snapshot
+    assert list(seen.snapshot) == [7, 13, 42, 2 ** 40]
+    seen.add(99)
+    seen.close()
+
+    reopened = SeenSet(path)
+    assert reopened.delta == {99}
+    assert all(expose_id in reopened for expose_id in [7, 13, 42, 99, 2 ** 40])
+    assert 8 not in reopened
+    assert len(reopened) == 5
+
+
+def test_torn_log_records_are_ignored(tmp_path):
+    path = str(tmp_path / 'seen')
+    seen = SeenSet(path)
+    seen.add(1)
+    seen.add(2)
+    seen.close()
+    with open(path + '.delta', 'ab') as delta:
+        delta.write(b'\x01\x02\x03')
+    reopened = SeenSet(path)
+    assert reopened.delta == {1, 2}
+    reopened.add(3)
+    reopened.add(4)
+    reopened.close()
+    assert SeenSet(path).delta == {1, 2, 3, 4}
+
+
+def test_id_maintainer_builds_seen_set_from_database(tmp_path):
+    id_watch = IdMaintainer(str(tmp_path / 'processed_ids.db'))
+    for expose_id in [3, 1, 2]:
+        id_watch.mark_processed(expose_id)
+    id_watch.use_seen_set(str(tmp_path / 'processed_ids.seen'))
+    assert list(id_watch.seen_set.snapshot) == [1, 2, 3]
+    id_watch.mark_processed(4)
+
+    restarted = IdMaintainer(str(tmp_path / 'processed_ids.db')).use_seen_set(str(tmp_path / 'processed_ids.seen'))
+    restarted.get_connection().execute('DELETE FROM processed WHERE id = 4')
+    assert restarted.is_processed(4)
+    assert restarted.get_processed([1, 4, 5]) == {1, 4}
+
+
+def test_stale_seen_set_is_rebuilt(tmp_path):
+    id_watch = IdMaintainer(str(tmp_path / 'processed_ids.db')).use_seen_set(str(tmp_path / 'processed_ids.seen'))
+    id_watch.mark_processed(1)
+    id_watch.seen_set.close()
+    connection = id_watch.get_connection()
+    connection.execute('INSERT INTO processed VALUES (2, ?)', (datetime.datetime.now(),))
+    connection.commit()
+    restarted = IdMaintainer(str(tmp_path / 'processed_ids.db')).use_seen_set(str(tmp_path / 'processed_ids.seen'))
+    assert restarted.get_processed([1, 2, 3]) == {1, 2}
+
+
+def test_readers_see_every_id_while_the_set_is_compacted(tmp_path):
+    seen = SeenSet(str(tmp_path / 'seen'))
+    seen.update(range(0, 200000, 2))
+    misses = []
+    stop = threading.Event()
+
+    def read():
+        while not stop.is_set():
+            if 5000 not in seen:
+                misses.append(5000)
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    try:
+        for expose_id in range(1, 40, 2):
+            seen.discard([expose_id + 100001])
+            seen.add(expose_id)
+            seen.compact()
+    finally:
+        stop.set()
+        reader.join()
+    assert misses == []
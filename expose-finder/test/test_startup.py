@@ -0,0 +1,47 @@
+import importlib
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+from flathunter.config import Config
+from flathunter.crawlers import CRAWLERS, load_crawlers
+from flathunter.crawlers.crawl_immowelt import CrawlImmowelt
+
+
+class StartupTest(unittest.TestCase):
+    # Cold start took over three seconds when the user agent database and Selenium
+    # were loaded eagerly. Leave plenty of headroom for slow CI machines.
+    IMPORT_TIME_BUDGET = 1.5
+
+    HEAVY_MODULES = ['selenium', 'jsonpath_ng', 'bs4', 'random_user_agent']
+
+    IMMOWELT_CONFIG = """
+urls:
+  - https://www.immowelt.de/liste/berlin/wohnungen/mieten?roomi=2&prima=1500&wflmi=70&sort=createdate%2Bdesc
+"""
+
+    def test_cold_start_is_within_budget(self):
+        script = """
+import json, sys, time
+start = time.perf_counter()
+import flathunter.flathunt
+print(json.dumps({"seconds": time.perf_counter() - start, "modules": sorted(sys.modules)}))
+"""
+        root = os.path.abspath(os.path.dirname(os.path.abspath(__file__)) + "/..")
+        output = subprocess.run([sys.executable, "-c", script], cwd=root, check=True,
+                                capture_output=True, text=True).stdout
+        result = json.loads(output.splitlines()[-1])
+        for module in self.HEAVY_MODULES:
+            self.assertNotIn(module, result["modules"], "Expected %s not to be imported on startup" % module)
+        self.assertLess(result["seconds"], self.IMPORT_TIME_BUDGET, "Startup took too long")
+
+    def test_loads_only_configured_crawlers(self):
+        searchers = load_crawlers(Config(string=self.IMMOWELT_CONFIG))
+        self.assertEqual([CrawlImmowelt], [type(searcher) for searcher in searchers])
+
+    def test_registry_matches_crawler_url_patterns(self):
+        for url_pattern, module_name, class_name in CRAWLERS:
+            crawler_class = getattr(importlib.import_module(module_name), class_name)
+            self.assertEqual(crawler_class.URL_PATTERN.pattern, url_pattern.pattern)
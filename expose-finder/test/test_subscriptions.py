@@ -0,0 +1,96 @@
+import random
+
+from flathunter.aho_corasick import AhoCorasick
+from flathunter.config import Config
+from flathunter.filter import Filter
+from flathunter.hunter import Hunter
+from flathunter.idmaintainer import IdMaintainer
+from flathunter.subscriptions import SubscriptionIndex, SubscriptionIndexCache
+from test.dummy_crawler import DummyCrawler
+
+TITLE_WORDS = ['wg', 'zimmer', 'tausch', 'wohnung', 'altbau', 'balkon', 'neubau', 'souterrain', 'befristet']
+
+
+def test_automaton_finds_overlapping_terms():
+    automaton = AhoCorasick(['he', 'she', 'his', 'hers'])
+    assert automaton.matches('ushers') == {0, 1, 3}
+    assert automaton.matches('history') == {2}
+    assert not automaton.contains_any('nothing')
+
+
+def random_settings(rand):
+    filters = {}
+    if rand.random() < 0.7:
+        filters['min_price'] = rand.randrange(0, 1500, 50)
+    if rand.random() < 0.7:
+        filters['max_price'] = rand.randrange(300, 3000, 50)
+    if rand.random() < 0.5:
+        filters['min_size'] = rand.randrange(10, 80, 5)
+    if rand.random() < 0.5:
+        filters['max_size'] = rand.randrange(40, 200, 5)
+    if rand.random() < 0.5:
+        filters['min_rooms'] = rand.randrange(1, 4)
+    if rand.random() < 0.3:
+        filters['max_rooms'] = rand.randrange(2, 6)
+    if rand.random() < 0.3:
+        filters['max_price_per_square'] = rand.randrange(8, 30)
+    if rand.random() < 0.5:
+        filters['excluded_titles'] = rand.sample(TITLE_WORDS, rand.randrange(1, 3))
+    if rand.random() < 0.1:
+        filters['excluded_titles'] = ['wg|zimmer', 'tausch.*wohnung']
+    return {'filters': filters}
+
+
+def random_expose(rand, idx):
+    return {
+        'id': idx,
+        'title': ' '.join(rand.sample(TITLE_WORDS, 3)).title(),
+        'price': '%d €' % rand.randrange(200, 3500),
+        'size': '%d m²' % rand.randrange(15, 180) if rand.random() < 0.9 else '',
+        'rooms': str(rand.randrange(1, 6)),
+    }
+
+
+def test_index_agrees_with_each_users_filters():
+    rand = random.Random(42)
+    users = [(user_id, random_settings(rand)) for user_id in range(300)]
+    index = SubscriptionIndex(users)
+    filters = [(user_id, Filter.builder().read_config(settings).build()) for user_id, settings in users]
+    for idx in range(300):
+        expose = random_expose(rand, idx)
+        expected = [user_id for user_id, user_filter in filters if user_filter.is_interesting_expose(expose)]
+        assert sorted(index.interested_users(expose)) == expected
+
+
+def test_users_without_filters_get_everything():
+    index = SubscriptionIndex([(1, {}), (2, {'filters': {'max_price': 500}})])
+    assert index.interested_users({'title': 'Altbau', 'price': '900 €', 'size': '', 'rooms': ''}) == [1]
+
+
+def test_hunter_lists_subscribers():
+    id_watch = IdMaintainer(":memory:")
+    id_watch.save_settings_for_user(7, {'filters': {'max_price': 100000}})
+    id_watch.save_settings_for_user(8, {'filters': {'max_price': 1}})
+    config = Config(string="urls:\n  - https://www.example.com/search/flats-in-berlin\n")
+    exposes = Hunter(config, [DummyCrawler()], id_watch).hunt_flats()
+    assert len(exposes) > 0
+    assert all(expose['subscribers'] == [7] for expose in exposes)
+
+
+def test_null_bounds_do_not_restrict_users():
+    index = SubscriptionIndex([(1, {'filters': {'min_price': None, 'max_price': None, 'max_size': 50}})])
+    assert index.interested_users({'title': 'Altbau', 'price': '900 €', 'size': '40 m²', 'rooms': '2'}) == [1]
+    assert index.interested_users({'title': 'Altbau', 'price': '900 €', 'size': '60 m²', 'rooms': '2'}) == []
+
+
+def test_index_is_rebuilt_only_when_users_change():
+    id_watch = IdMaintainer(":memory:")
+    id_watch.save_settings_for_user(7, {'filters': {'max_price': 500}})
+    subscriptions = SubscriptionIndexCache(id_watch)
+    index = subscriptions.current()
+    assert subscriptions.current() is index
+    id_watch.save_settings_for_user(7, {'filters': {'max_price': 1000}})
+    assert subscriptions.current() is not index
+    assert subscriptions.current().interested_users({'title': 'Altbau', 'price': '900 €', 'size': '', 'rooms': ''}) == [7]
+    id_watch.get_connection().execute('DELETE FROM users')
+    assert len(subscriptions.current()) == 0
@@ -19,6 +19,7 @@ __status__ = "Production"
 
 # init logging
 from flathunter.pubsub.redis_pubsub import RedisPubsub
+from flathunter.send_ledger import SendLedger
 from flathunter.sender_telegram import SenderTelegram
 
 if os.name == 'posix':
@@ -49,11 +50,14 @@ def main():
                         help="Config file to use. If not set, try to use '%s/config.yaml' " %
                              os.path.dirname(os.path.abspath(__file__))
                         )
+    parser.add_argument('--redis_host', help="Redis host, overrides the config file")
+    parser.add_argument('--redis_port', type=int, help="Redis port, overrides the config file")
     args = parser.parse_known_args()[0]
 
     # load config
     config_handle = args.config
-    config = Config(config_handle.name)
+    config = Config(config_handle.name,
+                    overrides={'redis_host': args.redis_host, 'redis_port': args.redis_port})
 
     # check config
     if not config.get('telegram', dict()).get('bot_token'):
@@ -63,12 +67,13 @@ def main():
         __log__.warning("No telegram receivers configured - nobody will get notifications.")
 
     # adjust log level, if required
-    if config.get('verbose'):
+    if config.settings.verbose:
         __log__.setLevel(logging.DEBUG)
         __log__.debug("Settings from config: %s", pformat(config))
 
     # start sending messages
-    telegram_sender = SenderTelegram(config, RedisPubsub(config))
+    ledger = SendLedger('%s/sent_exposes.db' % config.settings.database_location)
+    telegram_sender = SenderTelegram(config, RedisPubsub(config), ledger)
     telegram_sender.wait_and_process()
 
 
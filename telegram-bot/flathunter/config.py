@@ -1,16 +1,53 @@
 """Wrap configuration options as an object"""
-import argparse
 import logging
+import os
+from dataclasses import dataclass
 
 import yaml
 
 
+@dataclass(frozen=True)
+class Settings:
+    """Settings resolved once at startup. Values come from the config file, which
+       can be overridden by environment variables, which can be overridden by
+       command-line flags"""
+
+    database_location: str
+    redis_host: str
+    redis_port: int
+    verbose: bool
+
+    ENVIRONMENT_PREFIX = 'FLATHUNTER_'
+
+    @staticmethod
+    def resolve(config, overrides=None, environ=None):
+        """Merge the config file with environment variables and command-line flags"""
+        config = config or dict()
+        overrides = overrides or dict()
+        environ = os.environ if environ is None else environ
+
+        def pick(name, file_value, convert=str):
+            if overrides.get(name) is not None:
+                return convert(overrides[name])
+            if environ.get(Settings.ENVIRONMENT_PREFIX + name.upper()) is not None:
+                return convert(environ[Settings.ENVIRONMENT_PREFIX + name.upper()])
+            return file_value
+
+        redis_config = config.get('redis') or dict()
+        return Settings(
+            database_location=pick('database_location', config.get(
+                'database_location', os.path.abspath(os.path.dirname(os.path.abspath(__file__)) + "/.."))),
+            redis_host=pick('redis_host', redis_config.get('host', 'localhost')),
+            redis_port=pick('redis_port', int(redis_config.get('port', 6379)), int),
+            verbose=bool(config.get('verbose', False)))
+
+
 class Config:
     """Class to represent flathunter configuration"""
 
     __log__ = logging.getLogger('flathunt')
 
-    def __init__(self, filename=None, string=None):
+    def __init__(self, filename=None, string=None, overrides=None, environ=None):
         if string is not None:
             self.config = yaml.safe_load(string)
         elif filename is not None:
@@ -19,6 +56,7 @@ class Config:
                 self.config = yaml.safe_load(file)
         else:
             raise ValueError("Either filename or string must be given")
+        self.settings = Settings.resolve(self.config, overrides, environ)
 
     def __iter__(self):
         """Emulate dictionary"""
@@ -32,15 +70,12 @@ class Config:
         """Emulate dictionary"""
         return self.config.get(key, value)
 
+    def database_location(self):
+        """Return the location of the database folder"""
+        return self.settings.database_location
+
     def redis_host(self):
-        return command_line_arg("redis_host") or self.config["redis"]["host"]
+        return self.settings.redis_host
 
     def redis_port(self):
-        return command_line_arg("redis_port") or self.config["redis"]["port"]
-
-
-def command_line_arg(argument):
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--" + argument)
-    print(parser.parse_known_args()[0])
-    return getattr(parser.parse_known_args()[0], argument)
+        return self.settings.redis_port
@@ -0,0 +1,93 @@
+"""Coalesce bursts of exposes into digests, to keep the number of Telegram API calls low"""
+import logging
+import queue
+import threading
+import time
+
+TELEGRAM_MESSAGE_LIMIT = 4096
+DIGEST_SEPARATOR = "\n\n――――――\n\n"
+
+
+class Digest:
+    """Groups a stream of exposes into batches. A batch is closed once 'window' seconds
+       have passed since its first expose, or once it holds 'max_exposes' exposes. An
+       expose arriving after a quiet period is passed on straight away, so that digests
+       only add latency during bursts"""
+    __log__ = logging.getLogger('flathunt')
+
+    _END = object()
+
+    def __init__(self, window, max_exposes):
+        if window <= 0 or max_exposes < 1:
+            raise ValueError("Digest window and size must be positive")
+        self.window = window
+        self.max_exposes = max_exposes
+
+    @staticmethod
+    def from_config(config):
+        """Build a digest from the 'telegram.digest' config section, or None if not enabled"""
+        digest_config = config.get('telegram', dict()).get('digest')
+        if not digest_config or not digest_config.get('enable', True):
+            return None
+        return Digest(digest_config.get('window', 30), digest_config.get('max_exposes', 20))
+
+    def batches(self, exposes):
+        """Consume the exposes on a background thread and yield them in lists"""
+        pending = queue.Queue()
+
+        def pump():
+            try:
+                for expose in exposes:
+                    pending.put(expose)
+            finally:
+                pending.put(self._END)
+
+        threading.Thread(target=pump, daemon=True).start()
+
+        batch = []
+        deadline = None
+        last_flush = None
+        while True:
+            timeout = None if deadline is None else max(0, deadline - time.monotonic())
+            try:
+                expose = pending.get(timeout=timeout)
+            except queue.Empty:
+                self.__log__.debug("Digest window closed with %d exposes", len(batch))
+                yield batch
+                batch, deadline, last_flush = [], None, time.monotonic()
+                continue
+            if expose is self._END:
+                if batch:
+                    yield batch
+                return
+            now = time.monotonic()
+            if not batch and (last_flush is None or now - last_flush >= self.window):
+                last_flush = now
+                yield [expose]
+                continue
+            batch.append(expose)
+            if deadline is None:
+                deadline = now + self.window
+            if len(batch) >= self.max_exposes:
+                self.__log__.debug("Digest full with %d exposes", len(batch))
+                yield batch
+                batch, deadline, last_flush = [], None, now
+
+
+def pack_messages(texts, limit=TELEGRAM_MESSAGE_LIMIT, separator=DIGEST_SEPARATOR):
+    """Join the texts into as few messages as possible, each no longer than 'limit'.
+       Texts that are too long on their own are truncated"""
+    messages = []
+    current = None
+    for text in texts:
+        if len(text) > limit:
+            text = text[:limit - 1] + "…"
+        if current is not None and len(current) + len(separator) + len(text) <= limit:
+            current += separator + text
+            continue
+        if current is not None:
+            messages.append(current)
+        current = text
+    if current is not None:
+        messages.append(current)
+    return messages
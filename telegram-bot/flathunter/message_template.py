@@ -0,0 +1,41 @@
+"""Compiled form of the configured Telegram message template"""
+import re
+import string
+
+
+class MessageTemplate:
+    """Message template that is parsed once, and rendered for every expose. Unknown
+       placeholders are reported when the template is compiled, not when the first
+       expose comes in"""
+
+    PLACEHOLDERS = ('title', 'rooms', 'size', 'price', 'url', 'address', 'durations')
+    DEFAULTS = {'durations': ""}
+
+    def __init__(self, template):
+        self.formatter = string.Formatter()
+        self.parts = []
+        self.fields = set()
+        try:
+            parsed = list(self.formatter.parse(template or ""))
+        except ValueError as error:
+            raise ValueError("Invalid message template: %s" % error) from error
+        for literal, field_name, format_spec, conversion in parsed:
+            if field_name is not None:
+                name = re.match(r'\w*', field_name)[0]
+                if name not in self.PLACEHOLDERS:
+                    raise ValueError("Unknown placeholder '{%s}' in message template" % field_name)
+                self.fields.add(name)
+            self.parts.append((literal, field_name, format_spec, conversion))
+
+    def render(self, expose):
+        """Fill in the placeholders with the details of the expose"""
+        values = {name: expose[name] if name not in self.DEFAULTS else expose.get(name, self.DEFAULTS[name])
+                  for name in self.fields}
+        out = []
+        for literal, field_name, format_spec, conversion in self.parts:
+            out.append(literal)
+            if field_name is not None:
+                obj, _ = self.formatter.get_field(field_name, (), values)
+                obj = self.formatter.convert_field(obj, conversion)
+                out.append(self.formatter.format_field(obj, format_spec))
+        return "".join(out).strip()
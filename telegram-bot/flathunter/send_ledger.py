@@ -0,0 +1,76 @@
+"""SQLite record of the exposes that were already sent to each receiver"""
+import datetime
+import logging
+import sqlite3 as lite
+import threading
+from collections import OrderedDict
+
+
+class SendLedger:
+    """Keeps track of which expose was sent to which chat, so that exposes that are
+       published again (after a finder restart, or a redelivery) are not sent twice.
+       Recently sent keys are kept in an LRU cache in front of the database"""
+    __log__ = logging.getLogger('flathunt')
+
+    def __init__(self, db_name, cache_size=10000):
+        self.db_name = db_name
+        self.threadlocal = threading.local()
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+
+    def get_connection(self):
+        """Connects to the SQLite database. Connections are thread-local"""
+        connection = getattr(self.threadlocal, 'connection', None)
+        if connection is None:
+            try:
+                connection = lite.connect(self.db_name)
+                self.threadlocal.connection = connection
+                # IDs are text: portals do not all use numeric expose IDs, and channels are
+                # addressed by name. Ledgers created with INTEGER columns still match, as
+                # SQLite converts numeric text to the column's type
+                connection.execute('CREATE TABLE IF NOT EXISTS sent (crawler STRING, expose_id TEXT, \
+                                    chat_id TEXT, sent TIMESTAMP, PRIMARY KEY (crawler, expose_id, chat_id))')
+                connection.commit()
+            except lite.Error as error:
+                self.__log__.error("Error %s:", error.args[0])
+                raise error
+        return connection
+
+    @staticmethod
+    def key(expose, chat_id):
+        """The ledger key of an expose for a chat, or None if the expose can not be identified"""
+        if expose.get('id') is None:
+            return None
+        return expose.get('crawler', ''), str(expose['id']), str(chat_id)
+
+    def was_sent(self, expose, chat_id):
+        """Returns true if the expose was already sent to the chat"""
+        key = self.key(expose, chat_id)
+        if key is None:
+            return False
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return True
+        cur = self.get_connection().cursor()
+        cur.execute('SELECT 1 FROM sent WHERE crawler = ? AND expose_id = ? AND chat_id = ?', key)
+        if cur.fetchone() is None:
+            return False
+        self._remember(key)
+        return True
+
+    def mark_sent(self, expose, chat_id):
+        """Record that the expose was sent to the chat"""
+        key = self.key(expose, chat_id)
+        if key is None:
+            return
+        self.__log__.debug('mark_sent(%s, %s, %s)', *key)
+        self.get_connection().execute('INSERT OR IGNORE INTO sent VALUES (?, ?, ?, ?)',
+                                      key + (datetime.datetime.now(),))
+        self.get_connection().commit()
+        self._remember(key)
+
+    def _remember(self, key):
+        self.cache[key] = True
+        self.cache.move_to_end(key)
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
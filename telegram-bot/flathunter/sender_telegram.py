@@ -1,13 +1,13 @@
 """Functions and classes related to sending Telegram messages"""
 import json
 import logging
-import urllib.error
-import urllib.parse
-import urllib.request
 
 import requests
 
+from flathunter.digest import Digest, pack_messages
+from flathunter.message_template import MessageTemplate
 from flathunter.pubsub.nop_pubsub import NopPubsub
+from flathunter.send_ledger import SendLedger
 
 
 class SenderTelegram:
@@ -15,43 +15,80 @@ class SenderTelegram:
     __log__ = logging.getLogger('flathunt')
 
     exposes_channel = "exposes"
+    send_message_url = 'https://api.telegram.org/bot%s/sendMessage'
+    JSON_HEADERS = {'Content-Type': 'application/json'}
 
-    def __init__(self, config, pubsub=NopPubsub()):
+    def __init__(self, config, pubsub=NopPubsub(), ledger=None):
         self.config = config
         self.pubsub = pubsub
+        self.ledger = ledger if ledger is not None else SendLedger(":memory:")
         self.bot_token = self.config.get('telegram', dict()).get('bot_token', '')
         self.receiver_ids = self.config.get('telegram', dict()).get('receiver_ids', list())
+        self.digest = Digest.from_config(self.config)
+        self.template = MessageTemplate(self.config.get('message', ""))
+        self.url = self.send_message_url % self.bot_token
 
     def wait_and_process(self):
-        for new_message in self.pubsub.listen(self.exposes_channel):
-            expose = json.loads(new_message)
-            self.process_expose(expose)
+        exposes = (json.loads(new_message) for new_message in self.pubsub.listen(self.exposes_channel))
+        if self.digest is None:
+            for expose in exposes:
+                self.process_expose(expose)
+            return
+        for batch in self.digest.batches(exposes):
+            self.process_exposes(batch)
 
     def process_expose(self, expose):
-        """Send a message to a user describing the expose"""
-        message = self.config.get('message', "").format(
-            title=expose['title'],
-            rooms=expose['rooms'],
-            size=expose['size'],
-            price=expose['price'],
-            url=expose['url'],
-            address=expose['address'],
-            durations="" if 'durations' not in expose else expose['durations']).strip()
-        self.send_msg(message)
+        """Send a message describing the expose to each receiver that has not seen it yet"""
+        receivers = self.pending_receivers(expose)
+        if not receivers:
+            self.__log__.debug("Expose %s was already sent to all receivers", expose.get('id'))
+            return
+        for chat_id in self.deliver(self.format_expose(expose), receivers):
+            self.ledger.mark_sent(expose, chat_id)
+
+    def process_exposes(self, exposes):
+        """Send the exposes as a digest, packing as many as fit into each message. Receivers
+           that are missing the same exposes share the same messages"""
+        receivers_by_exposes = dict()
+        for chat_id in self.receiver_ids or list():
+            pending = tuple(idx for idx, expose in enumerate(exposes)
+                            if not self.ledger.was_sent(expose, chat_id))
+            if pending:
+                receivers_by_exposes.setdefault(pending, list()).append(chat_id)
+        for pending, receivers in receivers_by_exposes.items():
+            delivered = set(receivers)
+            for message in pack_messages([self.format_expose(exposes[idx]) for idx in pending]):
+                delivered &= set(self.deliver(message, receivers))
+            for chat_id in delivered:
+                for idx in pending:
+                    self.ledger.mark_sent(exposes[idx], chat_id)
+
+    def pending_receivers(self, expose):
+        """Returns the receivers that have not been sent the expose yet"""
+        return [chat_id for chat_id in self.receiver_ids or list()
+                if not self.ledger.was_sent(expose, chat_id)]
+
+    def format_expose(self, expose):
+        """Render the configured message template for the expose"""
+        return self.template.render(expose)
 
     def send_msg(self, message):
         """Send messages to each of the receivers in receiver_ids"""
         if self.receiver_ids is None:
             return
-        for chat_id in self.receiver_ids:
-            url = 'https://api.telegram.org/bot%s/sendMessage?chat_id=%i&text=%s'
-            text = urllib.parse.quote_plus(message.encode('utf-8'))
-            self.__log__.debug(('token:', self.bot_token))
+        self.deliver(message, self.receiver_ids)
+
+    def deliver(self, message, receiver_ids):
+        """Send the message to the given receivers. Returns the receivers it was delivered to"""
+        delivered = []
+        self.__log__.debug(('text', message))
+        # The text is the same for every receiver, so it is only encoded once
+        text_json = json.dumps(message)
+        for chat_id in receiver_ids:
             self.__log__.debug(('chatid:', chat_id))
-            self.__log__.debug(('text', text))
-            qry = url % (self.bot_token, chat_id, text)
-            self.__log__.debug("Retrieving URL %s", qry)
-            resp = requests.get(qry)
+            # Chat IDs are numbers, or names such as '@channelname' for channels
+            body = '{"chat_id": %s, "text": %s}' % (json.dumps(chat_id), text_json)
+            resp = requests.post(self.url, data=body.encode('utf-8'), headers=self.JSON_HEADERS)
             self.__log__.debug("Got response (%i): %s", resp.status_code, resp.content)
             data = resp.json()
 
@@ -60,3 +97,6 @@ class SenderTelegram:
                 status_code = resp.status_code
                 self.__log__.error("When sending bot message, we got status %i with message: %s",
                                    status_code, data)
+                continue
+            delivered.append(chat_id)
+        return delivered
@@ -0,0 +1,25 @@
+import unittest
+
+from flathunter.config import Config
+
+
+class ConfigTest(unittest.TestCase):
+    DUMMY_CONFIG = """
+redis:
+  host: localhost
+  port: 6379
+
+telegram:
+  bot_token: dummy_token
+"""
+
+    def test_resolves_settings_from_file(self):
+        config = Config(string=self.DUMMY_CONFIG, environ={})
+        self.assertEqual("localhost", config.redis_host())
+        self.assertEqual(6379, config.redis_port())
+
+    def test_command_line_overrides_environment(self):
+        config = Config(string=self.DUMMY_CONFIG, overrides={"redis_port": "6380"},
+                        environ={"FLATHUNTER_REDIS_HOST": "redis", "FLATHUNTER_REDIS_PORT": "6381"})
+        self.assertEqual("redis", config.settings.redis_host)
+        self.assertEqual(6380, config.settings.redis_port)
@@ -0,0 +1,41 @@
+import time
+import unittest
+
+from flathunter.digest import Digest, pack_messages
+
+
+def slow_source(items, delay):
+    for item in items:
+        yield item
+        time.sleep(delay)
+
+
+class DigestTest(unittest.TestCase):
+
+    def test_not_enabled_by_default(self):
+        self.assertIsNone(Digest.from_config({"telegram": {"bot_token": "dummy_token"}}))
+
+    def test_reads_config(self):
+        digest = Digest.from_config({"telegram": {"digest": {"window": 5, "max_exposes": 3}}})
+        self.assertEqual(5, digest.window)
+        self.assertEqual(3, digest.max_exposes)
+
+    def test_burst_is_batched_by_size(self):
+        digest = Digest(window=60, max_exposes=3)
+        batches = list(digest.batches(iter(range(7))))
+        self.assertEqual([0], batches[0], "Expected first expose to be sent immediately")
+        self.assertEqual([[1, 2, 3], [4, 5, 6]], batches[1:])
+
+    def test_batch_is_closed_after_window(self):
+        digest = Digest(window=0.05, max_exposes=100)
+        batches = list(digest.batches(slow_source(range(3), 0.2)))
+        self.assertEqual([[0], [1], [2]], batches)
+
+    def test_pack_messages_respects_limit(self):
+        messages = pack_messages(["a" * 40, "b" * 40, "c" * 40], limit=100, separator="\n")
+        self.assertEqual(["a" * 40 + "\n" + "b" * 40, "c" * 40], messages)
+
+    def test_pack_messages_truncates_long_texts(self):
+        messages = pack_messages(["a" * 150], limit=100)
+        self.assertEqual(1, len(messages))
+        self.assertEqual(100, len(messages[0]))
@@ -0,0 +1,51 @@
+import sqlite3
+import unittest
+
+from flathunter.send_ledger import SendLedger
+
+EXPOSE = {"id": 42, "crawler": "immowelt", "title": "Altbau"}
+
+
+class SendLedgerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.ledger = SendLedger(":memory:", cache_size=2)
+
+    def test_read_after_write(self):
+        self.assertFalse(self.ledger.was_sent(EXPOSE, 123))
+        self.ledger.mark_sent(EXPOSE, 123)
+        self.assertTrue(self.ledger.was_sent(EXPOSE, 123))
+        self.assertFalse(self.ledger.was_sent(EXPOSE, 456), "Expected receivers to be tracked separately")
+        self.assertFalse(self.ledger.was_sent(dict(EXPOSE, crawler="immobilienscout"), 123),
+                         "Expected crawlers to be tracked separately")
+
+    def test_mark_sent_twice(self):
+        self.ledger.mark_sent(EXPOSE, 123)
+        self.ledger.mark_sent(EXPOSE, 123)
+        self.assertTrue(self.ledger.was_sent(EXPOSE, 123))
+
+    def test_evicted_keys_are_read_from_database(self):
+        for expose_id in range(5):
+            self.ledger.mark_sent(dict(EXPOSE, id=expose_id), 123)
+        self.assertEqual(2, len(self.ledger.cache))
+        self.assertTrue(self.ledger.was_sent(dict(EXPOSE, id=0), 123))
+
+    def test_exposes_without_id_are_never_sent(self):
+        self.ledger.mark_sent({"title": "Altbau"}, 123)
+        self.assertFalse(self.ledger.was_sent({"title": "Altbau"}, 123))
+
+    def test_non_numeric_ids(self):
+        expose = dict(EXPOSE, id="a1b2c3")
+        self.ledger.mark_sent(expose, "@flats_berlin")
+        self.assertTrue(self.ledger.was_sent(expose, "@flats_berlin"))
+        self.assertFalse(self.ledger.was_sent(expose, 123))
+
+    def test_ledgers_with_integer_columns_still_match(self):
+        ledger = SendLedger(":memory:")
+        connection = sqlite3.connect(":memory:")
+        connection.execute('CREATE TABLE sent (crawler STRING, expose_id INTEGER, chat_id INTEGER, \
+                            sent TIMESTAMP, PRIMARY KEY (crawler, expose_id, chat_id))')
+        connection.execute("INSERT INTO sent VALUES ('immowelt', 42, 123, '2021-03-01')")
+        ledger.threadlocal.connection = connection
+        self.assertTrue(ledger.was_sent(EXPOSE, 123))
+        self.assertTrue(ledger.was_sent(EXPOSE, "123"))
@@ -11,10 +11,61 @@ class SenderTelegramTest(unittest.TestCase):
     def test_send_message(self, m):
         sender = SenderTelegram({"telegram": {"bot_token": "dummy_token", "receiver_ids": [123]}})
         mock_response = '{"ok":true,"result":{"message_id":456,"from":{"id":1,"is_bot":true,"first_name":"Wohnbot","username":"wohnung_search_bot"},"chat":{"id":5,"first_name":"Arthur","last_name":"Taylor","type":"private"},"date":1589813130,"text":"hello arthur"}}'
-        m.get('https://api.telegram.org/botdummy_token/sendMessage?chat_id=123&text=result', text=mock_response)
+        m.post('https://api.telegram.org/botdummy_token/sendMessage', text=mock_response)
         self.assertEqual(None, sender.send_msg("result"), "Expected message to be sent")
+        self.assertEqual({"chat_id": 123, "text": "result"}, m.last_request.json())
+        self.assertEqual("application/json", m.last_request.headers["Content-Type"])
+
+    @requests_mock.Mocker()
+    def test_send_message_to_all_receivers(self, m):
+        sender = SenderTelegram({"telegram": {"bot_token": "dummy_token", "receiver_ids": [123, 456]}})
+        m.post('https://api.telegram.org/botdummy_token/sendMessage', text='{"ok":true}')
+        sender.send_msg("Möbliert & \"ruhig\"")
+        self.assertEqual([123, 456], [request.json()["chat_id"] for request in m.request_history])
+        for request in m.request_history:
+            self.assertEqual("Möbliert & \"ruhig\"", request.json()["text"])
+
+    @requests_mock.Mocker()
+    def test_send_message_to_channel(self, m):
+        sender = SenderTelegram({"telegram": {"bot_token": "dummy_token", "receiver_ids": ["@flats_berlin"]}})
+        m.post('https://api.telegram.org/botdummy_token/sendMessage', text='{"ok":true}')
+        sender.send_msg("result")
+        self.assertEqual({"chat_id": "@flats_berlin", "text": "result"}, m.last_request.json())
+
+    @requests_mock.Mocker()
+    def test_expose_is_sent_once(self, m):
+        sender = SenderTelegram({"message": "{title}",
+                                 "telegram": {"bot_token": "dummy_token", "receiver_ids": [123, 456]}})
+        m.post('https://api.telegram.org/botdummy_token/sendMessage', text='{"ok":true}')
+        expose = {"id": 1, "crawler": "immowelt", "title": "Altbau"}
+        sender.process_expose(expose)
+        sender.process_expose(dict(expose))
+        sender.process_exposes([expose, {"id": 2, "crawler": "immowelt", "title": "Neubau"}])
+        self.assertEqual(4, m.call_count)
+        self.assertEqual(["Altbau", "Altbau", "Neubau", "Neubau"],
+                         [request.json()["text"] for request in m.request_history])
+
+    @requests_mock.Mocker()
+    def test_failed_sends_are_retried(self, m):
+        sender = SenderTelegram({"message": "{title}",
+                                 "telegram": {"bot_token": "dummy_token", "receiver_ids": [123]}})
+        m.post('https://api.telegram.org/botdummy_token/sendMessage', text='{"ok":false}', status_code=429)
+        expose = {"id": 1, "crawler": "immowelt", "title": "Altbau"}
+        sender.process_expose(expose)
+        sender.process_expose(expose)
+        self.assertEqual(2, m.call_count)
 
     @requests_mock.Mocker()
     def test_send_no_message_if_no_receivers(self, m):
         sender = SenderTelegram({"telegram": {"bot_token": "dummy_token", "receiver_ids": None}})
         self.assertEqual(None, sender.send_msg("result"), "Expected no message to be sent")
+
+    def test_format_expose(self):
+        sender = SenderTelegram({"message": "{title}\nPreis: {price}\n{durations}\n",
+                                 "telegram": {"bot_token": "dummy_token", "receiver_ids": [123]}})
+        message = sender.format_expose({"title": "Altbau", "price": "900 €"})
+        self.assertEqual("Altbau\nPreis: 900 €", message)
+
+    def test_unknown_placeholder_is_rejected(self):
+        with self.assertRaises(ValueError):
+            SenderTelegram({"message": "{title} {floor}", "telegram": {"bot_token": "dummy_token"}})